@@ -0,0 +1,76 @@
+"""
+Xử lý hàng loạt kho video dashcam (nhiều tiến trình, tiếp tục được sau khi bị ngắt)
+
+Ví dụ:
+    python batch.py data/dashcam
+    python batch.py data/dashcam data/extra.mp4 --output logs/batch/2025_q1 --workers 4
+    python batch.py data/dashcam --threads 1 --telemetry
+"""
+
+import argparse
+import json
+import sys
+import os
+
+# Thêm đường dẫn vào sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.batch_module import BatchProcessor
+from config.config import BATCH_OUTPUT_DIR, BATCH_TORCH_THREADS, YOLO_MODEL_PATH
+
+
+def parse_args(argv=None):
+    """Đọc tham số dòng lệnh"""
+    parser = argparse.ArgumentParser(
+        description="ITS - Xử lý hàng loạt video dashcam, ghi tóm tắt sự kiện từng file và báo cáo gộp"
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help="Các file video hoặc thư mục chứa video (duyệt cả thư mục con)")
+    parser.add_argument('--output', default=BATCH_OUTPUT_DIR,
+                        help="Thư mục ghi tóm tắt từng file và báo cáo gộp")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Số tiến trình tối đa (mặc định theo số lõi CPU và bộ nhớ còn trống)")
+    parser.add_argument('--threads', type=int, default=BATCH_TORCH_THREADS,
+                        help="Số luồng torch/OpenCV mỗi tiến trình")
+    parser.add_argument('--model', default=YOLO_MODEL_PATH,
+                        help="File mô hình YOLO")
+    parser.add_argument('--max-frames', type=int, default=None,
+                        help="Số khung hình tối đa mỗi video")
+    parser.add_argument('--telemetry', action='store_true',
+                        help="Ghi thêm file telemetry của từng video (dùng cho sweep.py)")
+    parser.add_argument('--no-resume', action='store_true',
+                        help="Xử lý lại mọi file, kể cả file đã có tóm tắt")
+    parser.add_argument('--report-only', action='store_true',
+                        help="Chỉ gộp lại báo cáo từ các tóm tắt đã có, không xử lý video")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Điểm vào dòng lệnh"""
+    args = parse_args(argv)
+    processor = BatchProcessor(
+        args.inputs,
+        output_dir=args.output,
+        workers=args.workers,
+        threads=args.threads,
+        model_path=args.model,
+        max_frames=args.max_frames,
+        telemetry=args.telemetry,
+        resume=not args.no_resume
+    )
+    if not processor.videos:
+        print("Không tìm thấy file video", file=sys.stderr)
+        return 1
+    
+    try:
+        report = processor.merge() if args.report_only else processor.run()
+    except KeyboardInterrupt:
+        return 130
+    
+    summary = {key: value for key, value in report.items() if key != 'per_file'}
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 1 if report['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
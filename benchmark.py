@@ -0,0 +1,174 @@
+"""
+Đo hiệu năng các công đoạn xử lý và so sánh với baseline
+
+Ví dụ:
+    python benchmark.py stages
+    python benchmark.py stages --objects 1,10,50 --speed 15 --output stages.json
+    python benchmark.py stages --save-baseline
+    python benchmark.py pipeline data/clips --max-frames 300 --tolerance 0.2
+"""
+
+import argparse
+import json
+import sys
+import os
+
+# Thêm đường dẫn vào sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.benchmark_module import (
+    StageBenchmark, STAGE_BENCHMARKS, compare_to_baseline, load_report, save_report
+)
+from config.config import (
+    BENCHMARK_DIR, BENCHMARK_ITERATIONS, BENCHMARK_WARMUP, BENCHMARK_TOLERANCE, YOLO_MODEL_PATH
+)
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(',') if x.strip()]
+
+
+def _size(text):
+    width, _, height = text.lower().partition('x')
+    return int(width), int(height)
+
+
+def _add_gate_args(parser, default_baseline):
+    """Tham số chung: file kết quả, baseline và ngưỡng hồi quy"""
+    parser.add_argument('--output', default=None,
+                        help="File JSON ghi kết quả")
+    parser.add_argument('--baseline', default=default_baseline,
+                        help="File baseline để so sánh")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="Ghi kết quả lần chạy này làm baseline")
+    parser.add_argument('--tolerance', type=float, default=BENCHMARK_TOLERANCE,
+                        help="Tỷ lệ chậm hơn baseline cho phép (0.15 = 15%%)")
+    parser.add_argument('--metric', default='p50', choices=['p50', 'p95', 'p99', 'mean'],
+                        help="Chỉ số dùng để so sánh với baseline")
+
+
+def parse_args(argv=None):
+    """Đọc tham số dòng lệnh"""
+    parser = argparse.ArgumentParser(
+        description="ITS - Đo hiệu năng các công đoạn xử lý"
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    stages = subparsers.add_parser('stages', help="Đo riêng từng công đoạn trên cảnh tổng hợp (không cần YOLO)")
+    stages.add_argument('--objects', type=_int_list, default=[1, 5, 20],
+                        help="Các số lượng vật thể mỗi khung hình, vd. 1,5,20")
+    stages.add_argument('--min-height', type=int, default=40,
+                        help="Chiều cao bounding box ban đầu nhỏ nhất (pixel)")
+    stages.add_argument('--max-height', type=int, default=200,
+                        help="Chiều cao bounding box ban đầu lớn nhất (pixel)")
+    stages.add_argument('--speed', type=float, default=5.0,
+                        help="Vận tốc tiến lại gần trung bình (m/s)")
+    stages.add_argument('--resolution', type=_size, default=(1280, 720),
+                        help="Kích thước khung hình, vd. 1280x720")
+    stages.add_argument('--display-size', type=_size, default=(960, 540),
+                        help="Kích thước vùng hiển thị của giao diện, vd. 960x540")
+    stages.add_argument('--stages', default=None,
+                        help=f"Các công đoạn cần đo, cách nhau bởi dấu phẩy ({', '.join(STAGE_BENCHMARKS)})")
+    stages.add_argument('--iterations', type=int, default=BENCHMARK_ITERATIONS,
+                        help="Số lần gọi đo mỗi công đoạn")
+    stages.add_argument('--warmup', type=int, default=BENCHMARK_WARMUP,
+                        help="Số lần gọi chạy trước khi đo")
+    stages.add_argument('--seed', type=int, default=0,
+                        help="Hạt giống sinh cảnh tổng hợp")
+    _add_gate_args(stages, os.path.join(BENCHMARK_DIR, 'baseline_stages.json'))
+    
+    pipeline = subparsers.add_parser('pipeline', help="Đo toàn bộ chuỗi xử lý (YOLO thật) trên các file video")
+    pipeline.add_argument('videos', nargs='+',
+                          help="Các file video hoặc thư mục chứa video (duyệt cả thư mục con)")
+    pipeline.add_argument('--max-frames', type=int, default=None,
+                          help="Số khung hình tối đa mỗi video")
+    pipeline.add_argument('--warmup', type=int, default=10,
+                          help="Số khung hình đầu mỗi video không tính vào thống kê")
+    pipeline.add_argument('--no-render', action='store_true',
+                          help="Không vẽ cảnh báo lên khung hình")
+    pipeline.add_argument('--model', default=YOLO_MODEL_PATH,
+                          help="File mô hình YOLO cục bộ")
+    _add_gate_args(pipeline, os.path.join(BENCHMARK_DIR, 'baseline_pipeline.json'))
+    return parser.parse_args(argv)
+
+
+def finish(report, args):
+    """
+    Ghi kết quả, so sánh hoặc lưu baseline và in tóm tắt
+    
+    Returns:
+        int: Mã thoát (1 nếu có hồi quy)
+    """
+    if args.output:
+        save_report(report, args.output)
+    
+    if args.save_baseline:
+        save_report(report, args.baseline)
+        print(f"Đã lưu baseline: {args.baseline}", file=sys.stderr)
+    elif args.baseline and os.path.exists(args.baseline):
+        baseline = load_report(args.baseline)
+        comparisons, regressions = compare_to_baseline(
+            report['results'], baseline.get('results', {}), tolerance=args.tolerance, metric=args.metric)
+        report['comparison'] = {
+            'baseline': args.baseline,
+            'tolerance': args.tolerance,
+            'cases': comparisons,
+            'regressions': [entry['case'] for entry in regressions]
+        }
+        if args.output:
+            save_report(report, args.output)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        for entry in regressions:
+            print(f"Hồi quy: {entry['case']} {entry['metric']} {entry['baseline_ms']:.4f}ms → "
+                  f"{entry['current_ms']:.4f}ms (×{entry['ratio']:.2f})", file=sys.stderr)
+        return 1 if regressions else 0
+    
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+def main(argv=None):
+    """Điểm vào dòng lệnh"""
+    args = parse_args(argv)
+    if args.command == 'stages':
+        stages = [s.strip() for s in args.stages.split(',')] if args.stages else None
+        unknown = [s for s in stages or [] if s not in STAGE_BENCHMARKS]
+        if unknown:
+            print(f"Công đoạn không hỗ trợ: {', '.join(unknown)}", file=sys.stderr)
+            return 1
+        benchmark = StageBenchmark(
+            object_counts=args.objects,
+            iterations=args.iterations,
+            warmup=args.warmup,
+            stages=stages,
+            display_size=args.display_size,
+            width=args.resolution[0],
+            height=args.resolution[1],
+            min_height=args.min_height,
+            max_height=args.max_height,
+            approach_speed=args.speed,
+            seed=args.seed
+        )
+        benchmark.run()
+        return finish(benchmark.report(), args)
+    
+    if args.command == 'pipeline':
+        # Chạy hoàn toàn offline: không để ultralytics kiểm tra/tải gì qua mạng
+        os.environ.setdefault('YOLO_OFFLINE', '1')
+        from modules.pipeline_benchmark_module import PipelineBenchmark
+        
+        benchmark = PipelineBenchmark(args.videos, max_frames=args.max_frames, warmup=args.warmup,
+                                      render=not args.no_render, model_path=args.model)
+        if not benchmark.videos:
+            print("Không tìm thấy file video", file=sys.stderr)
+            return 1
+        report = benchmark.run()
+        if report is None:
+            print("Không thể khởi tạo mô hình YOLO", file=sys.stderr)
+            return 1
+        return finish(report, args)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
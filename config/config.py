@@ -7,11 +7,15 @@ CAMERA_INDEX = 0
 CAMERA_WIDTH = 1280
 CAMERA_HEIGHT = 720
 FPS_TARGET = 30
+CAMERA_STOP_TIMEOUT_S = 2.0  # Thời gian chờ luồng thu nhận dừng (camera USB/RTSP có thể treo khi đọc)
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')  # Định dạng file video khi truyền thư mục
 
 # Cấu hình YOLO
 YOLO_MODEL_PATH = 'yolov8n.pt'
 YOLO_CONFIDENCE_THRESHOLD = 0.5
 DETECTION_CLASSES = ['person', 'car', 'truck', 'bus', 'motorcycle', 'bicycle']
+YOLO_INPUT_SIZE = 640  # Kích thước ảnh đầu vào của mô hình (pixel)
+YOLO_DEVICE = None  # Thiết bị chạy mô hình ('cpu', 'cuda:0', ...), None để ultralytics tự chọn
 
 # Cấu hình khoảng cách
 FOCAL_LENGTH = 900  # Tiêu cự camera
@@ -38,6 +42,16 @@ TTC_DANGER = 2.0  # TTC nguy hiểm (≤ 2 giây)
 TTC_WARNING = 4.0  # TTC cảnh báo (2-4 giây)
 TTC_CAUTION = 6.0  # TTC thận trọng (4-6 giây)
 
+# TTC nâng cao: khớp khoảng cách, vận tốc và gia tốc tương đối của từng vật thể (gia tốc không đổi)
+ENABLE_ENHANCED_TTC = True  # Dùng TTC gia tốc không đổi thay cho khoảng cách / vận tốc khi đủ dữ liệu
+ETTC_WINDOW_S = 1.0  # Cửa sổ thời gian khớp đa thức bậc 2 của khoảng cách (giây)
+ETTC_MIN_SAMPLES = 6  # Số mẫu tối thiểu trong cửa sổ để khớp
+ETTC_MIN_SPAN_S = 0.3  # Khoảng thời gian tối thiểu các mẫu phải trải ra (giây)
+ETTC_MAX_ACCEL = 8.0  # Giới hạn độ lớn gia tốc tương đối ước lượng (m/s²), chặn nhiễu khoảng cách
+ETTC_HORIZON_S = 10.0  # TTC dự đoán lớn hơn ngưỡng này coi như không va chạm (giây)
+ETTC_MATCH_IOU = 0.3  # IoU tối thiểu để nối vật thể với quỹ đạo của khung hình trước
+ETTC_MAX_TRACKS = 64  # Số quỹ đạo theo dõi đồng thời tối đa
+
 # Cấu hình khoảng cách dừng
 REACTION_TIME = 1.2  # Thời gian phản ứng của tài xế (giây)
 DECELERATION = 6.0  # Gia tốc hãm (m/s²), ~0.6g
@@ -68,16 +82,123 @@ COLOR_DANGER = (0, 0, 255)     # Đỏ - Nguy hiểm
 # Cấu hình âm thanh
 ALERT_SOUND_PATH = 'canhbao.mp3'
 ALERT_VOLUME = 0.7
+AUDIO_SAMPLE_RATE = 44100  # Tần số lấy mẫu của mixer (Hz)
+AUDIO_BUFFER_SIZE = 256  # Kích thước bộ đệm mixer (mẫu), nhỏ để giảm độ trễ (~6ms)
+# Tiếng bíp theo mức cảnh báo: (tần số Hz, độ dài tiếng bíp giây, chu kỳ lặp giây)
+ALERT_TONES = {
+    'caution': (660, 0.12, 0.60),
+    'warning': (880, 0.10, 0.30),
+    'danger': (1200, 0.08, 0.15)
+}
+ALERT_VOICE_ENABLED = True  # Phát file ALERT_SOUND_PATH một lần khi bắt đầu cảnh báo
 
 # Cấu hình logging
 LOG_DIR = 'logs'
 LOG_FILE = 'collision_warnings.log'
 LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
 LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+LOG_BATCH_SIZE = 64  # Số bản ghi tối đa luồng ghi nhật ký xử lý mỗi lô
+LOG_FLUSH_INTERVAL_S = 1.0  # Chu kỳ đẩy bộ đệm nhật ký xuống đĩa (giây)
+LOG_QUEUE_MAX_SIZE = 10000  # Số bản ghi chờ tối đa; vượt quá thì bỏ bớt (đĩa bị treo)
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Xoay vòng file nhật ký khi vượt dung lượng này (byte)
+LOG_MAX_AGE_S = 24 * 3600  # Xoay vòng file nhật ký sau khoảng thời gian này (giây)
+LOG_COMPRESS_ROTATED = True  # Nén gzip các file nhật ký đã xoay vòng (trên luồng nền)
+LOG_RETENTION_BYTES = 200 * 1024 * 1024  # Tổng dung lượng tối đa của các file nhật ký cũ (byte)
+LOG_MEMORY_MAX_ENTRIES = 1000  # Số cảnh báo gần nhất giữ trong bộ nhớ (vùng đệm vòng)
+ENABLE_EVENT_STORE = True  # Lưu tất cả cảnh báo vào kho sự kiện SQLite trong LOG_DIR
+EVENT_DB_FILE = 'events.db'  # File kho sự kiện
+EPISODE_GAP_S = 0.5  # Sự kiện cảnh báo của một vật thể kết thúc khi không còn nguy hiểm quá số giây này
 
 # Cấu hình hiệu năng
 MAX_PROCESSING_TIME_MS = 100  # Thời gian xử lý tối đa (ms)
-ENABLE_MULTITHREADING = True
+LATENCY_WINDOW_SIZE = 300  # Số khung hình gần nhất dùng để tính p50/p95/p99
+ENABLE_LATENCY_MONITOR = True  # Đo độ trễ từng công đoạn
+ENABLE_MULTITHREADING = True  # Chạy pipeline xử lý trên luồng nền, tách khỏi luồng giao diện
+
+# Giảm chất lượng khi vượt ngân sách thời gian (MAX_PROCESSING_TIME_MS)
+ENABLE_DEGRADATION = True  # Bật/tắt tự động giảm chất lượng
+DEGRADATION_OVER_BUDGET_FRAMES = 5  # Số khung hình liên tục vượt ngân sách trước khi giảm một mức
+DEGRADATION_RECOVER_FRAMES = 60  # Số khung hình liên tục dư thời gian trước khi tăng một mức
+DEGRADATION_RECOVER_RATIO = 0.6  # Coi là dư thời gian khi thời gian xử lý < tỷ lệ này × ngân sách
+DEGRADED_DISPLAY_INTERVAL = 2  # Mức giảm hiển thị: chỉ vẽ 1 trên N khung hình
+DEGRADED_INPUT_SIZE = 416  # Mức giảm kích thước ảnh đầu vào YOLO
+DEGRADED_DETECT_INTERVAL = 2  # Mức bỏ khung hình: chỉ phát hiện 1 trên N khung hình
+
+# Phân bổ luồng và lõi CPU cho thu nhận khung hình, suy luận YOLO và giao diện
+TORCH_INTRA_OP_THREADS = 'auto'  # Số luồng torch trong một phép tính: số nguyên, 'auto' để đo lúc khởi động và chọn (lưu theo máy), None để giữ mặc định của torch
+TORCH_INTER_OP_THREADS = 1  # Số luồng torch chạy song song các phép tính độc lập (YOLO suy luận tuần tự), None để giữ mặc định
+OPENCV_THREADS = None  # Số luồng OpenCV (đổi kích thước, chuyển màu), None để giữ mặc định
+CPU_AFFINITY = None  # Lõi CPU của từng vai trò, vd. {'capture': '0', 'inference': '1-3', 'render': '0'}; 'auto' để chia tự động, None để không gán (chỉ Linux)
+THREAD_TUNE_CACHE = 'logs/thread_tuning.json'  # File lưu số luồng đã đo của từng máy (theo tên máy, số lõi, mô hình)
+THREAD_TUNE_ITERATIONS = 8  # Số lần suy luận đo cho mỗi số luồng
+THREAD_TUNE_WARMUP = 2  # Số lần suy luận chạy trước khi đo
+THREAD_TUNE_TOLERANCE = 0.05  # Chọn số luồng ít nhất chậm hơn lựa chọn nhanh nhất không quá tỷ lệ này (chừa lõi cho luồng khác)
+
+# Cảm biến vận tốc xe (câu NMEA hoặc phản hồi OBD-II qua cổng serial, UDP hoặc file phát lại)
+SPEED_SOURCE = None  # Nguồn khi chạy giao diện: 'serial:/dev/ttyUSB0@4800', 'obd:/dev/ttyUSB0@38400', 'udp:10110', 'file:logs/drive.nmea' hoặc None để tắt
+SPEED_SERIAL_BAUDRATE = 4800  # Tốc độ baud mặc định của cổng serial (NMEA 0183)
+SPEED_OBD_POLL_HZ = 10.0  # Số lần hỏi vận tốc (PID 0D) mỗi giây với bộ chuyển đổi OBD kiểu ELM327
+SPEED_BUFFER_SIZE = 512  # Số mẫu giữ trong vùng đệm vòng
+SPEED_MAX_AGE_S = 1.0  # Mẫu cách khung hình quá thời gian này coi như mất tín hiệu (giây)
+SPEED_LATENCY_S = 0.0  # Độ trễ truyền của cảm biến, trừ vào thời điểm nhận mẫu (giây)
+SPEED_REPLAY_RATE_HZ = 10.0  # Tốc độ phát lại file không có cột thời gian (mẫu/giây)
+SPEED_STOPPED_MS = 0.5  # Vận tốc xe dưới ngưỡng này coi là xe đang dừng (m/s)
+
+# Ghi telemetry từng khung hình (file nhị phân, dùng để tái dựng sự cố và phát lại)
+ENABLE_TELEMETRY = False  # Bật ghi telemetry khi chạy giao diện
+TELEMETRY_DIR = 'logs/telemetry'  # Thư mục lưu file telemetry (mỗi phiên chạy một file)
+TELEMETRY_CHUNK_FRAMES = 256  # Số khung hình mỗi chunk nén
+TELEMETRY_COMPRESS_LEVEL = 6  # Mức nén zlib (1-9)
+
+# Ghi clip sự cố: vùng đệm vòng JPEG các giây gần nhất, ghi ra file khi bắt đầu cảnh báo
+ENABLE_INCIDENT_CLIPS = False  # Bật ghi clip sự cố khi chạy giao diện
+INCIDENT_DIR = 'logs/incidents'  # Thư mục lưu clip sự cố
+INCIDENT_PRE_S = 10.0  # Số giây trước lúc bắt đầu cảnh báo được giữ trong vùng đệm
+INCIDENT_POST_S = 5.0  # Số giây ghi tiếp sau lần bắt đầu cảnh báo gần nhất
+INCIDENT_MAX_CLIP_S = 60.0  # Độ dài tối đa một clip (cảnh báo liên tục quá lâu thì tách clip)
+INCIDENT_FRAME_WIDTH = 640  # Chiều rộng khung hình lưu trong vùng đệm (pixel, giữ tỷ lệ)
+INCIDENT_JPEG_QUALITY = 70  # Chất lượng nén JPEG (0-100)
+INCIDENT_BUFFER_MAX_BYTES = 64 * 1024 * 1024  # Dung lượng tối đa của vùng đệm và của mỗi clip đang gom (byte)
+INCIDENT_QUEUE_SIZE = 8  # Số khung hình chờ nén tối đa; đầy thì bỏ khung hình (không chặn pipeline)
+INCIDENT_MAX_PENDING_CLIPS = 2  # Số clip chờ ghi ra đĩa tối đa; vượt quá thì bỏ clip
+
+# Ghi video đã vẽ (vật thể, khoảng cách/TTC, bảng trạng thái) trên luồng nền
+ENABLE_VIDEO_RECORDING = False  # Bật ghi video khi chạy giao diện
+VIDEO_RECORD_DIR = 'logs/recordings'  # Thư mục lưu video ghi (mỗi phiên chạy một nhóm file)
+VIDEO_RECORD_FPS = 30.0  # Tốc độ khung hình của file ghi (khung hình được lặp/bỏ theo thời gian để giữ đúng tốc độ)
+VIDEO_RECORD_SIZE = None  # Kích thước file ghi (rộng, cao), None để giữ kích thước khung hình
+VIDEO_RECORD_SEGMENT_S = 300.0  # Độ dài mỗi file (giây), hết thì ghi sang file mới; 0 để ghi một file
+VIDEO_RECORD_FOURCC = 'mp4v'  # Codec của file ghi
+VIDEO_RECORD_QUEUE_SIZE = 16  # Số khung hình chờ ghi tối đa
+VIDEO_RECORD_POLICY = 'drop'  # Khi hàng đợi đầy: 'drop' bỏ khung hình (không chặn pipeline), 'block' chờ luồng ghi
+VIDEO_RECORD_MAX_GAP_S = 2.0  # Khoảng trống tối đa được lấp bằng cách lặp khung hình trước (giây)
+
+# Quét tham số cảnh báo trên telemetry đã ghi (sweep.py)
+SWEEP_EVENT_TOLERANCE_S = 1.0  # Cảnh báo bắt đầu trong khoảng này quanh sự kiện đã gán nhãn không bị tính là báo sai
+SWEEP_BLOCK_ELEMENTS = 4000000  # Số phần tử tối đa của mỗi mảng (tổ hợp × vật thể) khi tính theo khối
+
+# Đo hiệu năng (benchmark.py)
+BENCHMARK_DIR = 'benchmarks'  # Thư mục lưu kết quả và baseline
+BENCHMARK_ITERATIONS = 500  # Số lần gọi đo cho mỗi công đoạn
+BENCHMARK_WARMUP = 50  # Số lần gọi chạy trước khi đo
+BENCHMARK_TOLERANCE = 0.15  # Chậm hơn baseline quá tỷ lệ này (theo p50) là hồi quy
+BENCHMARK_MIN_DELTA_MS = 0.005  # Bỏ qua chênh lệch nhỏ hơn mức này (nhiễu đo)
+
+# Xử lý hàng loạt kho video (batch.py)
+BATCH_OUTPUT_DIR = 'logs/batch'  # Thư mục ghi tóm tắt từng file và báo cáo gộp
+BATCH_TORCH_THREADS = 2  # Số luồng torch của mỗi tiến trình xử lý
+BATCH_WORKER_MEMORY_MB = 1500  # Bộ nhớ ước tính của mỗi tiến trình (mô hình + pipeline), dùng để giới hạn số tiến trình
+BATCH_MAX_WORKER_CRASHES = 2  # File đang chạy trong số lần tiến trình bị dừng đột ngột (vd. hết bộ nhớ) này thì ghi lỗi, không chạy lại
+
+# Chia một file video dài thành các đoạn xử lý song song (headless.py --workers)
+CHUNK_OVERLAP_S = 5.0  # Thời gian chồng lấn trước mỗi đoạn để TTC/chuyển động/bộ đếm liên tục ổn định (giây)
+CHUNK_MIN_SEGMENT_S = 60.0  # Độ dài tối thiểu của mỗi đoạn (giây), tránh tốn thời gian chồng lấn cho file ngắn
+CHUNK_INDEX_SUFFIX = '.idx.json'  # Chỉ mục keyframe được lưu cạnh file video với đuôi này
+
+# Đánh giá cấu hình bộ phát hiện (evaluate.py)
+EVAL_DATASET_DIR = 'data'  # Bộ dữ liệu có nhãn (ảnh + nhãn định dạng YOLO)
+EVAL_IOU_THRESHOLD = 0.5  # IoU tối thiểu để phát hiện khớp với nhãn
+EVAL_WARMUP_IMAGES = 3  # Số ảnh đầu không tính vào thời gian xử lý
 
 # Cấu hình giao diện
 GUI_TITLE = "ITS - Hệ thống cảnh báo và ngăn ngừa va chạm"
@@ -86,4 +207,7 @@ GUI_HEIGHT = 720
 DISPLAY_FPS = True
 DISPLAY_DISTANCE = True
 DISPLAY_WARNING_LEVEL = True
+GUI_POLL_INTERVAL_MS = 15  # Chu kỳ giao diện lấy kết quả mới nhất từ pipeline (ms)
+PANEL_UPDATE_INTERVAL_MS = 250  # Chu kỳ cập nhật bảng vật thể và nhật ký (~4 Hz)
+LOG_PANEL_MAX_LINES = 20  # Số dòng nhật ký tối đa hiển thị
 
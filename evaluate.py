@@ -0,0 +1,103 @@
+"""
+Đánh giá cấu hình bộ phát hiện trên bộ dữ liệu có nhãn (tốc độ/bộ nhớ so với precision/recall)
+
+Ví dụ:
+    python evaluate.py --models yolov8n.pt yolov8s.pt --sizes 480,640 --conf 0.3,0.4,0.5
+    python evaluate.py --dataset data/dashcam --models yolov8n.pt yolov8n.onnx --output eval.csv
+    python evaluate.py --models yolov8n.pt yolov8s.pt --sizes 320,480,640 --budget-ms 50 --budget-mb 1500
+"""
+
+import argparse
+import json
+import sys
+import os
+
+# Thêm đường dẫn vào sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.detector_eval_module import DetectorEvaluator
+from config.config import EVAL_DATASET_DIR, EVAL_IOU_THRESHOLD, YOLO_MODEL_PATH, YOLO_INPUT_SIZE
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(',') if x.strip()]
+
+
+def _float_list(text):
+    return [float(x) for x in text.split(',') if x.strip()]
+
+
+def parse_args(argv=None):
+    """Đọc tham số dòng lệnh"""
+    parser = argparse.ArgumentParser(
+        description="ITS - Đánh giá cấu hình bộ phát hiện (bảng Pareto tốc độ/độ chính xác)"
+    )
+    parser.add_argument('--dataset', default=EVAL_DATASET_DIR,
+                        help="Thư mục bộ dữ liệu (images/ + labels/ định dạng YOLO)")
+    parser.add_argument('--models', nargs='+', default=[YOLO_MODEL_PATH],
+                        help="Các file mô hình (.pt, .onnx, .torchscript, thư mục openvino, ...)")
+    parser.add_argument('--sizes', type=_int_list, default=[YOLO_INPUT_SIZE],
+                        help="Các kích thước ảnh đầu vào, vd. 320,480,640")
+    parser.add_argument('--conf', type=_float_list, default=[0.25, 0.35, 0.5, 0.65],
+                        help="Các ngưỡng tin cậy, vd. 0.3,0.5")
+    parser.add_argument('--devices', nargs='+', default=['cpu'],
+                        help="Các thiết bị chạy mô hình (cpu, cuda:0, ...)")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="Số luồng torch (mô phỏng nền tảng ít lõi)")
+    parser.add_argument('--max-images', type=int, default=None,
+                        help="Số ảnh tối đa")
+    parser.add_argument('--iou', type=float, default=EVAL_IOU_THRESHOLD,
+                        help="IoU tối thiểu để tính là phát hiện đúng")
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help="Ngân sách thời gian phát hiện của nền tảng (ms/khung hình)")
+    parser.add_argument('--budget-mb', type=float, default=None,
+                        help="Ngân sách bộ nhớ của nền tảng (MB)")
+    parser.add_argument('--all', action='store_true',
+                        help="In mọi cấu hình thay vì chỉ mặt Pareto")
+    parser.add_argument('--output', default=None,
+                        help="File kết quả (.csv hoặc .json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Điểm vào dòng lệnh"""
+    args = parse_args(argv)
+    evaluator = DetectorEvaluator(
+        dataset_dir=args.dataset,
+        models=args.models,
+        input_sizes=args.sizes,
+        confidences=args.conf,
+        devices=args.devices,
+        threads=args.threads,
+        max_images=args.max_images,
+        iou_threshold=args.iou
+    )
+    if not evaluator.images:
+        print(f"Không có ảnh trong bộ dữ liệu: {args.dataset}", file=sys.stderr)
+        return 1
+    
+    rows = evaluator.run()
+    if not rows:
+        print("Không đánh giá được cấu hình nào", file=sys.stderr)
+        return 1
+    
+    if args.output:
+        if args.output.lower().endswith('.csv'):
+            evaluator.export_csv(args.output)
+        else:
+            evaluator.export_json(args.output)
+    
+    print(evaluator.format_table(pareto_only=not args.all))
+    if args.budget_ms is not None or args.budget_mb is not None:
+        best = evaluator.best_for_budget(args.budget_ms, args.budget_mb)
+        print()
+        if best is None:
+            print("Không có cấu hình nào thỏa ngân sách")
+        else:
+            print("Cấu hình tốt nhất trong ngân sách:")
+            print(json.dumps(best, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,7 +5,6 @@ Giao diện người dùng chính của ứng dụng ITS
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from PIL import Image, ImageTk
-import cv2
 import threading
 import time
 from datetime import datetime
@@ -26,9 +25,19 @@ from modules.logger_module import LoggerModule
 from modules.motion_detection_module import MotionDetectionModule
 from modules.ttc_module import TTCModule
 from modules.lane_filter_module import LaneFilterModule
+from modules.pipeline_module import PipelineModule
+from modules.render_module import RenderModule
+from modules.latency_module import StageTimer
+from modules.telemetry_module import TelemetryRecorder
+from modules.incident_module import IncidentRecorder
+from modules.recorder_module import VideoRecorder
+from modules.speed_sensor_module import SpeedSensor
+from modules.resource_module import ResourceManager
 from config.config import (GUI_TITLE, GUI_WIDTH, GUI_HEIGHT, ENABLE_MOTION_DETECTION, 
-                          ENABLE_TTC, MIN_VELOCITY_FOR_ALERT, MAX_TTC_FOR_ALERT,
-                          CONSECUTIVE_RISK_THRESHOLD, CONSECUTIVE_SAFE_THRESHOLD)
+                          ENABLE_TTC, ENABLE_MULTITHREADING, GUI_POLL_INTERVAL_MS,
+                          PANEL_UPDATE_INTERVAL_MS, LOG_PANEL_MAX_LINES,
+                          ENABLE_TELEMETRY, TELEMETRY_DIR, ENABLE_INCIDENT_CLIPS, INCIDENT_DIR,
+                          ENABLE_VIDEO_RECORDING, VIDEO_RECORD_DIR, SPEED_SOURCE)
 
 
 class MainWindow:
@@ -50,21 +59,32 @@ class MainWindow:
         self.motion_detection = MotionDetectionModule() if ENABLE_MOTION_DETECTION else None
         self.ttc_module = TTCModule() if ENABLE_TTC else None
         self.lane_filter = LaneFilterModule()
+        self.telemetry = TelemetryRecorder() if ENABLE_TELEMETRY else None
+        self.incidents = IncidentRecorder() if ENABLE_INCIDENT_CLIPS else None
+        self.recorder = VideoRecorder() if ENABLE_VIDEO_RECORDING else None
+        self.speed_sensor = SpeedSensor(SPEED_SOURCE) if SPEED_SOURCE else None
+        self.resources = ResourceManager()
+        self.pipeline = PipelineModule(
+            self.detection, self.distance, self.lane_filter, self.logger, alert=self.alert,
+            ttc_module=self.ttc_module, motion_detection=self.motion_detection,
+            telemetry=self.telemetry, incidents=self.incidents, recorder=self.recorder,
+            speed_sensor=self.speed_sensor
+        )
+        self.alert.latency = self.pipeline.latency  # Đo độ trễ từ kích hoạt đến phát âm thanh
         
         # Trạng thái
         self.is_running = False
         self.current_frame = None
         self.processed_detections = []
         self.fps = 0
-        self.frame_count = 0
-        self.start_time = time.time()
         self.video_path = None
         self.use_camera = True
         self.alert_disabled = False  # Tắt cảnh báo tạm thời
-        self.alert_disabled_until = 0  # Thời gian tắt cảnh báo đến khi nào
         self._label_size = None  # Kích thước label để tránh resize liên tục
-        self.consecutive_risk_count = 0  # Đếm số lần liên tục phát hiện nguy hiểm
-        self.consecutive_safe_count = 0  # Đếm số lần liên tục an toàn
+        self._last_frame_seq = 0  # Khung hình đã hiển thị gần nhất
+        self._tree_rows = {}  # Các dòng đang hiển thị trong danh sách vật thể (track id → giá trị)
+        self._last_log_seq = 0  # Số thứ tự nhật ký cuối cùng đã hiển thị
+        self._last_panel_update = 0  # Thời điểm cập nhật bảng thống kê gần nhất
         
         # Giao diện
         self.setup_ui()
@@ -153,6 +173,9 @@ class MainWindow:
         self.alert_label = ttk.Label(stats_frame, text="Cảnh báo: 0")
         self.alert_label.pack(anchor=tk.W, padx=5, pady=2)
         
+        self.latency_label = ttk.Label(stats_frame, text="Độ trễ p95: N/A")
+        self.latency_label.pack(anchor=tk.W, padx=5, pady=2)
+        
         # Detection list
         detection_frame = ttk.LabelFrame(right_panel, text="Vật thể phát hiện")
         detection_frame.pack(fill=tk.BOTH, expand=True, pady=5)
@@ -224,6 +247,15 @@ class MainWindow:
                 messagebox.showerror("Lỗi", "Không thể khởi tạo mô hình YOLO")
                 return False
             
+            # Số luồng torch/OpenCV (đo lần đầu trên máy này) và lõi CPU của luồng giao diện
+            # (không chạy pipeline trên luồng nền thì luồng giao diện cũng chạy suy luận)
+            applied = self.resources.apply(self.detection)
+            self.resources.pin('render' if ENABLE_MULTITHREADING else 'inference')
+            self.logger.log_info(
+                f"Luồng suy luận: {applied['intra_op_threads'] or 'mặc định'}, "
+                f"lõi CPU: {self.resources.affinity or 'không gán'}"
+            )
+            
             # Khởi tạo alert
             if not self.alert.initialize():
                 messagebox.showwarning("Cảnh báo", "Không thể khởi tạo hệ thống âm thanh")
@@ -281,10 +313,11 @@ class MainWindow:
                     return
                 # Khởi tạo camera với video file
                 loop_video = self.loop_video_var.get()
-                self.camera = CameraModule(video_path=self.video_path, loop_video=loop_video)
+                self.camera = CameraModule(video_path=self.video_path, loop_video=loop_video,
+                                           cpu_cores=self.resources.cores('capture'))
             else:
                 # Khởi tạo camera
-                self.camera = CameraModule()
+                self.camera = CameraModule(cpu_cores=self.resources.cores('capture'))
             
             # Khởi động camera/video
             if not self.camera.start():
@@ -297,9 +330,37 @@ class MainWindow:
             self.stop_btn.config(state=tk.NORMAL)
             self.status_label.config(text="Trạng thái: Đang chạy")
             
-            # Bắt đầu vòng lặp xử lý
-            self.start_time = time.time()
-            self.frame_count = 0
+            # Mỗi phiên chạy ghi telemetry vào một file riêng
+            if self.telemetry is not None:
+                os.makedirs(TELEMETRY_DIR, exist_ok=True)
+                telemetry_path = os.path.join(
+                    TELEMETRY_DIR, f"telemetry_{datetime.now().strftime('%Y%m%d_%H%M%S')}.tlm"
+                )
+                self.telemetry.open(telemetry_path, metadata={
+                    'source': 'camera' if self.use_camera else self.video_path
+                })
+            
+            # Clip sự cố của mỗi phiên chạy trong một thư mục riêng
+            if self.incidents is not None:
+                self.incidents.open(
+                    os.path.join(INCIDENT_DIR, datetime.now().strftime('%Y%m%d_%H%M%S')),
+                    metadata={'source': 'camera' if self.use_camera else self.video_path}
+                )
+            
+            # Video đã vẽ của mỗi phiên chạy (chia thành nhiều file theo VIDEO_RECORD_SEGMENT_S)
+            if self.recorder is not None:
+                self.recorder.open(os.path.join(
+                    VIDEO_RECORD_DIR, f"recording_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+                ))
+            
+            # Cảm biến vận tốc xe (không có thì TTC chạy như cũ, không tính khoảng cách dừng)
+            if self.speed_sensor is not None and not self.speed_sensor.start():
+                self.logger.log_error(f"Không mở được cảm biến vận tốc: {SPEED_SOURCE}")
+            
+            # Bắt đầu pipeline xử lý (luồng nền nếu bật đa luồng) và vòng lặp hiển thị
+            self._last_frame_seq = 0
+            self.pipeline.start(self.camera, threaded=ENABLE_MULTITHREADING,
+                                cpu_cores=self.resources.cores('inference'))
             self.process_loop()
             
             self.logger.log_info("Hệ thống đã được khởi động")
@@ -312,33 +373,40 @@ class MainWindow:
         if self.alert_disabled:
             # Bật lại cảnh báo
             self.alert_disabled = False
-            self.alert_disabled_until = 0
+            self.pipeline.unmute()
             self.mute_alert_btn.config(text="Tắt cảnh báo (30s)")
             self.logger.log_info("Đã bật lại cảnh báo")
         else:
             # Tắt cảnh báo 30 giây
             self.alert_disabled = True
-            self.alert_disabled_until = time.time() + 30
-            self.alert.stop_alert()
+            self.pipeline.mute(30)
             self.mute_alert_btn.config(text="Bật cảnh báo")
             self.logger.log_info("Đã tắt cảnh báo tạm thời (30 giây)")
     
     def stop_system(self):
         """Dừng hệ thống"""
         self.is_running = False
+        # Chờ luồng xử lý thoát hẳn trước khi đóng telemetry/clip/bộ ghi và reset các công đoạn
+        self.pipeline.stop()
         if self.camera:
             self.camera.stop()
+        if self.telemetry is not None:
+            self.telemetry.close()
+        if self.incidents is not None:
+            self.incidents.close()
+        if self.speed_sensor is not None:
+            self.speed_sensor.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+            stats = self.recorder.get_stats()
+            self.logger.log_info(
+                f"Đã ghi video: {stats['frames_written']} khung hình, bỏ {stats['frames_dropped']} khung hình"
+            )
         self.alert.stop_alert()
         
         # Reset trạng thái
         self.alert_disabled = False
-        self.alert_disabled_until = 0
-        self.consecutive_risk_count = 0
-        self.consecutive_safe_count = 0
-        if self.motion_detection:
-            self.motion_detection.clear_history()
-        if self.ttc_module:
-            self.ttc_module.clear_history()
+        self.pipeline.reset()
         
         self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
@@ -348,176 +416,56 @@ class MainWindow:
         self.logger.log_info("Hệ thống đã được dừng")
     
     def process_loop(self):
-        """Vòng lặp xử lý chính"""
+        """Vòng lặp cập nhật giao diện: chỉ lấy kết quả mới nhất từ pipeline"""
         if not self.is_running:
             return
         
         try:
-            # Lấy khung hình
-            if self.camera is None:
-                self.root.after(10, self.process_loop)
-                return
-                
-            frame = self.camera.get_frame()
-            if frame is None:
-                # Kiểm tra nếu video đã hết
-                if not self.use_camera and self.camera and not self.camera.is_running:
-                    self.status_label.config(text="Trạng thái: Video đã hết")
-                    self.stop_system()
-                    return
-                self.root.after(10, self.process_loop)
-                return
-            
-            # Tính FPS
-            self.frame_count += 1
-            elapsed = time.time() - self.start_time
-            if elapsed > 0:
-                self.fps = self.frame_count / elapsed
+            if not ENABLE_MULTITHREADING:
+                # Chế độ đơn luồng: xử lý ngay trên luồng giao diện
+                self.pipeline.step()
             
-            # Phát hiện vật thể
-            detections = self.detection.detect(frame)
-            
-            # Lọc chỉ lấy vật thể ở làn đường trước mặt
-            h, w = frame.shape[:2]
-            detections = self.lane_filter.filter_detections(detections, w, h)
-            
-            # Tính khoảng cách
-            processed_detections = self.distance.process_detections(detections)
-            
-            # Tính TTC và đánh giá rủi ro nâng cao (nếu bật)
-            if self.ttc_module and len(processed_detections) > 0:
-                current_time = time.time()
-                # Ước lượng vận tốc hiện tại (có thể lấy từ GPS/sensor, tạm thời để None)
-                current_velocity_ms = None  # Có thể thêm input từ cảm biến tốc độ
-                processed_detections = self.ttc_module.process_detections_with_ttc(
-                    processed_detections, 
-                    current_time,
-                    current_velocity_ms
-                )
-            
-            self.processed_detections = processed_detections
-            
-            # Phát hiện chuyển động (nếu bật)
-            is_vehicle_stopped = False
-            if self.motion_detection and len(processed_detections) > 0:
-                h, w = frame.shape[:2]
-                self.motion_detection.update_frame_size(w, h)
-                movement_info = self.motion_detection.calculate_movement(processed_detections)
-                is_vehicle_stopped = self.motion_detection.is_vehicle_stopped(
-                    processed_detections, movement_info
-                )
-            
-            # Kiểm tra thời gian tắt cảnh báo tạm thời
-            if self.alert_disabled_until > 0 and time.time() >= self.alert_disabled_until:
+            # Cập nhật nút tắt cảnh báo khi hết thời gian tắt tạm thời
+            if self.alert_disabled and not self.pipeline.alert_disabled:
                 self.alert_disabled = False
-                self.alert_disabled_until = 0
                 self.mute_alert_btn.config(text="Tắt cảnh báo (30s)")
             
-            # Kiểm tra nguy cơ va chạm
-            has_risk = self.distance.has_collision_risk(processed_detections)
-            
-            # Kiểm tra thêm điều kiện: nếu vận tốc tương đối gần 0 thì không cảnh báo
-            has_real_risk = False
-            if has_risk:
-                for det in processed_detections:
-                    if det['risk']['needs_alert']:
-                        # Kiểm tra vận tốc tương đối (nếu có)
-                        rel_velocity = det.get('relative_velocity', 0)
-                        ttc = det['risk'].get('ttc')
-                        distance = det.get('distance')
-                        
-                        # Nếu vận tốc tương đối rất thấp hoặc TTC rất lớn
-                        # thì không cảnh báo (có thể là vật thể đứng yên)
-                        if abs(rel_velocity) < MIN_VELOCITY_FOR_ALERT or (ttc is not None and ttc > MAX_TTC_FOR_ALERT):
-                            continue
-                        
-                        # Nếu khoảng cách xa (>15m) và vận tốc thấp, không cảnh báo
-                        if distance is not None and distance > 15.0 and abs(rel_velocity) < 1.5:
-                            continue
-                        
-                        has_real_risk = True
-                        break
-            
-            # Hệ thống đếm liên tục: chỉ cảnh báo sau N lần liên tục phát hiện nguy hiểm
-            if has_real_risk:
-                self.consecutive_risk_count += 1
-                self.consecutive_safe_count = 0
-            else:
-                self.consecutive_risk_count = 0
-                self.consecutive_safe_count += 1
-            
-            # Chỉ cảnh báo khi:
-            # 1. Phát hiện nguy hiểm liên tục đủ số lần
-            # 2. Người dùng chưa tắt tạm thời
-            # 3. Xe không đang dừng
-            # 4. Chưa có đủ số lần an toàn liên tục để tắt cảnh báo
-            should_alert = (self.consecutive_risk_count >= CONSECUTIVE_RISK_THRESHOLD and 
-                          not self.alert_disabled and 
-                          not is_vehicle_stopped and
-                          self.consecutive_safe_count < CONSECUTIVE_SAFE_THRESHOLD)
-            
-            if should_alert:
-                self.alert.play_alert()
-                # Ghi nhật ký cho các vật thể nguy hiểm
-                for det in processed_detections:
-                    if det['risk']['needs_alert']:
-                        self.logger.log_warning(det)
-            else:
-                self.alert.stop_alert()
-                if is_vehicle_stopped and has_risk:
-                    # Ghi log khi tắt cảnh báo do xe dừng
-                    self.logger.log_info("Cảnh báo đã tắt do phát hiện xe đang dừng")
-            
-            # Vẽ vùng ROI làn đường (nếu bật)
-            display_frame = self.lane_filter.draw_lane_roi(frame)
-            
-            # Vẽ lên khung hình
-            display_frame = self.alert.draw_detections(display_frame, processed_detections)
-            
-            # Vẽ thông tin trạng thái
-            closest_obj = self.distance.get_closest_object(processed_detections)
-            closest_dist = closest_obj['distance'] if closest_obj else None
-            closest_ttc = closest_obj['risk'].get('ttc') if closest_obj else None
-            
-            alert_count = sum(1 for d in processed_detections if d['risk']['needs_alert'])
-            
-            # Thêm thông tin trạng thái
-            status_text = []
-            if self.alert_disabled:
-                status_text.append("Cảnh báo: TẮT")
-            if is_vehicle_stopped:
-                status_text.append("Xe: DỪNG")
-            
-            display_frame = self.alert.draw_status_overlay(
-                display_frame,
-                fps=int(self.fps),
-                alert_count=alert_count,
-                closest_distance=closest_dist,
-                closest_ttc=closest_ttc,
-                status_text=" | ".join(status_text) if status_text else None
-            )
-            
-            # Hiển thị khung hình
-            self.display_frame(display_frame)
-            
-            # Cập nhật thống kê
-            self.update_statistics(processed_detections)
-            
-            # Cập nhật nhật ký
-            self.update_logs_display()
-            
+            result = self.pipeline.get_latest_result()
+            if result is not None and result.frame_seq != self._last_frame_seq:
+                self._last_frame_seq = result.frame_seq
+                self.fps = result.fps
+                self.processed_detections = result.detections
+                
+                # Hiển thị khung hình (có thể bỏ qua khi pipeline đang giảm tốc độ hiển thị)
+                if result.display_frame is not None:
+                    with StageTimer(self.pipeline.latency, 'display'):
+                        self.display_frame(result.display_frame)
+                    if self.pipeline.latency is not None:
+                        self.pipeline.latency.record(
+                            'glass_to_display', (time.perf_counter() - result.capture_time) * 1000.0
+                        )
+                
+                # Cập nhật thống kê và nhật ký với tần suất thấp hơn khung hình
+                now = time.time()
+                if now - self._last_panel_update >= PANEL_UPDATE_INTERVAL_MS / 1000.0:
+                    self._last_panel_update = now
+                    self.update_statistics(result.detections)
+                    self.update_logs_display()
+            elif self.pipeline.is_source_finished() and not self.use_camera:
+                # Video đã hết
+                self.status_label.config(text="Trạng thái: Video đã hết")
+                self.stop_system()
+                return
+        
         except Exception as e:
-            self.logger.log_error(f"Lỗi xử lý: {e}")
+            self.logger.log_error(f"Lỗi hiển thị: {e}")
         
         # Lặp lại
-        self.root.after(1, self.process_loop)
+        self.root.after(GUI_POLL_INTERVAL_MS, self.process_loop)
     
     def display_frame(self, frame):
         """Hiển thị khung hình lên giao diện"""
         try:
-            # Lấy kích thước gốc của frame
-            h, w = frame.shape[:2]
-            
             # Lấy kích thước label (chỉ lấy một lần, không lặp lại)
             if not hasattr(self, '_label_size') or self._label_size is None:
                 self.root.update_idletasks()  # Cập nhật layout trước
@@ -531,66 +479,98 @@ class MainWindow:
                     # Sử dụng kích thước mặc định nếu chưa có
                     self._label_size = (960, 540)  # 16:9 aspect ratio
             
-            label_w, label_h = self._label_size
-            
-            # Tính scale để giữ tỷ lệ khung hình
-            scale = min(label_w / w, label_h / h)
-            new_w = int(w * scale)
-            new_h = int(h * scale)
-            
-            # Chỉ resize nếu cần thiết
-            if new_w != w or new_h != h:
-                frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
-            
-            # Chuyển đổi sang RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # Thu nhỏ vừa label và chuyển đổi sang RGB
+            frame_rgb = RenderModule.to_display_rgb(frame, self._label_size)
             img = Image.fromarray(frame_rgb)
             img_tk = ImageTk.PhotoImage(image=img)
             
             self.video_label.config(image=img_tk)
             self.video_label.image = img_tk  # Giữ reference
-            
+        
         except Exception as e:
             print(f"Lỗi hiển thị: {e}")
     
     def update_statistics(self, detections):
-        """Cập nhật thống kê"""
+        """Cập nhật thống kê (chỉ sửa các dòng thay đổi trong danh sách vật thể)"""
         self.fps_label.config(text=f"FPS: {int(self.fps)}")
         self.detection_label.config(text=f"Vật thể phát hiện: {len(detections)}")
         
         alert_count = sum(1 for d in detections if d['risk']['needs_alert'])
         self.alert_label.config(text=f"Cảnh báo: {alert_count}")
         
-        # Cập nhật danh sách vật thể
-        self.detection_tree.delete(*self.detection_tree.get_children())
-        for det in detections:
+        # Độ trễ xử lý khung hình và số lần vượt ngân sách
+        latency = self.pipeline.get_latency_summary()
+        if latency and 'total' in latency['stages']:
+            self.latency_label.config(
+                text=f"Độ trễ p95: {latency['stages']['total']['p95']:.0f}ms "
+                     f"(vượt {latency['budget_ms']}ms: {latency['overruns']})"
+            )
+        
+        # Tính các dòng mới theo track id (ổn định qua các khung hình nên dòng của một vật thể
+        # chỉ được sửa giá trị, không bị xóa rồi thêm lại khi vật thể di chuyển)
+        new_rows = {}
+        for index, det in enumerate(detections):
+            if det.get('track_id') is not None:
+                key = str(det['track_id'])
+            else:
+                # Không có track id (vượt ETTC_MAX_TRACKS hoặc không có khoảng cách): vẫn hiện một dòng
+                # để danh sách khớp số vật thể phát hiện, khóa theo vị trí không trùng với track id
+                key = f"u{index}"
             distance_str = f"{det['distance']:.2f}m" if det['distance'] else "N/A"
-            risk_level = det['risk']['level']
-            self.detection_tree.insert('', tk.END, values=(det['class'], distance_str, risk_level))
+            new_rows[key] = (det['class'], distance_str, det['risk']['level'])
+        
+        # Xóa các dòng không còn xuất hiện
+        removed = [key for key in self._tree_rows if key not in new_rows]
+        if removed:
+            self.detection_tree.delete(*removed)
+        
+        # Thêm dòng mới hoặc sửa dòng có giá trị thay đổi
+        for key, values in new_rows.items():
+            old_values = self._tree_rows.get(key)
+            if old_values is None:
+                self.detection_tree.insert('', tk.END, iid=key, values=values)
+            elif old_values != values:
+                self.detection_tree.item(key, values=values)
+        
+        self._tree_rows = new_rows
     
     def update_logs_display(self):
-        """Cập nhật hiển thị nhật ký"""
-        logs = self.logger.get_warning_logs(limit=20)
-        self.logs_text.delete(1.0, tk.END)
+        """Cập nhật hiển thị nhật ký (chỉ thêm các bản ghi mới)"""
+        logs = self.logger.get_warning_logs_since(self._last_log_seq, limit=LOG_PANEL_MAX_LINES)
+        if not logs:
+            return
+        self._last_log_seq = logs[-1]['seq']
         
-        for log in reversed(logs[-20:]):  # Hiển thị 20 bản ghi gần nhất
+        # Bản ghi mới nhất hiển thị trên cùng
+        for log in logs:
             timestamp = log.get('timestamp', '')
             class_name = log.get('class', '')
-            distance = log.get('distance', 0)
+            distance = log.get('distance')
             risk = log.get('risk_level', '')
+            duration = log.get('duration')
             
-            log_line = f"[{timestamp}] {class_name} - {distance:.2f}m - {risk}\n"
-            self.logs_text.insert(tk.END, log_line)
+            distance_text = f"{distance:.2f}m" if distance is not None else "N/A"
+            duration_text = f" - {duration:.1f}s" if duration is not None else ""
+            log_line = f"[{timestamp}] {class_name} - {distance_text} - {risk}{duration_text}\n"
+            self.logs_text.insert('1.0', log_line)
+        
+        # Chỉ giữ lại số dòng tối đa
+        line_count = int(self.logs_text.index('end-1c').split('.')[0]) - 1
+        if line_count > LOG_PANEL_MAX_LINES:
+            self.logs_text.delete(f"{LOG_PANEL_MAX_LINES + 1}.0", tk.END)
     
     def export_logs(self):
         """Xuất nhật ký ra file"""
         file_path = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=[("JSON files", "*.json"), ("CSV files", "*.csv"), ("All files", "*.*")]
         )
         
         if file_path:
-            exported = self.logger.export_logs_to_json(file_path)
+            if file_path.lower().endswith('.csv'):
+                exported = self.logger.export_logs_to_csv(file_path)
+            else:
+                exported = self.logger.export_logs_to_json(file_path)
             if exported:
                 messagebox.showinfo("Thành công", f"Đã xuất nhật ký ra: {exported}")
             else:
@@ -600,10 +580,18 @@ class MainWindow:
         """Hiển thị cửa sổ thống kê"""
         stats_window = tk.Toplevel(self.root)
         stats_window.title("Thống kê hệ thống")
-        stats_window.geometry("400x300")
+        stats_window.geometry("560x320")
+        
+        # Độ trễ từng công đoạn (p50/p95/p99)
+        ttk.Label(stats_window, text="Độ trễ từng công đoạn (ms)").pack(anchor=tk.W, padx=10, pady=5)
+        latency_text = tk.Text(stats_window, height=14, font=('Courier', 10))
+        latency_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         
-        # Thêm nội dung thống kê ở đây
-        ttk.Label(stats_window, text="Thống kê chi tiết sẽ được hiển thị ở đây").pack(pady=20)
+        if self.pipeline.latency is not None:
+            latency_text.insert(tk.END, "\n".join(self.pipeline.latency.format_lines()))
+        else:
+            latency_text.insert(tk.END, "Chưa bật đo độ trễ (ENABLE_LATENCY_MONITOR)")
+        latency_text.config(state=tk.DISABLED)
     
     def show_settings(self):
         """Hiển thị cửa sổ cài đặt"""
@@ -635,6 +623,7 @@ Phát triển bởi: Nhóm ITS
         
         self.alert.cleanup()
         self.logger.log_info("Ứng dụng đã được đóng")
+        self.logger.close()
         self.root.destroy()
     
     def run(self):
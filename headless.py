@@ -0,0 +1,161 @@
+"""
+Chạy hệ thống cảnh báo va chạm không cần giao diện
+
+Ví dụ:
+    python headless.py --source video.mp4 --output results.jsonl
+    python headless.py --source video.mp4 --video-out annotated.mp4 --duration 60
+    python headless.py --source 0 --video-out rec/drive.mp4 --video-fps 15 --video-size 960x540 --video-segment 300
+    python headless.py --source 0 --duration 30
+    python headless.py --source drive.mp4 --speed logs/drive.nmea --output results.jsonl
+    python headless.py --source 0 --speed serial:/dev/ttyUSB0@4800
+    python headless.py --source 0 --threads auto --affinity capture=0 --affinity inference=1-3
+    python headless.py --source long_drive.mp4 --workers 8 --output results.jsonl
+    python headless.py --replay logs/telemetry/telemetry_20250101_080000.tlm
+"""
+
+import argparse
+import json
+import sys
+import os
+
+# Thêm đường dẫn vào sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.headless_module import HeadlessRunner
+from modules.replay_module import ReplayRunner
+from modules.resource_module import ResourceManager
+from config.config import BATCH_TORCH_THREADS, CHUNK_OVERLAP_S, CPU_AFFINITY, TORCH_INTRA_OP_THREADS
+
+
+def _frame_size(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def _threads(text):
+    return text if text == 'auto' else int(text)
+
+
+def parse_args(argv=None):
+    """Đọc tham số dòng lệnh"""
+    parser = argparse.ArgumentParser(
+        description="ITS - Chạy pipeline cảnh báo va chạm không cần giao diện"
+    )
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument('--source',
+                              help="Chỉ số camera (0, 1, ...) hoặc đường dẫn file video")
+    source_group.add_argument('--replay',
+                              help="File telemetry: phát lại vật thể đã ghi, bỏ qua YOLO (chỉnh ngưỡng)")
+    parser.add_argument('--duration', type=float, default=None,
+                        help="Thời lượng xử lý tối đa (giây)")
+    parser.add_argument('--max-frames', type=int, default=None,
+                        help="Số khung hình tối đa")
+    parser.add_argument('--output', default=None,
+                        help="File JSONL ghi kết quả từng khung hình")
+    parser.add_argument('--video-out', default=None,
+                        help="File video ghi khung hình đã vẽ cảnh báo (ghi trên luồng nền)")
+    parser.add_argument('--video-fps', type=float, default=None,
+                        help="Tốc độ khung hình của video ghi (mặc định theo nguồn)")
+    parser.add_argument('--video-size', type=_frame_size, default=None,
+                        help="Kích thước video ghi, vd. 960x540 (mặc định giữ kích thước khung hình)")
+    parser.add_argument('--video-segment', type=float, default=None,
+                        help="Chia video ghi thành các file dài tối đa bấy nhiêu giây")
+    parser.add_argument('--realtime', action='store_true',
+                        help="Đọc video theo tốc độ thực thay vì xử lý tuần tự từng khung hình")
+    parser.add_argument('--hazard-onset', type=float, default=None,
+                        help="Chế độ kiểm thử: thời điểm (giây) nguy hiểm xuất hiện trong clip, "
+                             "đo độ trễ từ nguy hiểm đến cảnh báo")
+    parser.add_argument('--telemetry', default=None,
+                        help="File telemetry nhị phân ghi kết quả từng khung hình (dùng cho phát lại)")
+    parser.add_argument('--incidents', default=None,
+                        help="Thư mục ghi clip sự cố (vài giây trước và sau mỗi lần bắt đầu cảnh báo)")
+    parser.add_argument('--speed', default=None,
+                        help="Nguồn vận tốc xe: serial:/dev/ttyUSB0[@baud] (NMEA), obd:/dev/ttyUSB0[@baud] (ELM327), "
+                             "udp:[host:]port hoặc file ghi NMEA/OBD (khớp theo thời gian trong video)")
+    parser.add_argument('--threads', type=_threads, default=TORCH_INTRA_OP_THREADS,
+                        help="Số luồng torch của suy luận YOLO, hoặc 'auto' để đo và chọn (lưu kết quả theo máy)")
+    parser.add_argument('--affinity', action='append', default=None,
+                        help="Gán lõi CPU: vai_trò=lõi (capture, inference, render; vd. inference=1-3), "
+                             "lặp lại cho nhiều vai trò; 'auto' để chia tự động, 'none' để không gán")
+    parser.add_argument('--retune', action='store_true',
+                        help="Đo lại số luồng suy luận kể cả khi đã có kết quả lưu")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Chia file video thành các đoạn chồng lấn xử lý song song trên N tiến trình")
+    parser.add_argument('--segments', type=int, default=None,
+                        help="Số đoạn khi chạy song song (mặc định bằng số tiến trình)")
+    parser.add_argument('--overlap', type=float, default=CHUNK_OVERLAP_S,
+                        help="Thời gian chồng lấn trước mỗi đoạn để trạng thái theo dõi ổn định (giây)")
+    return parser.parse_args(argv)
+
+
+def run_chunked(args):
+    """Xử lý một file video theo các đoạn song song (ChunkedRunner)"""
+    unsupported = [name for name, value in (('--video-out', args.video_out), ('--telemetry', args.telemetry),
+                                            ('--incidents', args.incidents), ('--speed', args.speed),
+                                            ('--hazard-onset', args.hazard_onset), ('--duration', args.duration),
+                                            ('--max-frames', args.max_frames), ('--realtime', args.realtime),
+                                            ('--affinity', args.affinity))
+                   if value]
+    if unsupported or not os.path.isfile(args.source):
+        print(f"--workers chỉ dùng với file video (không hỗ trợ {', '.join(unsupported) or '--source camera'})",
+              file=sys.stderr)
+        return 1
+    from modules.chunk_module import ChunkedRunner
+    
+    runner = ChunkedRunner(args.source, workers=args.workers, segments=args.segments,
+                           overlap_s=args.overlap, output_path=args.output,
+                           threads=args.threads if isinstance(args.threads, int) else BATCH_TORCH_THREADS)
+    stats = runner.run()
+    if stats is None:
+        return 1
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    return 1 if stats['errors'] else 0
+
+
+def main(argv=None):
+    """Điểm vào dòng lệnh"""
+    args = parse_args(argv)
+    if args.replay:
+        replay = ReplayRunner(args.replay, max_frames=args.max_frames, output_path=args.output)
+        print(json.dumps(replay.run(), ensure_ascii=False, indent=2))
+        return 0
+    
+    if args.workers is not None:
+        return run_chunked(args)
+    
+    try:
+        resources = ResourceManager(intra_op_threads=args.threads,
+                                    affinity=args.affinity if args.affinity is not None else CPU_AFFINITY,
+                                    retune=args.retune)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    
+    runner = HeadlessRunner(
+        args.source,
+        duration=args.duration,
+        max_frames=args.max_frames,
+        output_path=args.output,
+        video_out_path=args.video_out,
+        realtime=args.realtime,
+        hazard_onset=args.hazard_onset,
+        telemetry_path=args.telemetry,
+        incident_dir=args.incidents,
+        video_fps=args.video_fps,
+        video_size=args.video_size,
+        video_segment_s=args.video_segment,
+        speed_source=args.speed,
+        resources=resources
+    )
+    stats = runner.run()
+    runner.logger.close()
+    if stats is None:
+        print("Không thể khởi tạo mô hình YOLO", file=sys.stderr)
+        return 1
+    
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
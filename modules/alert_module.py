@@ -2,68 +2,191 @@
 Module cảnh báo âm thanh và hình ảnh
 """
 
-import pygame
-import cv2
+import threading
+import time
 import numpy as np
-from config.config import ALERT_SOUND_PATH, ALERT_VOLUME, COLOR_SAFE, COLOR_CAUTION, COLOR_WARNING, COLOR_DANGER
+import pygame
+from modules.render_module import RenderModule
+from config.config import (ALERT_SOUND_PATH, ALERT_VOLUME, AUDIO_SAMPLE_RATE, AUDIO_BUFFER_SIZE,
+                          ALERT_TONES, ALERT_VOICE_ENABLED)
+
+
+# Các mức cảnh báo theo thứ tự ưu tiên tăng dần
+ALERT_LEVELS = ['caution', 'warning', 'danger']
 
 
 class AlertModule:
-    """Module quản lý cảnh báo âm thanh và hiển thị trực quan"""
+    """
+    Module quản lý cảnh báo âm thanh và hiển thị trực quan
     
-    def __init__(self, sound_path=ALERT_SOUND_PATH):
+    Tất cả âm thanh được tổng hợp/giải mã thành PCM một lần khi khởi tạo và phát trên
+    các kênh mixer riêng. play_alert/stop_alert chỉ ghi yêu cầu và trả về ngay,
+    luồng âm thanh nền thực hiện việc phát nên có thể gọi từ bất kỳ luồng nào.
+    """
+    
+    def __init__(self, sound_path=ALERT_SOUND_PATH, latency_monitor=None):
         """
         Khởi tạo alert module
         
         Args:
-            sound_path: Đường dẫn đến file âm thanh cảnh báo
+            sound_path: Đường dẫn đến file âm thanh cảnh báo (giọng nói)
+            latency_monitor: LatencyMonitor để ghi độ trễ từ lúc kích hoạt đến lúc phát,
+                             hoặc None
         """
         self.sound_path = sound_path
+        self.latency = latency_monitor
         self.is_playing = False
         self.volume = ALERT_VOLUME
         self.pygame_initialized = False
         
+        self.tones = {}  # Mức cảnh báo → pygame.mixer.Sound (một chu kỳ bíp + khoảng lặng)
+        self.voice = None  # Âm thanh giọng nói đã giải mã, hoặc None
+        self.beep_channel = None
+        self.voice_channel = None
+        self.output_latency_ms = 0.0  # Độ trễ bộ đệm mixer
+        self.last_sound_latency_ms = None
+        
+        # Trạng thái yêu cầu, luồng âm thanh đọc và thực hiện
+        self._cond = threading.Condition()
+        self._requested_level = None  # None = im lặng
+        self._requested_loop = True
+        self._request_time = None
+        self._request_id = 0
+        self._thread = None
+        self._running = False
+    
     def initialize(self):
-        """Khởi tạo pygame mixer"""
+        """Khởi tạo pygame mixer, tạo sẵn các âm thanh và khởi động luồng âm thanh"""
+        if self.pygame_initialized:
+            return True
         try:
+            pygame.mixer.pre_init(AUDIO_SAMPLE_RATE, -16, 2, AUDIO_BUFFER_SIZE)
             pygame.mixer.init()
-            pygame.mixer.music.load(self.sound_path)
-            pygame.mixer.music.set_volume(self.volume)
+            frequency, size, channels = pygame.mixer.get_init()
+            self.output_latency_ms = AUDIO_BUFFER_SIZE / frequency * 1000.0
+            
+            for level, (tone_hz, beep_s, period_s) in ALERT_TONES.items():
+                pcm = self._synthesize_beep(frequency, channels, tone_hz, beep_s, period_s)
+                self.tones[level] = pygame.mixer.Sound(buffer=pcm.tobytes())
+            
+            if ALERT_VOICE_ENABLED:
+                try:
+                    self.voice = pygame.mixer.Sound(self.sound_path)
+                except Exception as e:
+                    print(f"Không giải mã được file âm thanh cảnh báo: {e}")
+                    self.voice = None
+            
+            # Dành riêng 2 kênh: tiếng bíp lặp và giọng nói
+            pygame.mixer.set_reserved(2)
+            self.beep_channel = pygame.mixer.Channel(0)
+            self.voice_channel = pygame.mixer.Channel(1)
+            self._apply_volume()
+            
             self.pygame_initialized = True
+            self._running = True
+            self._thread = threading.Thread(target=self._audio_loop, daemon=True)
+            self._thread.start()
             return True
         except Exception as e:
             print(f"Lỗi khởi tạo âm thanh: {e}")
             return False
     
-    def play_alert(self, loop=True):
+    @staticmethod
+    def _synthesize_beep(frequency, channels, tone_hz, beep_s, period_s):
+        """
+        Tạo PCM 16-bit của một chu kỳ: tiếng bíp hình sin (có fade để tránh tiếng lách cách)
+        theo sau là khoảng lặng
+        
+        Returns:
+            numpy.ndarray: Mảng int16 kích thước (số mẫu, số kênh)
+        """
+        beep_samples = int(frequency * beep_s)
+        period_samples = max(beep_samples, int(frequency * period_s))
+        
+        t = np.arange(beep_samples, dtype=np.float32) / frequency
+        wave = np.sin(2.0 * np.pi * tone_hz * t)
+        fade = min(beep_samples // 2, int(frequency * 0.005))
+        if fade > 0:
+            ramp = np.linspace(0.0, 1.0, fade, dtype=np.float32)
+            wave[:fade] *= ramp
+            wave[-fade:] *= ramp[::-1]
+        
+        pcm = np.zeros(period_samples, dtype=np.int16)
+        pcm[:beep_samples] = (wave * 0.8 * 32767).astype(np.int16)
+        return np.ascontiguousarray(np.repeat(pcm[:, None], channels, axis=1))
+    
+    def play_alert(self, loop=True, level='danger', trigger_time=None):
         """
-        Phát cảnh báo âm thanh
+        Yêu cầu phát cảnh báo âm thanh (không chặn)
         
         Args:
             loop: Có phát lặp lại không
+            level: Mức cảnh báo ('caution', 'warning', 'danger'), quyết định nhịp bíp
+            trigger_time: Thời điểm kích hoạt (time.perf_counter()) để đo độ trễ,
+                          mặc định là thời điểm gọi hàm
         """
         if not self.pygame_initialized:
             if not self.initialize():
                 return
         
-        if not self.is_playing:
+        with self._cond:
+            if self.is_playing and level == self._requested_level and loop == self._requested_loop:
+                return
+            self._requested_level = level
+            self._requested_loop = loop
+            self._request_time = trigger_time if trigger_time is not None else time.perf_counter()
+            self._request_id += 1
+            self.is_playing = True
+            self._cond.notify()
+    
+    def stop_alert(self):
+        """Yêu cầu dừng cảnh báo âm thanh (không chặn)"""
+        with self._cond:
+            if not self.is_playing:
+                return
+            self._requested_level = None
+            self._request_time = None
+            self._request_id += 1
+            self.is_playing = False
+            self._cond.notify()
+    
+    def _audio_loop(self):
+        """Luồng âm thanh: thực hiện yêu cầu mới nhất trên các kênh mixer"""
+        handled_id = 0
+        current_level = None
+        while True:
+            with self._cond:
+                while self._running and self._request_id == handled_id:
+                    self._cond.wait()
+                if not self._running:
+                    break
+                handled_id = self._request_id
+                level = self._requested_level
+                loop = self._requested_loop
+                request_time = self._request_time
+            
             try:
-                if loop:
-                    pygame.mixer.music.play(-1)  # Phát lặp vô hạn
+                if level is None:
+                    self.beep_channel.stop()
+                    self.voice_channel.stop()
                 else:
-                    pygame.mixer.music.play()
-                self.is_playing = True
+                    sound = self.tones.get(level) or self.tones[ALERT_LEVELS[-1]]
+                    self.beep_channel.play(sound, loops=-1 if loop else 0)
+                    if current_level is None and self.voice is not None:
+                        self.voice_channel.play(self.voice)
+                    self._record_latency(request_time)
+                current_level = level
             except Exception as e:
                 print(f"Lỗi phát âm thanh: {e}")
     
-    def stop_alert(self):
-        """Dừng cảnh báo âm thanh"""
-        if self.is_playing:
-            try:
-                pygame.mixer.music.stop()
-                self.is_playing = False
-            except Exception as e:
-                print(f"Lỗi dừng âm thanh: {e}")
+    def _record_latency(self, request_time):
+        """Ghi độ trễ từ lúc kích hoạt đến lúc âm thanh ra loa (ước lượng thêm bộ đệm mixer)"""
+        if request_time is None:
+            return
+        latency_ms = (time.perf_counter() - request_time) * 1000.0 + self.output_latency_ms
+        self.last_sound_latency_ms = latency_ms
+        if self.latency is not None:
+            self.latency.record('trigger_to_sound', latency_ms)
     
     def set_volume(self, volume):
         """
@@ -74,167 +197,30 @@ class AlertModule:
         """
         self.volume = max(0.0, min(1.0, volume))
         if self.pygame_initialized:
-            pygame.mixer.music.set_volume(self.volume)
+            self._apply_volume()
     
-    @staticmethod
-    def draw_detections(frame, processed_detections):
-        """
-        Vẽ bounding box và thông tin lên khung hình
-        
-        Args:
-            frame: Khung hình đầu vào
-            processed_detections: Danh sách vật thể đã được xử lý
-            
-        Returns:
-            numpy.ndarray: Khung hình đã được vẽ
-        """
-        display_frame = frame.copy()
-        
-        for detection in processed_detections:
-            x1, y1, x2, y2 = detection['bbox']
-            distance = detection['distance']
-            class_name = detection['class']
-            confidence = detection['confidence']
-            risk = detection['risk']
-            
-            # Màu sắc dựa trên mức độ nguy hiểm
-            color = risk['color']
-            thickness = 3 if risk['needs_alert'] else 2
-            
-            # Vẽ bounding box
-            cv2.rectangle(display_frame, (x1, y1), (x2, y2), color, thickness)
-            
-            # Vẽ nhãn với thông tin
-            label_parts = []
-            if distance is not None:
-                label_parts.append(f"{distance:.2f}m")
-            
-            # Thêm TTC nếu có
-            ttc = risk.get('ttc')
-            if ttc is not None:
-                label_parts.append(f"TTC: {ttc:.1f}s")
-            
-            label_parts.append(class_name)
-            label_parts.append(f"{confidence:.1%}")
-            
-            label = " | ".join(label_parts)
-            
-            # Tính kích thước text
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = 0.6
-            (text_width, text_height), baseline = cv2.getTextSize(
-                label, font, font_scale, 2
-            )
-            
-            # Vẽ background cho text
-            cv2.rectangle(
-                display_frame,
-                (x1, y1 - text_height - baseline - 5),
-                (x1 + text_width, y1),
-                color,
-                -1
-            )
-            
-            # Vẽ text
-            cv2.putText(
-                display_frame,
-                label,
-                (x1, y1 - 5),
-                font,
-                font_scale,
-                (255, 255, 255),
-                2
-            )
-        
-        return display_frame
+    def _apply_volume(self):
+        """Áp dụng âm lượng cho các âm thanh đã tạo sẵn"""
+        for sound in self.tones.values():
+            sound.set_volume(self.volume)
+        if self.voice is not None:
+            self.voice.set_volume(self.volume)
     
-    @staticmethod
-    def draw_status_overlay(frame, fps=None, alert_count=0, closest_distance=None, status_text=None, closest_ttc=None):
-        """
-        Vẽ thông tin trạng thái lên khung hình
-        
-        Args:
-            frame: Khung hình đầu vào
-            fps: FPS hiện tại
-            alert_count: Số lượng cảnh báo
-            closest_distance: Khoảng cách gần nhất
-            status_text: Text trạng thái bổ sung (ví dụ: "Xe: DỪNG", "Cảnh báo: TẮT")
-            
-        Returns:
-            numpy.ndarray: Khung hình đã được vẽ
-        """
-        display_frame = frame.copy()
-        h, w = display_frame.shape[:2]
-        
-        # Vẽ background cho thông tin (mở rộng nếu có status_text)
-        overlay = display_frame.copy()
-        height = 130 if status_text else 100
-        cv2.rectangle(overlay, (10, 10), (350, height), (0, 0, 0), -1)
-        cv2.addWeighted(overlay, 0.7, display_frame, 0.3, 0, display_frame)
-        
-        y_offset = 30
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        
-        # FPS
-        if fps is not None:
-            cv2.putText(
-                display_frame,
-                f"FPS: {fps}",
-                (20, y_offset),
-                font,
-                0.6,
-                (0, 255, 0),
-                2
-            )
-            y_offset += 25
-        
-        # Số lượng cảnh báo
-        if alert_count > 0:
-            cv2.putText(
-                display_frame,
-                f"Canh bao: {alert_count}",
-                (20, y_offset),
-                font,
-                0.6,
-                (0, 0, 255),
-                2
-            )
-            y_offset += 25
-        
-        # Khoảng cách gần nhất
-        if closest_distance is not None:
-            distance_text = f"Gan nhat: {closest_distance:.2f}m"
-            if closest_ttc is not None:
-                distance_text += f" (TTC: {closest_ttc:.1f}s)"
-            cv2.putText(
-                display_frame,
-                distance_text,
-                (20, y_offset),
-                font,
-                0.6,
-                (0, 255, 255),
-                2
-            )
-            y_offset += 25
-        
-        # Trạng thái bổ sung
-        if status_text:
-            cv2.putText(
-                display_frame,
-                status_text,
-                (20, y_offset),
-                font,
-                0.6,
-                (0, 165, 255),  # Màu cam
-                2
-            )
-        
-        return display_frame
+    # Các hàm vẽ nằm trong RenderModule (không phụ thuộc pygame), giữ lại ở đây để tương thích
+    draw_detections = staticmethod(RenderModule.draw_detections)
+    draw_status_overlay = staticmethod(RenderModule.draw_status_overlay)
     
     def cleanup(self):
         """Giải phóng tài nguyên"""
         self.stop_alert()
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
         if self.pygame_initialized:
             pygame.mixer.quit()
             self.pygame_initialized = False
-
+            self.tones = {}
+            self.voice = None
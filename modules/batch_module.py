@@ -0,0 +1,444 @@
+"""
+Module xử lý hàng loạt kho video dashcam trên nhiều tiến trình
+
+Mỗi tiến trình nạp một mô hình YOLO riêng (giới hạn số luồng torch) và chạy HeadlessRunner
+lần lượt trên các file được giao. Tóm tắt sự kiện của từng file được ghi ngay khi file xong
+(ghi nguyên tử), nên lần chạy bị ngắt có thể tiếp tục: các file đã có tóm tắt hợp lệ được bỏ qua.
+Cuối cùng các tóm tắt được gộp thành một báo cáo chung (JSON + CSV).
+"""
+
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from config.config import (
+    BATCH_OUTPUT_DIR, BATCH_TORCH_THREADS, BATCH_WORKER_MEMORY_MB, BATCH_MAX_WORKER_CRASHES,
+    TORCH_INTER_OP_THREADS, VIDEO_EXTENSIONS, YOLO_MODEL_PATH
+)
+
+
+REPORT_FILE = 'batch_report.json'
+FILES_CSV = 'batch_files.csv'
+EPISODES_CSV = 'batch_episodes.csv'
+SUMMARY_DIR = 'files'
+TELEMETRY_SUBDIR = 'telemetry'
+
+EPISODE_FIELDS = ['start_time', 'end_time', 'duration', 'frames', 'class', 'track_id',
+                  'max_level', 'min_distance', 'min_ttc', 'max_confidence']
+FILE_FIELDS = ['source', 'status', 'frames', 'video_s', 'alert_frames', 'alert_events',
+               'alert_episodes', 'elapsed_s', 'fps', 'error']
+
+
+def find_videos(paths):
+    """
+    Danh sách file video từ các đường dẫn (thư mục được duyệt đệ quy theo VIDEO_EXTENSIONS)
+    
+    Dùng chung cho batch.py và benchmark.py pipeline để hai lệnh nhận cùng một kiểu đầu vào.
+    """
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(VIDEO_EXTENSIONS):
+                        videos.append(os.path.join(root, name))
+        else:
+            videos.append(path)
+    # Bỏ file trùng (cùng file được truyền nhiều lần), giữ thứ tự
+    return list(dict.fromkeys(os.path.abspath(v) for v in videos))
+
+
+def available_memory_mb():
+    """Bộ nhớ còn dùng được của máy (MB, MemAvailable trong /proc/meminfo), None nếu không đọc được"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def plan_workers(n_tasks, threads_per_worker=BATCH_TORCH_THREADS,
+                 worker_memory_mb=BATCH_WORKER_MEMORY_MB, max_workers=None):
+    """
+    Số tiến trình xử lý theo số lõi CPU, bộ nhớ còn trống và số tác vụ
+    
+    Args:
+        n_tasks: Số tác vụ cần xử lý (file hoặc đoạn video)
+        threads_per_worker: Số luồng torch của mỗi tiến trình
+        worker_memory_mb: Bộ nhớ ước tính của mỗi tiến trình (MB)
+        max_workers: Giới hạn do người dùng đặt, None nếu không giới hạn
+    
+    Returns:
+        int: Số tiến trình (ít nhất 1)
+    """
+    workers = max(1, (os.cpu_count() or 1) // max(1, threads_per_worker))
+    memory_mb = available_memory_mb()
+    if memory_mb is not None and worker_memory_mb:
+        workers = min(workers, max(1, int(memory_mb // worker_memory_mb)))
+    if max_workers:
+        workers = min(workers, max_workers)
+    return max(1, min(workers, n_tasks))
+
+
+def summary_name(video):
+    """Tên file tóm tắt của video (tên file + băm đường dẫn tuyệt đối để không trùng giữa các thư mục)"""
+    path = os.path.abspath(video)
+    digest = hashlib.sha1(path.encode('utf-8')).hexdigest()[:10]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}_{digest}"
+
+
+def file_signature(video):
+    """(kích thước, thời điểm sửa) của file để phát hiện file đã thay đổi sau lần xử lý trước"""
+    st = os.stat(video)
+    return st.st_size, int(st.st_mtime)
+
+
+def _file_size(video):
+    """Kích thước file (byte), 0 nếu không đọc được"""
+    try:
+        return os.path.getsize(video)
+    except OSError:
+        return 0
+
+
+def write_json_atomic(path, data):
+    """Ghi JSON qua file tạm rồi đổi tên, file đích không bao giờ bị ghi dở khi bị ngắt"""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def episode_to_dict(episode):
+    """Chuyển sự kiện cảnh báo (EpisodeAggregator) thành dict có thể ghi JSON"""
+    entry = {field: episode.get(field) for field in EPISODE_FIELDS}
+    entry['bbox'] = list(episode['bbox']) if episode.get('bbox') is not None else None
+    return entry
+
+
+# Trạng thái của tiến trình xử lý (mỗi tiến trình một mô hình, dùng lại cho mọi file)
+_worker = {}
+
+
+def init_worker(model_path, threads):
+    """Khởi tạo tiến trình xử lý: giới hạn số luồng và nạp mô hình YOLO một lần (initializer của Pool)"""
+    from modules.resource_module import set_thread_counts
+    from modules.detection_module import DetectionModule
+    
+    set_thread_counts(intra_op=threads, inter_op=TORCH_INTER_OP_THREADS, opencv=threads)
+    
+    detection = DetectionModule(model_path)
+    _worker['detection'] = detection if detection.initialize() else None
+
+
+def worker_detection():
+    """DetectionModule của tiến trình xử lý hiện tại, None nếu không nạp được mô hình"""
+    return _worker.get('detection')
+
+
+def _process_video(task):
+    """
+    Chạy pipeline headless trên một video (trong tiến trình xử lý)
+    
+    Returns:
+        dict: Tóm tắt của file (thống kê, các sự kiện cảnh báo) với 'status' là 'ok' hoặc 'error'
+    """
+    video, max_frames, telemetry_path = task
+    from modules.headless_module import HeadlessRunner
+    
+    summary = {'source': video, 'status': 'error', 'worker_pid': os.getpid()}
+    try:
+        summary['size_bytes'], summary['mtime'] = file_signature(video)
+        detection = worker_detection()
+        if detection is None:
+            summary['error'] = "Không thể khởi tạo mô hình YOLO"
+            return summary
+        
+        runner = HeadlessRunner(video, max_frames=max_frames, telemetry_path=telemetry_path,
+                                detection=detection, log_events=False)
+        stats = runner.run()
+        if stats is None:
+            summary['error'] = "Không thể khởi tạo pipeline"
+            return summary
+        if stats['frames'] == 0:
+            summary['error'] = "Không đọc được khung hình nào"
+            return summary
+        
+        summary.update(stats)
+        summary['status'] = 'ok'
+        summary['video_s'] = stats['frames'] / runner.source_fps
+        summary['episodes'] = [episode_to_dict(ep) for ep in runner.episodes]
+    except Exception as e:
+        summary['error'] = str(e)
+    return summary
+
+
+def _lost_summary(video, crashes):
+    """Tóm tắt lỗi của video mà tiến trình xử lý bị dừng đột ngột (không trả về kết quả)"""
+    summary = {'source': video, 'status': 'error',
+               'error': f"Tiến trình xử lý bị dừng đột ngột {crashes} lần (hết bộ nhớ?)"}
+    try:
+        summary['size_bytes'], summary['mtime'] = file_signature(video)
+    except OSError:
+        pass
+    return summary
+
+
+class BatchProcessor:
+    """Xử lý một kho video trên nhóm tiến trình, ghi tóm tắt từng file và báo cáo gộp"""
+    
+    def __init__(self, inputs, output_dir=BATCH_OUTPUT_DIR, workers=None,
+                 threads=BATCH_TORCH_THREADS, model_path=YOLO_MODEL_PATH, max_frames=None,
+                 telemetry=False, resume=True):
+        """
+        Khởi tạo batch processor
+        
+        Args:
+            inputs: Danh sách file video hoặc thư mục (duyệt đệ quy)
+            output_dir: Thư mục ghi tóm tắt từng file và báo cáo gộp
+            workers: Số tiến trình tối đa, None để tự chọn theo số lõi và bộ nhớ
+            threads: Số luồng torch/OpenCV của mỗi tiến trình
+            model_path: Đường dẫn mô hình YOLO
+            max_frames: Số khung hình tối đa mỗi file, None nếu xử lý hết
+            telemetry: Ghi thêm file telemetry của từng video (dùng cho sweep.py)
+            resume: Bỏ qua các file đã có tóm tắt hợp lệ từ lần chạy trước
+        """
+        self.videos = find_videos(inputs)
+        self.output_dir = output_dir
+        self.summary_dir = os.path.join(output_dir, SUMMARY_DIR)
+        self.threads = max(1, threads)
+        self.max_workers = workers
+        self.model_path = model_path
+        self.max_frames = max_frames
+        self.telemetry = telemetry
+        self.resume = resume
+        self.report = {}
+    
+    def summary_path(self, video):
+        """Đường dẫn file tóm tắt của video"""
+        return os.path.join(self.summary_dir, summary_name(video) + '.json')
+    
+    def load_summary(self, video):
+        """Tóm tắt đã ghi của video, None nếu chưa có"""
+        try:
+            with open(self.summary_path(video), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def is_done(self, video):
+        """Video đã được xử lý thành công và không thay đổi kể từ đó"""
+        summary = self.load_summary(video)
+        if summary is None or summary.get('status') != 'ok':
+            return False
+        try:
+            return (summary.get('size_bytes'), summary.get('mtime')) == file_signature(video)
+        except OSError:
+            return False
+    
+    def pending(self):
+        """Các video cần xử lý, file lớn trước để các tiến trình kết thúc gần cùng lúc"""
+        videos = [v for v in self.videos if not (self.resume and self.is_done(v))]
+        return sorted(videos, key=_file_size, reverse=True)
+    
+    def _task(self, video):
+        """Tham số của tiến trình xử lý cho một video"""
+        telemetry_path = None
+        if self.telemetry:
+            telemetry_path = os.path.join(self.output_dir, TELEMETRY_SUBDIR, summary_name(video) + '.tlm')
+        return video, self.max_frames, telemetry_path
+    
+    def run(self, progress=True):
+        """
+        Xử lý các video còn lại và ghi báo cáo gộp
+        
+        Args:
+            progress: In tiến độ (số file, tốc độ, thời gian còn lại) ra stderr
+        
+        Returns:
+            dict: Báo cáo gộp (xem merge())
+        """
+        os.makedirs(self.summary_dir, exist_ok=True)
+        if self.telemetry:
+            os.makedirs(os.path.join(self.output_dir, TELEMETRY_SUBDIR), exist_ok=True)
+        
+        pending = self.pending()
+        skipped = len(self.videos) - len(pending)
+        workers = plan_workers(len(pending), self.threads, max_workers=self.max_workers) if pending else 0
+        if progress:
+            print(f"{len(self.videos)} video, {skipped} đã xử lý, {len(pending)} cần xử lý "
+                  f"trên {workers} tiến trình × {self.threads} luồng", file=sys.stderr)
+        
+        if pending:
+            total_bytes = sum(_file_size(v) for v in pending)
+            done = {'count': 0, 'bytes': 0}
+            start_time = time.time()
+            
+            def on_summary(summary):
+                write_json_atomic(self.summary_path(summary['source']), summary)
+                done['count'] += 1
+                done['bytes'] += summary.get('size_bytes') or 0
+                if progress:
+                    self._print_progress(done['count'], len(pending), summary, done['bytes'], total_bytes,
+                                         time.time() - start_time)
+            
+            tasks = [self._task(v) for v in pending]
+            crashes = {}  # Video → số lần đang chạy khi tiến trình bị dừng đột ngột
+            try:
+                while tasks:
+                    tasks, lost = self._run_tasks(tasks, workers, on_summary)
+                    if not lost:
+                        continue
+                    # Tiến trình bị dừng đột ngột (thường do hết bộ nhớ): các file đang chạy bị tính một lần,
+                    # chạy lại trên ít tiến trình hơn để biết chính xác file gây lỗi
+                    for task in lost:
+                        video = task[0]
+                        crashes[video] = crashes.get(video, 0) + 1
+                        if crashes[video] >= BATCH_MAX_WORKER_CRASHES:
+                            on_summary(_lost_summary(video, crashes[video]))
+                        else:
+                            tasks.append(task)
+                    workers = max(1, workers // 2)
+                    if progress:
+                        print(f"Tiến trình xử lý bị dừng đột ngột, chạy tiếp trên {workers} tiến trình",
+                              file=sys.stderr)
+            except KeyboardInterrupt:
+                print("Đã dừng; chạy lại cùng lệnh để tiếp tục các file còn lại", file=sys.stderr)
+                raise
+        
+        return self.merge()
+    
+    def _run_tasks(self, tasks, workers, on_summary):
+        """
+        Chạy các tác vụ trên nhóm tiến trình, mỗi tiến trình nhận một tác vụ mỗi lần
+        
+        Không dùng Pool.imap_unordered: tác vụ của tiến trình bị dừng đột ngột (vd. bị kill khi hết bộ nhớ)
+        không bao giờ trả về và lần chạy treo mãi. ProcessPoolExecutor báo BrokenProcessPool, và vì chỉ
+        giao tối đa `workers` tác vụ cùng lúc nên biết được các tác vụ đang chạy lúc đó.
+        
+        Args:
+            tasks: Danh sách tác vụ (xem _task())
+            workers: Số tiến trình
+            on_summary: Hàm gọi với tóm tắt của mỗi file xong
+        
+        Returns:
+            tuple: (tác vụ chưa giao, tác vụ đang chạy khi nhóm tiến trình hỏng), ([], []) nếu xong hết
+        """
+        remaining = list(tasks)
+        running = {}  # Future → tác vụ
+        # spawn: mỗi tiến trình tự nạp torch/mô hình, không kế thừa trạng thái luồng của tiến trình cha
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=init_worker, initargs=(self.model_path, self.threads))
+        try:
+            while remaining or running:
+                while remaining and len(running) < workers:
+                    task = remaining.pop(0)
+                    running[executor.submit(_process_video, task)] = task
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    try:
+                        summary = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        continue
+                    del running[future]
+                    on_summary(summary)
+                if broken:
+                    return remaining, list(running.values())
+            executor.shutdown()
+            return [], []
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    @staticmethod
+    def _print_progress(count, total, summary, done_bytes, total_bytes, elapsed):
+        """In tiến độ sau mỗi file (thời gian còn lại ước tính theo dung lượng đã xử lý)"""
+        name = os.path.basename(summary['source'])
+        if summary['status'] == 'ok':
+            detail = (f"{summary['frames']} khung hình, {len(summary['episodes'])} sự kiện, "
+                      f"{summary['fps']:.1f} FPS")
+        else:
+            detail = f"lỗi: {summary.get('error')}"
+        eta = ''
+        if 0 < done_bytes < total_bytes:
+            remaining = elapsed * (total_bytes - done_bytes) / done_bytes
+            eta = f", còn ~{int(remaining // 3600)}h{int(remaining % 3600 // 60):02d}m"
+        print(f"[{count}/{total}] {name}: {detail}{eta}", file=sys.stderr)
+    
+    def merge(self):
+        """
+        Gộp tóm tắt của mọi video thành báo cáo chung và ghi ra thư mục kết quả
+        
+        Returns:
+            dict: {'files', 'processed', 'failed', 'missing', 'video_hours', 'frames',
+                   'alert_events', 'alert_episodes', 'episodes_by_level', 'episodes_by_class',
+                   'episodes_per_hour', 'failures', 'per_file'}
+        """
+        summaries = []
+        missing = []
+        for video in self.videos:
+            summary = self.load_summary(video)
+            if summary is None:
+                missing.append(video)
+            else:
+                summaries.append(summary)
+        
+        ok = [s for s in summaries if s.get('status') == 'ok']
+        video_s = sum(s['video_s'] for s in ok)
+        by_level = {}
+        by_class = {}
+        for summary in ok:
+            for episode in summary['episodes']:
+                by_level[episode['max_level']] = by_level.get(episode['max_level'], 0) + 1
+                by_class[episode['class']] = by_class.get(episode['class'], 0) + 1
+        n_episodes = sum(by_level.values())
+        
+        self.report = {
+            'output_dir': self.output_dir,
+            'files': len(self.videos),
+            'processed': len(ok),
+            'failed': len(summaries) - len(ok),
+            'missing': len(missing),
+            'video_hours': video_s / 3600.0,
+            'frames': sum(s['frames'] for s in ok),
+            'alert_events': sum(s['alert_events'] for s in ok),
+            'alert_episodes': n_episodes,
+            'episodes_by_level': by_level,
+            'episodes_by_class': by_class,
+            'episodes_per_hour': n_episodes * 3600.0 / video_s if video_s > 0 else 0.0,
+            'failures': [{'source': s['source'], 'error': s.get('error')}
+                         for s in summaries if s.get('status') != 'ok'],
+            'per_file': [{field: s.get(field) for field in FILE_FIELDS} for s in summaries]
+        }
+        
+        os.makedirs(self.output_dir, exist_ok=True)
+        write_json_atomic(os.path.join(self.output_dir, REPORT_FILE), self.report)
+        self._write_csv(summaries, ok)
+        return self.report
+    
+    def _write_csv(self, summaries, ok):
+        """Ghi bảng từng file và bảng mọi sự kiện cảnh báo (kèm file nguồn) ra CSV"""
+        with open(os.path.join(self.output_dir, FILES_CSV), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=FILE_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(summaries)
+        
+        with open(os.path.join(self.output_dir, EPISODES_CSV), 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['source'] + EPISODE_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            for summary in ok:
+                for episode in summary['episodes']:
+                    writer.writerow(dict(episode, source=summary['source']))
@@ -0,0 +1,346 @@
+"""
+Module đo hiệu năng từng công đoạn trên cảnh tổng hợp (không cần camera, video hay YOLO)
+
+Cảnh tổng hợp sinh vật thể tiến lại gần với số lượng, kích thước và vận tốc cấu hình được;
+mỗi công đoạn được gọi riêng trên cùng chuỗi dữ liệu và đo bằng LatencyMonitor.
+Kết quả là JSON, so sánh được với baseline đã lưu để phát hiện hồi quy.
+"""
+
+import json
+import os
+import platform
+import time
+import cv2
+import numpy as np
+from modules.distance_module import DistanceModule
+from modules.lane_filter_module import LaneFilterModule
+from modules.latency_module import LatencyMonitor
+from modules.logger_module import LoggerModule
+from modules.motion_detection_module import MotionDetectionModule
+from modules.pipeline_module import PipelineModule
+from modules.render_module import RenderModule
+from modules.ttc_module import TTCModule
+from config.config import (
+    DETECTION_CLASSES, REAL_HEIGHTS, FOCAL_LENGTH, BENCHMARK_ITERATIONS, BENCHMARK_WARMUP,
+    BENCHMARK_TOLERANCE, BENCHMARK_MIN_DELTA_MS
+)
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# Tỷ lệ rộng/cao của bounding box theo loại vật thể
+_ASPECT_RATIOS = {'person': 0.4, 'car': 1.6, 'truck': 1.2, 'bus': 1.3, 'motorcycle': 0.8, 'bicycle': 0.8}
+# class_id của COCO (giống model.names của YOLO)
+_COCO_IDS = {'person': 0, 'bicycle': 1, 'car': 2, 'motorcycle': 3, 'bus': 5, 'truck': 7}
+
+# Các công đoạn được đo riêng
+STAGE_BENCHMARKS = ['lane_filter', 'distance', 'ttc', 'motion', 'draw_detections',
+                    'draw_status_overlay', 'display', 'pipeline']
+
+
+class SyntheticScene:
+    """Sinh chuỗi khung hình và danh sách vật thể (như DetectionModule.detect) có vật thể tiến lại gần"""
+    
+    def __init__(self, width=1280, height=720, n_objects=5, min_height=40, max_height=200,
+                 approach_speed=5.0, fps=30.0, seed=0):
+        """
+        Khởi tạo cảnh tổng hợp
+        
+        Args:
+            width, height: Kích thước khung hình (pixel)
+            n_objects: Số vật thể mỗi khung hình
+            min_height, max_height: Khoảng chiều cao bounding box ban đầu (pixel)
+            approach_speed: Vận tốc tiến lại gần trung bình (m/s)
+            fps: Số khung hình mỗi giây (bước thời gian)
+            seed: Hạt giống ngẫu nhiên (cùng tham số → cùng dữ liệu)
+        """
+        self.width = width
+        self.height = height
+        self.n_objects = n_objects
+        self.min_height = min_height
+        self.max_height = max_height
+        self.approach_speed = approach_speed
+        self.fps = fps
+        self.rng = np.random.default_rng(seed)
+        
+        # Ảnh nền cố định: bầu trời, mặt đường và nhiễu nhẹ để vẽ/chuyển đổi không quá lý tưởng
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        horizon = height // 2
+        frame[:horizon] = (200, 170, 120)
+        frame[horizon:] = (80, 80, 80)
+        noise = self.rng.integers(0, 16, size=frame.shape, dtype=np.uint8)
+        self.frame = cv2.add(frame, noise)
+        
+        self.objects = [self._spawn() for _ in range(n_objects)]
+        self.frame_index = 0
+    
+    def _spawn(self):
+        """Tạo một vật thể mới ở khoảng cách ứng với chiều cao ngẫu nhiên"""
+        class_name = DETECTION_CLASSES[int(self.rng.integers(len(DETECTION_CLASSES)))]
+        pixel_height = self.rng.uniform(self.min_height, self.max_height)
+        return {
+            'class': class_name,
+            'distance': REAL_HEIGHTS[class_name] * FOCAL_LENGTH / pixel_height,
+            'speed': self.approach_speed * self.rng.uniform(0.5, 1.5),
+            'x': self.rng.uniform(0.05, 0.95),  # Vị trí ngang (tỷ lệ chiều rộng)
+            'confidence': float(self.rng.uniform(0.4, 0.95))
+        }
+    
+    def next_detections(self):
+        """
+        Tiến một khung hình
+        
+        Returns:
+            tuple: (timestamp, danh sách vật thể với 'class', 'class_id', 'confidence', 'bbox',
+                    'pixel_height', 'pixel_width')
+        """
+        dt = 1.0 / self.fps
+        timestamp = self.frame_index * dt
+        self.frame_index += 1
+        
+        detections = []
+        horizon = self.height * 0.5
+        for i, obj in enumerate(self.objects):
+            obj['distance'] -= obj['speed'] * dt
+            if obj['distance'] < 2.0:
+                obj = self._spawn()
+                self.objects[i] = obj
+            
+            pixel_height = int(min(REAL_HEIGHTS[obj['class']] * FOCAL_LENGTH / obj['distance'], self.height - 1))
+            pixel_width = max(1, int(pixel_height * _ASPECT_RATIOS[obj['class']]))
+            # Vật thể càng gần thì đáy bounding box càng thấp trong ảnh
+            y2 = int(min(self.height - 1, horizon + pixel_height * 0.8))
+            y1 = max(0, y2 - pixel_height)
+            x1 = int(np.clip(obj['x'] * self.width - pixel_width / 2, 0, self.width - pixel_width - 1))
+            detections.append({
+                'class': obj['class'],
+                'class_id': _COCO_IDS[obj['class']],
+                'confidence': obj['confidence'],
+                'bbox': (x1, y1, x1 + pixel_width, y2),
+                'pixel_height': y2 - y1,
+                'pixel_width': pixel_width
+            })
+        return timestamp, detections
+
+
+class StubDetectionModule:
+    """Thay thế DetectionModule: lần lượt trả về các danh sách vật thể sinh sẵn, không chạy YOLO"""
+    
+    def __init__(self, detection_sequence):
+        """
+        Args:
+            detection_sequence: Danh sách các danh sách vật thể (lặp lại khi hết)
+        """
+        self.detection_sequence = detection_sequence
+        self.index = 0
+        self.model = None
+    
+    def detect(self, frame, roi=None):
+        detections = self.detection_sequence[self.index % len(self.detection_sequence)]
+        self.index += 1
+        return detections
+
+
+class StageBenchmark:
+    """Đo riêng từng công đoạn xử lý trên cảnh tổng hợp"""
+    
+    def __init__(self, object_counts=(1, 5, 20), iterations=BENCHMARK_ITERATIONS, warmup=BENCHMARK_WARMUP,
+                 stages=None, display_size=(960, 540), **scene_options):
+        """
+        Khởi tạo stage benchmark
+        
+        Args:
+            object_counts: Các số lượng vật thể mỗi khung hình cần đo
+            iterations: Số lần gọi đo mỗi công đoạn
+            warmup: Số lần gọi chạy trước khi đo (không tính)
+            stages: Danh sách công đoạn trong STAGE_BENCHMARKS, None = tất cả
+            display_size: Kích thước vùng hiển thị của giao diện (rộng, cao)
+            **scene_options: Tham số của SyntheticScene (width, height, min_height, max_height,
+                             approach_speed, fps, seed)
+        """
+        self.object_counts = list(object_counts)
+        self.iterations = iterations
+        self.warmup = warmup
+        self.stages = list(stages) if stages else list(STAGE_BENCHMARKS)
+        self.display_size = display_size
+        self.scene_options = scene_options
+        self.results = {}
+        self._frames = []
+    
+    def _prepare(self, n_objects):
+        """
+        Sinh trước đầu vào của mọi công đoạn (không tính vào thời gian đo)
+        
+        Returns:
+            tuple: (cảnh, danh sách dict đầu vào từng khung hình)
+        """
+        scene = SyntheticScene(n_objects=n_objects, **self.scene_options)
+        lane = LaneFilterModule()
+        distance = DistanceModule()
+        ttc = TTCModule()
+        frames = []
+        for _ in range(self.warmup + self.iterations):
+            timestamp, raw = scene.next_detections()
+            in_lane = lane.filter_detections(raw, scene.width, scene.height)
+            measured = distance.process_detections(in_lane)
+            processed = ttc.process_detections_with_ttc(measured, timestamp)
+            alerting = [d for d in processed if d['risk']['needs_alert'] and d['distance'] is not None]
+            closest = min(alerting, key=lambda d: d['distance']) if alerting else None
+            frames.append({
+                'timestamp': timestamp,
+                'raw': raw,
+                'in_lane': in_lane,
+                'measured': measured,
+                'processed': processed,
+                'alert_count': len(alerting),
+                'closest_distance': closest['distance'] if closest else None,
+                'closest_ttc': closest['risk'].get('ttc') if closest else None
+            })
+        return scene, frames
+    
+    def _stage_calls(self, scene, stage):
+        """Hàm gọi một công đoạn cho một khung hình (công đoạn có trạng thái dùng module mới)"""
+        width, height = scene.width, scene.height
+        image = scene.frame
+        if stage == 'lane_filter':
+            lane = LaneFilterModule()
+            return lambda f: lane.filter_detections(f['raw'], width, height)
+        if stage == 'distance':
+            distance = DistanceModule()
+            return lambda f: distance.process_detections(f['in_lane'])
+        if stage == 'ttc':
+            ttc = TTCModule()
+            return lambda f: ttc.process_detections_with_ttc(f['measured'], f['timestamp'])
+        if stage == 'motion':
+            motion = MotionDetectionModule()
+            motion.update_frame_size(width, height)
+            return lambda f: motion.calculate_movement(f['processed'])
+        if stage == 'draw_detections':
+            return lambda f: RenderModule.draw_detections(image, f['processed'])
+        if stage == 'draw_status_overlay':
+            return lambda f: RenderModule.draw_status_overlay(
+                image, fps=30, alert_count=f['alert_count'], closest_distance=f['closest_distance'],
+                status_text="Xe: DI CHUYEN", closest_ttc=f['closest_ttc'])
+        if stage == 'display':
+            display_size = self.display_size
+            if Image is None:
+                return lambda f: RenderModule.to_display_rgb(image, display_size)
+            return lambda f: Image.fromarray(RenderModule.to_display_rgb(image, display_size))
+        if stage == 'pipeline':
+            # Toàn bộ chuỗi công đoạn với bộ phát hiện giả (đo phần không phải YOLO)
+            pipeline = PipelineModule(
+                StubDetectionModule([f['raw'] for f in self._frames]),
+                DistanceModule(),
+                LaneFilterModule(),
+                LoggerModule(),
+                ttc_module=TTCModule(),
+                motion_detection=MotionDetectionModule(),
+                render=True,
+                adaptive=False
+            )
+            pipeline.start(None, threaded=False)
+            return lambda f: pipeline.process_frame(image, 0, f['timestamp'])
+        raise ValueError(f"Công đoạn không hỗ trợ: {stage}")
+    
+    def run(self):
+        """
+        Chạy toàn bộ benchmark
+        
+        Returns:
+            dict: Tên trường hợp ('công_đoạn/n=số_vật_thể') → {'p50', 'p95', 'p99', 'mean', 'max', 'count'} (ms)
+        """
+        self.results = {}
+        for n_objects in self.object_counts:
+            scene, frames = self._prepare(n_objects)
+            self._frames = frames
+            for stage in self.stages:
+                call = self._stage_calls(scene, stage)
+                monitor = LatencyMonitor(window_size=self.iterations)
+                for i, frame in enumerate(frames):
+                    start = time.perf_counter()
+                    call(frame)
+                    elapsed_ms = (time.perf_counter() - start) * 1000.0
+                    if i >= self.warmup:
+                        monitor.record(stage, elapsed_ms)
+                self.results[f"{stage}/n={n_objects}"] = monitor.get_percentiles(stage)
+        return self.results
+    
+    def report(self):
+        """Kết quả kèm thông tin môi trường (để lưu làm baseline hoặc so sánh)"""
+        return {
+            'meta': benchmark_metadata({
+                'iterations': self.iterations,
+                'warmup': self.warmup,
+                'object_counts': self.object_counts,
+                'display_size': list(self.display_size),
+                'scene': self.scene_options,
+                'pil_display': Image is not None
+            }),
+            'results': self.results
+        }
+
+
+def benchmark_metadata(extra=None):
+    """Thông tin môi trường đo (phiên bản thư viện, CPU, thời điểm)"""
+    meta = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__
+    }
+    meta.update(extra or {})
+    return meta
+
+
+def save_report(report, path):
+    """Ghi kết quả benchmark ra file JSON"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def load_report(path):
+    """Đọc file kết quả/baseline benchmark"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_to_baseline(results, baseline, tolerance=BENCHMARK_TOLERANCE, min_delta_ms=BENCHMARK_MIN_DELTA_MS,
+                        metric='p50'):
+    """
+    So sánh kết quả với baseline
+    
+    Args:
+        results: dict tên trường hợp → percentiles (ms)
+        baseline: dict cùng dạng (phần 'results' của file baseline)
+        tolerance: Tỷ lệ chậm hơn cho phép
+        min_delta_ms: Chênh lệch tuyệt đối tối thiểu để tính là hồi quy
+        metric: Chỉ số so sánh ('p50', 'p95', 'p99', 'mean')
+    
+    Returns:
+        tuple: (danh sách so sánh từng trường hợp, danh sách trường hợp hồi quy)
+    """
+    comparisons = []
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if not current or not reference:
+            continue
+        before = reference[metric]
+        after = current[metric]
+        ratio = after / before if before > 0 else float('inf')
+        regressed = ratio > 1.0 + tolerance and after - before > min_delta_ms
+        entry = {'case': name, 'metric': metric, 'baseline_ms': before, 'current_ms': after,
+                 'ratio': ratio, 'regressed': regressed}
+        comparisons.append(entry)
+        if regressed:
+            regressions.append(entry)
+    return comparisons, regressions
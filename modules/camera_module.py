@@ -5,13 +5,14 @@ Module thu nhận dữ liệu từ camera
 import cv2
 import threading
 import time
-from config.config import CAMERA_INDEX, CAMERA_WIDTH, CAMERA_HEIGHT, FPS_TARGET
+from modules.resource_module import pin_current_thread
+from config.config import CAMERA_INDEX, CAMERA_WIDTH, CAMERA_HEIGHT, FPS_TARGET, CAMERA_STOP_TIMEOUT_S
 
 
 class CameraModule:
     """Module quản lý camera và thu nhận khung hình"""
     
-    def __init__(self, camera_index=None, video_path=None, loop_video=False):
+    def __init__(self, camera_index=None, video_path=None, loop_video=False, cpu_cores=None):
         """
         Khởi tạo camera module
         
@@ -19,14 +20,20 @@ class CameraModule:
             camera_index: Chỉ số camera (mặc định 0) hoặc None nếu dùng video
             video_path: Đường dẫn đến file video hoặc None nếu dùng camera
             loop_video: Có phát lại video khi hết không (mặc định False)
+            cpu_cores: Các lõi CPU dành cho luồng thu nhận, None để không gán
         """
         self.camera_index = camera_index if camera_index is not None else CAMERA_INDEX
         self.video_path = video_path
         self.loop_video = loop_video
+        self.cpu_cores = cpu_cores
         self.cap = None
         self.is_running = False
         self.current_frame = None
         self.frame_lock = threading.Lock()
+        self.frame_cond = threading.Condition(self.frame_lock)  # Báo hiệu khi có khung hình mới
+        self._release_on_exit = False  # stop() hết thời gian chờ: luồng thu nhận tự giải phóng cap khi thoát
+        self.frame_seq = 0  # Số thứ tự khung hình, tăng mỗi lần đọc được khung hình mới
+        self.current_frame_time = None  # Thời điểm thu nhận khung hình (time.perf_counter())
         self.fps = 0
         self.last_frame_time = time.time()
         self.is_video_file = video_path is not None
@@ -67,12 +74,13 @@ class CameraModule:
                 return False
         
         self.is_running = True
-        self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self.capture_thread = threading.Thread(target=self._capture_loop, name='CameraCapture', daemon=True)
         self.capture_thread.start()
         return True
     
     def _capture_loop(self):
         """Vòng lặp thu nhận khung hình"""
+        pin_current_thread(self.cpu_cores)
         frame_count = 0
         start_time = time.time()
         last_frame_time = time.time()
@@ -93,9 +101,13 @@ class CameraModule:
                 last_frame_time = time.time()
             
             ret, frame = self.cap.read()
+            capture_time = time.perf_counter()  # Đánh dấu thời điểm thu nhận ngay khi đọc xong
             if ret:
-                with self.frame_lock:
+                with self.frame_cond:
                     self.current_frame = frame.copy()
+                    self.current_frame_time = capture_time
+                    self.frame_seq += 1
+                    self.frame_cond.notify_all()
                     frame_count += 1
                     
                     # Tính FPS
@@ -121,12 +133,20 @@ class CameraModule:
                         else:
                             # Dừng lại nếu không phát lại
                             self.is_running = False
+                            with self.frame_cond:
+                                self.frame_cond.notify_all()
                             break
                     else:
                         # Có thể là lỗi đọc, thử lại
                         time.sleep(0.01)
                 else:
                     time.sleep(0.01)
+        
+        # stop() không chờ được luồng này (cap.read() bị treo): giải phóng cap khi đọc xong
+        with self.frame_lock:
+            if self._release_on_exit and self.cap is not None:
+                self.cap.release()
+                self.cap = None
     
     def get_frame(self):
         """
@@ -140,6 +160,25 @@ class CameraModule:
                 return self.current_frame.copy()
         return None
     
+    def get_next_frame(self, last_seq, timeout=0.1):
+        """
+        Chờ và lấy khung hình mới hơn khung hình đã xử lý
+        
+        Args:
+            last_seq: Số thứ tự khung hình đã xử lý gần nhất
+            timeout: Thời gian chờ tối đa (giây)
+            
+        Returns:
+            tuple: (frame_seq, frame, capture_time) hoặc (last_seq, None, None) nếu chưa có
+                   khung hình mới. capture_time theo đồng hồ time.perf_counter().
+        """
+        with self.frame_cond:
+            if self.frame_seq == last_seq and self.is_running:
+                self.frame_cond.wait(timeout)
+            if self.current_frame is None or self.frame_seq == last_seq:
+                return last_seq, None, None
+            return self.frame_seq, self.current_frame.copy(), self.current_frame_time
+    
     def get_fps(self):
         """Lấy FPS hiện tại"""
         return self.fps
@@ -147,6 +186,20 @@ class CameraModule:
     def stop(self):
         """Dừng camera và giải phóng tài nguyên"""
         self.is_running = False
+        with self.frame_cond:
+            self.frame_cond.notify_all()
+        # Chờ luồng thu nhận thoát trước khi giải phóng cap (luồng có thể đang đọc khung hình).
+        # Chờ có giới hạn vì stop() chạy trên luồng giao diện: camera treo trong cap.read() thì để
+        # luồng thu nhận tự giải phóng cap khi thoát, không giải phóng cap đang được đọc.
+        capture_thread = getattr(self, 'capture_thread', None)
+        if capture_thread is not None and capture_thread is not threading.current_thread():
+            capture_thread.join(CAMERA_STOP_TIMEOUT_S)
+            with self.frame_lock:
+                if capture_thread.is_alive():
+                    self._release_on_exit = True
+                    print(f"Luồng thu nhận chưa dừng sau {CAMERA_STOP_TIMEOUT_S}s (camera không phản hồi), "
+                          f"giải phóng camera khi luồng thoát")
+                    return
         if self.cap is not None:
             self.cap.release()
             self.cap = None
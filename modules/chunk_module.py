@@ -0,0 +1,453 @@
+"""
+Module xử lý song song một file video dài bằng cách chia thành các đoạn thời gian chồng lấn
+
+Chỉ mục keyframe của video được dựng một lần (đọc gói tin, không giải mã) và lưu cạnh file.
+Mỗi đoạn bắt đầu giải mã từ keyframe trước ranh giới của nó CHUNK_OVERLAP_S giây: các khung hình
+chồng lấn chỉ dùng để lịch sử TTC, phát hiện chuyển động và bộ đếm liên tục ổn định, kết quả của
+chúng bị bỏ. Kết quả các đoạn được nối theo thứ tự và các sự kiện cảnh báo được dựng lại trên cả
+dòng thời gian. Track id chỉ có nghĩa trong một đoạn: khung hình cuối của mỗi đoạn cũng là khung hình
+chồng lấn cuối của đoạn sau, nên các vật thể ở khung hình đó được ghép theo IoU và track id của đoạn
+sau được đổi theo đoạn trước. Vì vậy sự kiện vắt qua ranh giới không bị tách đôi.
+"""
+
+import bisect
+import json
+import multiprocessing
+import os
+import shutil
+import time
+import cv2
+import numpy as np
+from modules.batch_module import file_signature, init_worker, plan_workers, worker_detection, write_json_atomic
+from modules.episode_module import EpisodeAggregator
+from modules.trajectory_module import iou_matrix
+from config.config import (
+    BATCH_TORCH_THREADS, CHUNK_INDEX_SUFFIX, CHUNK_MIN_SEGMENT_S, CHUNK_OVERLAP_S, FPS_TARGET, YOLO_MODEL_PATH
+)
+
+
+def index_path(video):
+    """Đường dẫn file chỉ mục keyframe của video"""
+    return video + CHUNK_INDEX_SUFFIX
+
+
+def scan_video(video):
+    """
+    Dựng chỉ mục của video: FPS, số khung hình chính xác và các keyframe
+    
+    Đọc gói tin thô qua backend FFmpeg (không giải mã) để lấy cờ keyframe; nếu backend không hỗ trợ
+    thì đếm khung hình bằng grab() và coi mọi khung hình là điểm tua được (OpenCV tự giải mã từ
+    keyframe gần nhất khi tua).
+    
+    Returns:
+        dict: {'fps', 'frames', 'keyframes' (số thứ tự khung hình, bắt đầu từ 0) hoặc None, 'method'},
+              hoặc None nếu không mở được video
+    """
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        return None
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    fps = fps if fps > 0 else FPS_TARGET
+    
+    cap = cv2.VideoCapture(video, cv2.CAP_FFMPEG)
+    keyframes = None
+    method = 'decode'
+    if cap.isOpened() and cap.set(cv2.CAP_PROP_FORMAT, -1):
+        keyframes = []
+        method = 'packets'
+    elif not cap.isOpened():
+        cap = cv2.VideoCapture(video)
+    
+    frames = 0
+    try:
+        while cap.grab():
+            if keyframes is not None and cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(frames)
+            frames += 1
+    finally:
+        cap.release()
+    return {'fps': fps, 'frames': frames, 'keyframes': keyframes, 'method': method}
+
+
+def load_index(video, rebuild=False):
+    """
+    Chỉ mục keyframe của video, đọc từ file cache nếu còn khớp với video (kích thước, thời điểm sửa)
+    
+    Args:
+        video: Đường dẫn file video
+        rebuild: Bỏ qua cache, dựng lại chỉ mục
+    
+    Returns:
+        dict: Chỉ mục (xem scan_video) hoặc None nếu không mở được video
+    """
+    path = index_path(video)
+    try:
+        signature = list(file_signature(video))
+    except OSError:
+        return None
+    
+    if not rebuild:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('signature') == signature:
+                return index
+        except (OSError, ValueError):
+            pass
+    
+    index = scan_video(video)
+    if index is None:
+        return None
+    index['signature'] = signature
+    try:
+        write_json_atomic(path, index)
+    except OSError as e:
+        # Thư mục video chỉ đọc: vẫn dùng chỉ mục vừa dựng, lần sau dựng lại
+        print(f"Lỗi ghi chỉ mục keyframe {path}: {e}")
+    return index
+
+
+def plan_segments(index, segments, overlap_s=CHUNK_OVERLAP_S, min_segment_s=CHUNK_MIN_SEGMENT_S):
+    """
+    Chia video thành các đoạn gần bằng nhau
+    
+    Args:
+        index: Chỉ mục video (load_index)
+        segments: Số đoạn mong muốn
+        overlap_s: Thời gian chồng lấn trước mỗi đoạn (giây)
+        min_segment_s: Độ dài tối thiểu mỗi đoạn (giây), giảm số đoạn nếu video ngắn
+    
+    Returns:
+        list: Mỗi đoạn là dict {'index', 'start' (khung hình bắt đầu giải mã, là keyframe),
+              'emit' (khung hình đầu tiên lấy kết quả), 'end' (không bao gồm)}
+    """
+    frames = index['frames']
+    fps = index['fps']
+    max_segments = max(1, int(frames / fps // max(min_segment_s, overlap_s, 1e-9)))
+    n = max(1, min(segments, max_segments, frames))
+    overlap = int(round(overlap_s * fps))
+    keyframes = index.get('keyframes')
+    
+    emits = [k * frames // n for k in range(n)]
+    plan = []
+    for k, emit in enumerate(emits):
+        start = max(0, emit - overlap) if k > 0 else 0
+        if keyframes:
+            # Bắt đầu giải mã tại keyframe ngay trước vùng chồng lấn (tua không phải giải mã thừa)
+            i = bisect.bisect_right(keyframes, start) - 1
+            start = keyframes[i] if i >= 0 else 0
+        end = emits[k + 1] if k + 1 < n else frames
+        plan.append({'index': k, 'start': start, 'emit': emit, 'end': end})
+    return plan
+
+
+def _compact_detection(det):
+    """Các trường của vật thể cần cảnh báo đủ để dựng lại sự kiện (EpisodeAggregator)"""
+    risk = det['risk']
+    return {
+        'track_id': det.get('track_id'),
+        'class': det.get('class', 'unknown'),
+        'confidence': det.get('confidence', 0.0),
+        'bbox': det.get('bbox'),
+        'distance': det.get('distance'),
+        'risk': {'needs_alert': True, 'level': risk.get('level', 'unknown'), 'ttc': risk.get('ttc')}
+    }
+
+
+def _frame_tracks(detections):
+    """Các vật thể có track id của một khung hình: (track id, loại, bbox), dùng để ghép track id giữa các đoạn"""
+    return [(det['track_id'], det.get('class', 'unknown'), tuple(det['bbox']))
+            for det in detections if det.get('track_id') is not None and det.get('bbox') is not None]
+
+
+def match_tracks(previous, current, min_iou=0.5):
+    """
+    Ghép các vật thể của cùng một khung hình do hai đoạn xử lý (cùng loại, IoU lớn nhất, tham lam)
+    
+    Args:
+        previous: Danh sách (track id, loại, bbox) của đoạn trước
+        current: Danh sách (track id, loại, bbox) của đoạn sau
+        min_iou: IoU tối thiểu để ghép
+    
+    Returns:
+        dict: Track id của đoạn sau → track id của đoạn trước
+    """
+    if not previous or not current:
+        return {}
+    iou = iou_matrix(np.array([t[2] for t in current], dtype=np.float64),
+                     np.array([t[2] for t in previous], dtype=np.float64))
+    same_class = np.array([[c[1] == p[1] for p in previous] for c in current])
+    iou[~same_class] = 0.0
+    matched = {}
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < min_iou:
+            break
+        matched[current[i][0]] = previous[j][0]
+        iou[i, :] = -1.0
+        iou[:, j] = -1.0
+    return matched
+
+
+def _process_segment(task):
+    """
+    Chạy pipeline trên một đoạn video (trong tiến trình xử lý)
+    
+    Returns:
+        dict: Thời điểm và quyết định cảnh báo từng khung hình của đoạn, vật thể cần cảnh báo
+              của các khung hình cảnh báo, quyết định trong vùng chồng lấn (để kiểm tra ranh giới)
+              và vật thể ở khung hình chồng lấn cuối / khung hình cuối (để ghép track id giữa các đoạn)
+    """
+    video, fps, segment, part_path = task
+    from modules.headless_module import HeadlessRunner
+    from modules.pipeline_module import result_to_dict
+    
+    output = {'index': segment['index'], 'error': None, 'frames': 0}
+    detection = worker_detection()
+    if detection is None:
+        output['error'] = "Không thể khởi tạo mô hình YOLO"
+        return output
+    runner = HeadlessRunner(video, detection=detection, log_events=False)
+    if not runner.initialize():
+        output['error'] = "Không thể khởi tạo pipeline"
+        return output
+    pipeline = runner.pipeline
+    
+    start, emit, end = segment['start'], segment['emit'], segment['end']
+    timestamps = np.empty(end - emit, dtype=np.float64)
+    should_alert = np.zeros(end - emit, dtype=bool)
+    overlap_alert = np.zeros(emit - start, dtype=bool)
+    alert_detections = {}
+    boundary_tracks = []
+    final_tracks = []
+    
+    cap = cv2.VideoCapture(video)
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    part_file = open(part_path, 'w', encoding='utf-8') if part_path else None
+    begin = time.time()
+    pipeline.start(None, threaded=False)
+    emitted = 0
+    try:
+        for frame_index in range(start, end):
+            ret, frame = cap.read()
+            capture_time = time.perf_counter()
+            if not ret:
+                break
+            result = pipeline.process_frame(frame, frame_index + 1, frame_index / fps, capture_time)
+            if frame_index < emit:
+                overlap_alert[frame_index - start] = result.should_alert
+                if frame_index == emit - 1:
+                    boundary_tracks = _frame_tracks(result.detections)
+                continue
+            
+            timestamps[emitted] = result.timestamp
+            should_alert[emitted] = result.should_alert
+            if result.should_alert:
+                alert_detections[emitted] = [_compact_detection(d) for d in result.detections
+                                             if d['risk']['needs_alert']]
+            if part_file is not None:
+                part_file.write(json.dumps(result_to_dict(result), ensure_ascii=False))
+                part_file.write('\n')
+            emitted += 1
+            if frame_index == end - 1:
+                final_tracks = _frame_tracks(result.detections)
+    finally:
+        pipeline.stop()
+        cap.release()
+        if part_file is not None:
+            part_file.close()
+    
+    if emitted < end - emit:
+        output['error'] = f"Chỉ đọc được {emitted}/{end - emit} khung hình của đoạn"
+    output.update({
+        'frames': emitted,
+        'elapsed_s': time.time() - begin,
+        'timestamps': timestamps[:emitted],
+        'should_alert': should_alert[:emitted],
+        'overlap_alert': overlap_alert,
+        'alert_detections': alert_detections,
+        'boundary_tracks': boundary_tracks,
+        'final_tracks': final_tracks
+    })
+    return output
+
+
+class ChunkedRunner:
+    """Xử lý một file video trên nhiều tiến trình theo các đoạn chồng lấn, nối kết quả thành một dòng thời gian"""
+    
+    def __init__(self, source, workers=None, segments=None, threads=BATCH_TORCH_THREADS,
+                 overlap_s=CHUNK_OVERLAP_S, min_segment_s=CHUNK_MIN_SEGMENT_S,
+                 model_path=YOLO_MODEL_PATH, output_path=None, rebuild_index=False):
+        """
+        Khởi tạo chunked runner
+        
+        Args:
+            source: Đường dẫn file video
+            workers: Số tiến trình tối đa, None để tự chọn theo số lõi và bộ nhớ
+            segments: Số đoạn, None để bằng số tiến trình
+            threads: Số luồng torch/OpenCV của mỗi tiến trình
+            overlap_s: Thời gian chồng lấn trước mỗi đoạn (giây)
+            min_segment_s: Độ dài tối thiểu mỗi đoạn (giây)
+            model_path: Đường dẫn mô hình YOLO
+            output_path: File JSONL ghi kết quả từng khung hình (đã nối), hoặc None
+            rebuild_index: Dựng lại chỉ mục keyframe dù đã có cache
+        """
+        self.source = source
+        self.max_workers = workers
+        self.segments = segments
+        self.threads = max(1, threads)
+        self.overlap_s = overlap_s
+        self.min_segment_s = min_segment_s
+        self.model_path = model_path
+        self.output_path = output_path
+        self.rebuild_index = rebuild_index
+        self.episodes = []
+        self.stats = {}
+    
+    def run(self):
+        """
+        Xử lý video và nối kết quả các đoạn
+        
+        Returns:
+            dict: Thống kê như HeadlessRunner.run() cùng số đoạn, số tiến trình, thời gian từng đoạn
+                  và kết quả kiểm tra từng ranh giới, hoặc None nếu không mở được video
+        """
+        start_time = time.time()
+        index = load_index(self.source, rebuild=self.rebuild_index)
+        if index is None or index['frames'] == 0:
+            print(f"Lỗi mở file video: {self.source}")
+            return None
+        index_s = time.time() - start_time
+        
+        segments = self.segments or plan_workers(index['frames'], self.threads, max_workers=self.max_workers)
+        plan = plan_segments(index, segments, self.overlap_s, self.min_segment_s)
+        workers = plan_workers(len(plan), self.threads, max_workers=self.max_workers)
+        tasks = [(self.source, index['fps'], segment,
+                  f"{self.output_path}.part{segment['index']:03d}" if self.output_path else None)
+                 for segment in plan]
+        
+        parts = [None] * len(plan)
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(workers, initializer=init_worker, initargs=(self.model_path, self.threads)) as pool:
+            for part in pool.imap_unordered(_process_segment, tasks):
+                parts[part['index']] = part
+            pool.close()
+            pool.join()
+        
+        errors = [f"đoạn {p['index']}: {p['error']}" for p in parts if p['error']]
+        for error in errors:
+            print(f"Lỗi xử lý {self.source}, {error}")
+        if self.output_path:
+            self._join_outputs(tasks)
+        
+        self.stats = {
+            'source': str(self.source),
+            'segments': len(plan),
+            'workers': workers,
+            'overlap_s': self.overlap_s,
+            'index_method': index['method'],
+            'index_s': index_s,
+            'errors': errors
+        }
+        self.stats.update(self._stitch(plan, parts, index['fps']))
+        elapsed = time.time() - start_time
+        self.stats['elapsed_s'] = elapsed
+        self.stats['fps'] = self.stats['frames'] / elapsed if elapsed > 0 else 0.0
+        self.stats['segment_elapsed_s'] = [p.get('elapsed_s') for p in parts]
+        return self.stats
+    
+    def _stitch(self, plan, parts, fps):
+        """Nối quyết định các đoạn theo thứ tự, dựng lại sự kiện cảnh báo và kiểm tra các ranh giới"""
+        self.episodes = []
+        aggregator = EpisodeAggregator(on_close=self.episodes.append)
+        frames = 0
+        alert_frames = 0
+        alert_events = 0
+        was_alerting = False
+        next_id = 1
+        previous = None  # Đoạn trước và bảng đổi track id của nó
+        for part in parts:
+            if part.get('timestamps') is None:
+                previous = None
+                continue
+            # Track id của đoạn → track id trên cả dòng thời gian (nối tiếp đoạn trước nếu ghép được)
+            ids = {}
+            if previous is not None:
+                prev_part, prev_ids = previous
+                for track_id, prev_id in match_tracks(prev_part['final_tracks'], part['boundary_tracks']).items():
+                    if prev_id in prev_ids:
+                        ids[track_id] = prev_ids[prev_id]
+            detections = part['alert_detections']
+            for i, (timestamp, alerting) in enumerate(zip(part['timestamps'].tolist(),
+                                                          part['should_alert'].tolist())):
+                if alerting:
+                    frame_detections = []
+                    for det in detections[i]:
+                        if det['track_id'] is not None:
+                            if det['track_id'] not in ids:
+                                ids[det['track_id']] = next_id
+                                next_id += 1
+                            det = {**det, 'track_id': ids[det['track_id']]}
+                        frame_detections.append(det)
+                    aggregator.update(frame_detections, timestamp)
+                    alert_frames += 1
+                    if not was_alerting:
+                        alert_events += 1
+                elif aggregator.episodes:
+                    # Như AlertStage: sự kiện đang mở chỉ đóng khi hết nguy hiểm quá EPISODE_GAP_S
+                    aggregator.update([], timestamp)
+                was_alerting = alerting
+            frames += part['frames']
+            for track_id, _, _ in part['final_tracks']:
+                if track_id not in ids:
+                    ids[track_id] = next_id
+                    next_id += 1
+            previous = (part, ids)
+        aggregator.close_all()
+        
+        return {
+            'frames': frames,
+            'video_s': frames / fps,
+            'alert_frames': alert_frames,
+            'alert_events': alert_events,
+            'alert_episodes': len(self.episodes),
+            'boundaries': self._check_boundaries(plan, parts, fps)
+        }
+    
+    @staticmethod
+    def _check_boundaries(plan, parts, fps):
+        """
+        So sánh quyết định cảnh báo trong vùng chồng lấn của mỗi đoạn với kết quả của đoạn trước
+        (đã hội tụ nếu giây cuối trước ranh giới trùng khớp)
+        """
+        boundaries = []
+        for segment, previous, part in zip(plan[1:], parts[:-1], parts[1:]):
+            if previous.get('should_alert') is None or part.get('overlap_alert') is None:
+                continue
+            # Vùng chồng lấn có thể bắt đầu trước đoạn trước nếu keyframe thưa: chỉ so phần chung
+            offset = segment['start'] - plan[segment['index'] - 1]['emit']
+            skip = max(0, -offset)
+            reference = previous['should_alert'][max(0, offset):]
+            warmup = part['overlap_alert'][skip:skip + len(reference)]
+            differs = reference[:len(warmup)] != warmup
+            tail = max(1, int(round(fps)))
+            boundaries.append({
+                'time_s': segment['emit'] / fps,
+                'overlap_frames': int(len(warmup)),
+                'mismatch_frames': int(differs.sum()),
+                'converged': not differs[-tail:].any()
+            })
+        return boundaries
+    
+    def _join_outputs(self, tasks):
+        """Nối các file JSONL của từng đoạn theo thứ tự thành file kết quả"""
+        with open(self.output_path, 'wb') as out:
+            for task in tasks:
+                part_path = task[3]
+                if not os.path.exists(part_path):
+                    continue
+                with open(part_path, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+                os.remove(part_path)
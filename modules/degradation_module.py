@@ -0,0 +1,193 @@
+"""
+Module tự động giảm chất lượng xử lý khi vượt ngân sách thời gian khung hình
+"""
+
+from config.config import (MAX_PROCESSING_TIME_MS, DEGRADATION_OVER_BUDGET_FRAMES,
+                          DEGRADATION_RECOVER_FRAMES, DEGRADATION_RECOVER_RATIO,
+                          DEGRADED_DISPLAY_INTERVAL, DEGRADED_INPUT_SIZE,
+                          DEGRADED_DETECT_INTERVAL)
+
+
+# Các bước giảm chất lượng (mức = số bước đang áp dụng, 0 = đầy đủ)
+DEGRADATION_LEVELS = [
+    'full',             # 0: Đầy đủ
+    'no_overlay',       # Bỏ vẽ vùng làn đường và bảng trạng thái
+    'reduced_display',  # Chỉ vẽ 1 trên DEGRADED_DISPLAY_INTERVAL khung hình
+    'small_input',      # Giảm kích thước ảnh đầu vào YOLO
+    'lane_roi_crop',    # Chỉ phát hiện trong vùng làn đường
+    'skip_frames',      # Chỉ phát hiện 1 trên DEGRADED_DETECT_INTERVAL khung hình
+]
+
+# Công đoạn mà mỗi bước giảm tải, các bước của một công đoạn áp dụng theo thứ tự trên
+DEGRADATION_STAGES = {
+    'no_overlay': 'render',
+    'reduced_display': 'render',
+    'small_input': 'detect',
+    'lane_roi_crop': 'detect',
+    'skip_frames': 'detect',
+}
+
+
+class DegradationController:
+    """Bộ điều khiển giảm tải: theo dõi thời gian xử lý và giảm tải công đoạn tốn thời gian nhất"""
+    
+    def __init__(self, pipeline, logger=None, budget_ms=MAX_PROCESSING_TIME_MS,
+                 over_budget_frames=DEGRADATION_OVER_BUDGET_FRAMES,
+                 recover_frames=DEGRADATION_RECOVER_FRAMES,
+                 recover_ratio=DEGRADATION_RECOVER_RATIO):
+        """
+        Khởi tạo degradation controller
+        
+        Args:
+            pipeline: PipelineModule cần điều khiển
+            logger: LoggerModule để ghi lại mỗi lần đổi mức, hoặc None
+            budget_ms: Ngân sách thời gian xử lý một khung hình (ms)
+            over_budget_frames: Số khung hình liên tục vượt ngân sách trước khi giảm một mức
+            recover_frames: Số khung hình liên tục dư thời gian trước khi tăng một mức
+            recover_ratio: Dư thời gian khi thời gian xử lý < recover_ratio × ngân sách
+        """
+        self.pipeline = pipeline
+        self.logger = logger
+        self.budget_ms = budget_ms
+        self.over_budget_frames = over_budget_frames
+        self.recover_frames = recover_frames
+        self.recover_ratio = recover_ratio
+        
+        self.applied = []  # Các bước đang áp dụng, theo thứ tự áp dụng
+        self.over_count = 0
+        self.headroom_count = 0
+        self.over_stage_ms = {}  # Tổng thời gian từng công đoạn trong chuỗi khung hình vượt ngân sách
+        self.level_changes = 0
+        
+        # Giá trị gốc để khôi phục khi tăng mức
+        self.detection = getattr(pipeline.get_stage('detect'), 'detection', None)
+        self.original_input_size = getattr(self.detection, 'input_size', None)
+    
+    @property
+    def level(self):
+        """Mức hiện tại: số bước giảm chất lượng đang áp dụng (0 = đầy đủ)"""
+        return len(self.applied)
+    
+    def update(self, frame_ms, stage_ms=None):
+        """
+        Cập nhật với thời gian xử lý của khung hình vừa xong
+        
+        Args:
+            frame_ms: Thời gian xử lý khung hình (ms)
+            stage_ms: Thời gian từng công đoạn của khung hình (ms), từ LatencyMonitor.last_frame_stages.
+                      None thì áp dụng các bước theo thứ tự DEGRADATION_LEVELS.
+        
+        Returns:
+            int: Mức hiện tại
+        """
+        if frame_ms > self.budget_ms:
+            self.over_count += 1
+            self.headroom_count = 0
+            for name, ms in (stage_ms or {}).items():
+                self.over_stage_ms[name] = self.over_stage_ms.get(name, 0.0) + ms
+            if self.over_count >= self.over_budget_frames:
+                step = self._next_step()
+                if step is not None:
+                    self._change(self.applied + [step], frame_ms)
+        elif frame_ms < self.budget_ms * self.recover_ratio:
+            self.headroom_count += 1
+            self.over_count = 0
+            self.over_stage_ms = {}
+            if self.headroom_count >= self.recover_frames and self.applied:
+                # Bỏ bước áp dụng gần nhất trước
+                self._change(self.applied[:-1], frame_ms)
+        else:
+            # Gần ngân sách: giữ nguyên mức
+            self.over_count = 0
+            self.headroom_count = 0
+            self.over_stage_ms = {}
+        
+        return self.level
+    
+    def _next_step(self):
+        """
+        Bước giảm chất lượng tiếp theo: bước chưa áp dụng đầu tiên của công đoạn tốn nhiều thời gian
+        nhất trong chuỗi khung hình vượt ngân sách (render → bỏ vẽ, detect → giảm ảnh đầu vào/bỏ khung hình)
+        
+        Returns:
+            str: Tên bước hoặc None nếu đã áp dụng hết
+        """
+        remaining = [step for step in DEGRADATION_LEVELS[1:] if step not in self.applied]
+        if not remaining:
+            return None
+        stages = {DEGRADATION_STAGES[step] for step in remaining}
+        timed = [stage for stage in stages if stage in self.over_stage_ms]
+        if not timed:
+            return remaining[0]
+        stage = max(timed, key=lambda name: self.over_stage_ms[name])
+        return next(step for step in remaining if DEGRADATION_STAGES[step] == stage)
+    
+    def set_level(self, level, frame_ms=None):
+        """
+        Chuyển sang mức giảm chất lượng: áp dụng `level` bước đầu tiên theo thứ tự DEGRADATION_LEVELS
+        
+        Args:
+            level: Mức mới (0 → len(DEGRADATION_LEVELS) - 1)
+            frame_ms: Thời gian xử lý gây ra thay đổi (để ghi nhật ký)
+        """
+        level = max(0, min(len(DEGRADATION_LEVELS) - 1, level))
+        self._change(DEGRADATION_LEVELS[1:level + 1], frame_ms)
+    
+    def _change(self, applied, frame_ms=None):
+        """
+        Đổi danh sách bước đang áp dụng và áp dụng cấu hình tương ứng
+        
+        Args:
+            applied: Danh sách bước mới
+            frame_ms: Thời gian xử lý gây ra thay đổi (để ghi nhật ký)
+        """
+        applied = list(applied)
+        if applied == self.applied:
+            return
+        
+        old_name = self.get_level_name()
+        stage_ms = self.over_stage_ms
+        self.applied = applied
+        self.over_count = 0
+        self.headroom_count = 0
+        self.over_stage_ms = {}
+        self.level_changes += 1
+        self.apply()
+        
+        if self.logger is not None:
+            reason = ""
+            if frame_ms is not None:
+                reason = f" (khung hình {frame_ms:.1f}ms, ngân sách {self.budget_ms}ms"
+                if stage_ms:
+                    slowest = max(stage_ms, key=stage_ms.get)
+                    reason += f", chậm nhất: {slowest}"
+                reason += ")"
+            self.logger.log_info(f"Đổi mức xử lý: {old_name} → {self.get_level_name()}{reason}")
+    
+    def apply(self):
+        """Áp dụng cấu hình của các bước đang áp dụng lên các công đoạn"""
+        applied = self.applied
+        
+        render_stage = self.pipeline.get_stage('render')
+        if render_stage is not None:
+            render_stage.draw_overlay = 'no_overlay' not in applied
+            render_stage.render_interval = DEGRADED_DISPLAY_INTERVAL if 'reduced_display' in applied else 1
+        
+        if self.detection is not None:
+            self.detection.input_size = DEGRADED_INPUT_SIZE if 'small_input' in applied else self.original_input_size
+        
+        detect_stage = self.pipeline.get_stage('detect')
+        if detect_stage is not None:
+            detect_stage.crop_to_roi = 'lane_roi_crop' in applied
+            detect_stage.detect_interval = DEGRADED_DETECT_INTERVAL if 'skip_frames' in applied else 1
+    
+    def reset(self):
+        """Trở về mức đầy đủ"""
+        self.set_level(0)
+        self.over_count = 0
+        self.headroom_count = 0
+        self.over_stage_ms = {}
+    
+    def get_level_name(self):
+        """Tên mức hiện tại (các bước đang áp dụng)"""
+        return '+'.join(self.applied) if self.applied else DEGRADATION_LEVELS[0]
@@ -4,7 +4,7 @@ Module phát hiện vật cản sử dụng YOLO
 
 from ultralytics import YOLO
 import numpy as np
-from config.config import YOLO_MODEL_PATH, YOLO_CONFIDENCE_THRESHOLD, DETECTION_CLASSES
+from config.config import YOLO_MODEL_PATH, YOLO_CONFIDENCE_THRESHOLD, DETECTION_CLASSES, YOLO_INPUT_SIZE, YOLO_DEVICE
 
 
 class DetectionModule:
@@ -21,6 +21,8 @@ class DetectionModule:
         self.model_path = model_path
         self.confidence_threshold = YOLO_CONFIDENCE_THRESHOLD
         self.detection_classes = DETECTION_CLASSES
+        self.input_size = YOLO_INPUT_SIZE  # Kích thước ảnh đầu vào của mô hình (pixel)
+        self.device = YOLO_DEVICE  # Thiết bị chạy mô hình, None để ultralytics tự chọn
         
     def initialize(self):
         """Khởi tạo mô hình YOLO"""
@@ -31,12 +33,14 @@ class DetectionModule:
             print(f"Lỗi khởi tạo mô hình YOLO: {e}")
             return False
     
-    def detect(self, frame):
+    def detect(self, frame, roi=None):
         """
         Phát hiện vật cản trong khung hình
         
         Args:
             frame: Khung hình đầu vào (numpy array)
+            roi: (x1, y1, x2, y2) chỉ phát hiện trong vùng này (tọa độ trả về vẫn
+                 theo khung hình gốc), hoặc None để dùng toàn bộ khung hình
             
         Returns:
             list: Danh sách các vật thể được phát hiện
@@ -45,8 +49,14 @@ class DetectionModule:
         if self.model is None:
             return []
         
+        offset_x, offset_y = 0, 0
+        if roi is not None:
+            offset_x, offset_y, roi_x2, roi_y2 = roi
+            frame = frame[offset_y:roi_y2, offset_x:roi_x2]
+        
         try:
-            results = self.model(frame, verbose=False, conf=self.confidence_threshold)
+            results = self.model(frame, verbose=False, conf=self.confidence_threshold,
+                                 imgsz=self.input_size, device=self.device)
             detections = []
             
             for result in results:
@@ -59,6 +69,8 @@ class DetectionModule:
                     # Chỉ lấy các lớp trong danh sách
                     if class_name in self.detection_classes:
                         x1, y1, x2, y2 = map(int, box.xyxy[0])
+                        x1, x2 = x1 + offset_x, x2 + offset_x
+                        y1, y2 = y1 + offset_y, y2 + offset_y
                         
                         detection = {
                             'class': class_name,
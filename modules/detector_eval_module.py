@@ -0,0 +1,351 @@
+"""
+Module đánh giá cấu hình bộ phát hiện (mô hình, kích thước đầu vào, ngưỡng tin cậy, backend)
+trên bộ dữ liệu có nhãn cục bộ: precision/recall từng lớp so với thời gian xử lý và bộ nhớ
+
+Bộ dữ liệu theo định dạng YOLO: ảnh trong '<gốc>/images/', nhãn cùng tên trong '<gốc>/labels/'
+(mỗi dòng 'class_id cx cy w h', tọa độ chuẩn hóa 0-1). Tên lớp lấy từ '<gốc>/classes.txt'
+nếu có, nếu không thì theo danh sách lớp của mô hình (COCO).
+
+Mỗi tổ hợp (mô hình, kích thước, backend) chạy trong một tiến trình riêng để đo RSS đỉnh độc lập;
+các ngưỡng tin cậy được đánh giá trên cùng một lần suy luận (chạy ở ngưỡng thấp nhất rồi lọc lại).
+"""
+
+import csv
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import cv2
+import numpy as np
+from config.config import (
+    DETECTION_CLASSES, EVAL_DATASET_DIR, EVAL_IOU_THRESHOLD, EVAL_WARMUP_IMAGES,
+    YOLO_MODEL_PATH, YOLO_INPUT_SIZE, YOLO_CONFIDENCE_THRESHOLD
+)
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def find_images(dataset_dir):
+    """Danh sách ảnh của bộ dữ liệu (ưu tiên thư mục images/ nếu có)"""
+    image_dir = os.path.join(dataset_dir, 'images')
+    root = image_dir if os.path.isdir(image_dir) else dataset_dir
+    images = [p for p in glob.glob(os.path.join(root, '**', '*'), recursive=True)
+              if p.lower().endswith(IMAGE_EXTENSIONS)]
+    return sorted(images)
+
+
+def label_path(image_path):
+    """Đường dẫn file nhãn YOLO của một ảnh (images/ → labels/, đuôi .txt)"""
+    base, _ = os.path.splitext(image_path)
+    parts = base.split(os.sep)
+    if 'images' in parts:
+        index = len(parts) - 1 - parts[::-1].index('images')
+        parts[index] = 'labels'
+    return os.sep.join(parts) + '.txt'
+
+
+def load_class_names(dataset_dir):
+    """Tên lớp từ classes.txt của bộ dữ liệu, None nếu không có"""
+    path = os.path.join(dataset_dir, 'classes.txt')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return {i: line.strip() for i, line in enumerate(f) if line.strip()}
+
+
+def load_ground_truth(image_path, width, height, class_names):
+    """
+    Đọc nhãn của một ảnh
+    
+    Returns:
+        list: (tên lớp, (x1, y1, x2, y2)) theo pixel, chỉ các lớp trong DETECTION_CLASSES
+    """
+    path = label_path(image_path)
+    boxes = []
+    if not os.path.exists(path):
+        return boxes
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            name = class_names.get(int(parts[0]))
+            if name not in DETECTION_CLASSES:
+                continue
+            cx, cy, w, h = (float(v) for v in parts[1:5])
+            boxes.append((name, ((cx - w / 2) * width, (cy - h / 2) * height,
+                                 (cx + w / 2) * width, (cy + h / 2) * height)))
+    return boxes
+
+
+def box_iou(box, boxes):
+    """IoU giữa một box và mảng boxes (N, 4)"""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def match_image(predictions, ground_truth, iou_threshold=EVAL_IOU_THRESHOLD):
+    """
+    Ghép phát hiện với nhãn của một ảnh (tham lam theo độ tin cậy, cùng lớp, IoU ≥ ngưỡng)
+    
+    Args:
+        predictions: Danh sách (tên lớp, độ tin cậy, bbox)
+        ground_truth: Danh sách (tên lớp, bbox)
+    
+    Returns:
+        list: (tên lớp, độ tin cậy, khớp nhãn hay không) cho mỗi phát hiện
+    """
+    matched = []
+    for name in {p[0] for p in predictions}:
+        gt_boxes = np.array([box for cls, box in ground_truth if cls == name], dtype=np.float64).reshape(-1, 4)
+        used = np.zeros(len(gt_boxes), dtype=bool)
+        for cls, confidence, bbox in sorted((p for p in predictions if p[0] == name), key=lambda p: -p[1]):
+            hit = False
+            if len(gt_boxes):
+                ious = box_iou(bbox, gt_boxes)
+                ious[used] = 0.0
+                best = int(ious.argmax())
+                if ious[best] >= iou_threshold:
+                    used[best] = True
+                    hit = True
+            matched.append((cls, confidence, hit))
+    return matched
+
+
+def _evaluate_config(task):
+    """
+    Chạy một tổ hợp (mô hình, kích thước, backend) trên toàn bộ ảnh (trong tiến trình riêng)
+    
+    Returns:
+        dict: Thời gian từng ảnh, RSS đỉnh, tên lớp của mô hình và phát hiện từng ảnh
+    """
+    model_path, input_size, device, min_confidence, images, warmup, threads = task
+    import resource
+    if threads:
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    from modules.detection_module import DetectionModule
+    
+    detection = DetectionModule(model_path)
+    detection.input_size = input_size
+    detection.device = device
+    detection.confidence_threshold = min_confidence
+    load_start = time.perf_counter()
+    if not detection.initialize():
+        return {'error': f"Không thể khởi tạo mô hình {model_path}"}
+    load_s = time.perf_counter() - load_start
+    
+    timings_ms = []
+    predictions = []
+    sizes = []
+    for i, path in enumerate(images):
+        frame = cv2.imread(path)
+        if frame is None:
+            predictions.append(None)
+            sizes.append(None)
+            continue
+        sizes.append(frame.shape[:2])
+        start = time.perf_counter()
+        detections = detection.detect(frame)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        if i >= warmup:
+            timings_ms.append(elapsed_ms)
+        predictions.append([(d['class'], d['confidence'], d['bbox']) for d in detections])
+    
+    return {
+        'load_s': load_s,
+        'timings_ms': timings_ms,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'model_names': dict(detection.model.names),
+        'predictions': predictions,
+        'sizes': sizes
+    }
+
+
+def pareto_front(rows, minimize=('ms_per_frame', 'peak_rss_mb'), maximize=('f1',)):
+    """
+    Đánh dấu các dòng không bị dòng nào khác trội hơn ở mọi tiêu chí
+    
+    Returns:
+        list: Các dòng thuộc mặt Pareto (đồng thời gán row['pareto'])
+    """
+    costs = np.array([[row[k] for k in minimize] + [-row[k] for k in maximize] for row in rows], dtype=np.float64)
+    front = []
+    for i, row in enumerate(rows):
+        dominated = np.any(np.all(costs <= costs[i], axis=1) & np.any(costs < costs[i], axis=1))
+        row['pareto'] = not dominated
+        if not dominated:
+            front.append(row)
+    return front
+
+
+class DetectorEvaluator:
+    """Quét cấu hình bộ phát hiện và lập bảng đánh đổi tốc độ/độ chính xác"""
+    
+    def __init__(self, dataset_dir=EVAL_DATASET_DIR, models=(YOLO_MODEL_PATH,), input_sizes=(YOLO_INPUT_SIZE,),
+                 confidences=(YOLO_CONFIDENCE_THRESHOLD,), devices=('cpu',), threads=None,
+                 max_images=None, iou_threshold=EVAL_IOU_THRESHOLD, warmup=EVAL_WARMUP_IMAGES):
+        """
+        Khởi tạo detector evaluator
+        
+        Args:
+            dataset_dir: Thư mục bộ dữ liệu có nhãn
+            models: Các file mô hình (.pt hoặc đã export: .onnx, .torchscript, thư mục openvino, ...)
+            input_sizes: Các kích thước ảnh đầu vào
+            confidences: Các ngưỡng tin cậy
+            devices: Các thiết bị chạy ('cpu', 'cuda:0', ...)
+            threads: Số luồng torch mỗi lần chạy, None để mặc định
+            max_images: Số ảnh tối đa, None nếu dùng hết
+            iou_threshold: IoU tối thiểu để tính là phát hiện đúng
+            warmup: Số ảnh đầu không tính vào thời gian
+        """
+        self.dataset_dir = dataset_dir
+        self.models = list(models)
+        self.input_sizes = list(input_sizes)
+        self.confidences = sorted(confidences)
+        self.devices = list(devices)
+        self.threads = threads
+        self.iou_threshold = iou_threshold
+        self.warmup = warmup
+        self.images = find_images(dataset_dir)[:max_images]
+        self.class_names = load_class_names(dataset_dir)
+        self.rows = []
+        self._ground_truth = {}  # Tên lớp → nhãn từng ảnh (chỉ đọc một lần)
+    
+    def run(self):
+        """
+        Chạy đánh giá
+        
+        Returns:
+            list: Mỗi dòng một cấu hình (mô hình, kích thước, backend, ngưỡng) với precision/recall
+                  từng lớp, ms/khung hình, RSS đỉnh và cờ 'pareto'
+        """
+        tasks = [(model, size, device, self.confidences[0], self.images, self.warmup, self.threads)
+                 for model, size, device in itertools.product(self.models, self.input_sizes, self.devices)]
+        self.rows = []
+        # Mỗi tổ hợp một tiến trình mới (RSS đỉnh không bị cộng dồn giữa các mô hình)
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for task, output in zip(tasks, pool.imap(_evaluate_config, tasks)):
+                model, size, device = task[:3]
+                if 'error' in output:
+                    print(f"Lỗi đánh giá {model} ({size}, {device}): {output['error']}")
+                    continue
+                self.rows.extend(self._score(model, size, device, output))
+        
+        if self.rows:
+            pareto_front(self.rows)
+        return self.rows
+    
+    def _load_ground_truth(self, names, sizes):
+        """Nhãn của mọi ảnh theo bảng tên lớp (cache theo bảng tên lớp)"""
+        key = tuple(sorted(names.items()))
+        if key not in self._ground_truth:
+            self._ground_truth[key] = [
+                load_ground_truth(path, size[1], size[0], names) if size is not None else []
+                for path, size in zip(self.images, sizes)
+            ]
+        return self._ground_truth[key]
+    
+    def _score(self, model, size, device, output):
+        """Tính precision/recall từng lớp cho mọi ngưỡng tin cậy từ một lần suy luận"""
+        names = self.class_names or output['model_names']
+        ground_truth = self._load_ground_truth(names, output['sizes'])
+        gt_counts = dict.fromkeys(DETECTION_CLASSES, 0)
+        matches = []
+        for predictions, labels in zip(output['predictions'], ground_truth):
+            for cls, _ in labels:
+                gt_counts[cls] += 1
+            if predictions:
+                matches.extend(match_image(predictions, labels, self.iou_threshold))
+        
+        class_index = np.array([DETECTION_CLASSES.index(m[0]) for m in matches], dtype=np.int64)
+        confidence = np.array([m[1] for m in matches], dtype=np.float64)
+        hit = np.array([m[2] for m in matches], dtype=bool)
+        gt = np.array([gt_counts[cls] for cls in DETECTION_CLASSES], dtype=np.int64)
+        timings = np.array(output['timings_ms']) if output['timings_ms'] else np.array([np.nan])
+        
+        rows = []
+        for threshold in self.confidences:
+            keep = confidence >= threshold
+            tp = np.bincount(class_index[keep & hit], minlength=len(DETECTION_CLASSES))
+            detected = np.bincount(class_index[keep], minlength=len(DETECTION_CLASSES))
+            per_class = {
+                cls: {
+                    'precision': float(tp[i] / detected[i]) if detected[i] else None,
+                    'recall': float(tp[i] / gt[i]) if gt[i] else None,
+                    'labels': int(gt[i])
+                }
+                for i, cls in enumerate(DETECTION_CLASSES)
+            }
+            precision = float(tp.sum() / detected.sum()) if detected.sum() else 0.0
+            recall = float(tp.sum() / gt.sum()) if gt.sum() else 0.0
+            rows.append({
+                'model': model,
+                'input_size': size,
+                'backend': device,
+                'confidence': threshold,
+                'precision': precision,
+                'recall': recall,
+                'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+                'ms_per_frame': float(np.nanmean(timings)),
+                'p95_ms': float(np.nanpercentile(timings, 95)),
+                'peak_rss_mb': output['peak_rss_mb'],
+                'load_s': output['load_s'],
+                'images': len(self.images),
+                'per_class': per_class
+            })
+        return rows
+    
+    def best_for_budget(self, max_ms=None, max_rss_mb=None):
+        """Cấu hình có F1 cao nhất thỏa ngân sách thời gian/bộ nhớ của một nền tảng xe"""
+        candidates = [row for row in self.rows
+                      if (max_ms is None or row['ms_per_frame'] <= max_ms) and
+                      (max_rss_mb is None or row['peak_rss_mb'] <= max_rss_mb)]
+        return max(candidates, key=lambda row: row['f1']) if candidates else None
+    
+    def format_table(self, pareto_only=True):
+        """Bảng văn bản (sắp xếp theo ms/khung hình) để in ra màn hình"""
+        rows = [row for row in self.rows if row['pareto'] or not pareto_only]
+        rows.sort(key=lambda row: row['ms_per_frame'])
+        header = f"{'mô hình':<24}{'size':>6}{'backend':>10}{'conf':>6}{'P':>7}{'R':>7}{'F1':>7}{'ms':>9}{'MB':>8}"
+        lines = [header, '-' * len(header)]
+        for row in rows:
+            lines.append(f"{os.path.basename(row['model']):<24}{row['input_size']:>6}{row['backend']:>10}"
+                         f"{row['confidence']:>6.2f}{row['precision']:>7.3f}{row['recall']:>7.3f}"
+                         f"{row['f1']:>7.3f}{row['ms_per_frame']:>9.1f}{row['peak_rss_mb']:>8.0f}")
+        return '\n'.join(lines)
+    
+    def export_json(self, output_path):
+        """Ghi toàn bộ kết quả (kèm precision/recall từng lớp) ra JSON"""
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump({'dataset': self.dataset_dir, 'images': len(self.images), 'rows': self.rows},
+                      f, ensure_ascii=False, indent=2)
+    
+    def export_csv(self, output_path):
+        """Ghi kết quả ra CSV (mỗi lớp hai cột precision/recall)"""
+        fieldnames = ['model', 'input_size', 'backend', 'confidence', 'precision', 'recall', 'f1',
+                      'ms_per_frame', 'p95_ms', 'peak_rss_mb', 'load_s', 'images', 'pareto']
+        for cls in DETECTION_CLASSES:
+            fieldnames += [f"{cls}_precision", f"{cls}_recall"]
+        with open(output_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            for row in self.rows:
+                flat = dict(row)
+                for cls, stats in row['per_class'].items():
+                    flat[f"{cls}_precision"] = stats['precision']
+                    flat[f"{cls}_recall"] = stats['recall']
+                writer.writerow(flat)
@@ -0,0 +1,110 @@
+"""
+Module gộp các khung hình cảnh báo liên tiếp của cùng một vật thể thành một sự kiện (episode)
+"""
+
+import threading
+from config.config import EPISODE_GAP_S
+
+
+# Thứ tự mức nguy hiểm để lấy mức cao nhất của sự kiện
+RISK_LEVEL_ORDER = {'unknown': 0, 'safe': 1, 'caution': 2, 'warning': 3, 'danger': 4}
+
+
+class EpisodeAggregator:
+    """Theo dõi các sự kiện cảnh báo đang mở theo track và ghi một bản tóm tắt khi sự kiện kết thúc"""
+    
+    def __init__(self, on_close, gap_s=EPISODE_GAP_S):
+        """
+        Khởi tạo episode aggregator
+        
+        Args:
+            on_close: Hàm nhận dict tóm tắt khi một sự kiện kết thúc (vd. LoggerModule.log_episode)
+            gap_s: Sự kiện kết thúc khi vật thể không còn cần cảnh báo quá số giây này
+        """
+        self.on_close = on_close
+        self.gap_s = gap_s
+        self.episodes = {}  # Khóa track → dict sự kiện đang mở
+        self.closed_count = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def get_key(det):
+        """
+        Khóa của vật thể: track id ổn định (TTCStage/TrackStage nối vật thể theo IoU giữa các khung hình,
+        nên một vật thể đang tiến gần chỉ có một sự kiện), nếu không có thì theo loại vật thể
+        """
+        track_id = det.get('track_id')
+        return track_id if track_id is not None else det.get('class', 'unknown')
+    
+    def update(self, detections, timestamp, reused=False):
+        """
+        Cập nhật các sự kiện với các vật thể cần cảnh báo của khung hình hiện tại
+        
+        Args:
+            detections: Danh sách vật thể đã xử lý (có 'risk')
+            timestamp: Thời điểm khung hình (giây)
+            reused: Kết quả phát hiện dùng lại của khung hình trước (không đếm khung hình)
+        """
+        closed = []
+        with self.lock:
+            for det in detections:
+                risk = det['risk']
+                if not risk['needs_alert']:
+                    continue
+                key = self.get_key(det)
+                episode = self.episodes.get(key)
+                if episode is None:
+                    episode = {
+                        'track_id': det.get('track_id'),
+                        'class': det.get('class', 'unknown'),
+                        'start_time': timestamp,
+                        'end_time': timestamp,
+                        'frames': 0,
+                        'min_distance': None,
+                        'min_ttc': None,
+                        'max_level': 'unknown',
+                        'max_confidence': 0.0,
+                        'bbox': det.get('bbox')
+                    }
+                    self.episodes[key] = episode
+                
+                episode['end_time'] = timestamp
+                if reused:
+                    continue
+                episode['frames'] += 1
+                distance = det.get('distance')
+                if distance is not None and (episode['min_distance'] is None or distance < episode['min_distance']):
+                    episode['min_distance'] = distance
+                    episode['bbox'] = det.get('bbox')
+                ttc = risk.get('ttc')
+                if ttc is not None and ttc > 0 and (episode['min_ttc'] is None or ttc < episode['min_ttc']):
+                    episode['min_ttc'] = ttc
+                level = risk.get('level', 'unknown')
+                if RISK_LEVEL_ORDER.get(level, 0) > RISK_LEVEL_ORDER.get(episode['max_level'], 0):
+                    episode['max_level'] = level
+                episode['max_confidence'] = max(episode['max_confidence'], det.get('confidence', 0.0))
+            
+            # Đóng các sự kiện đã lâu không được cập nhật
+            for key in [k for k, ep in self.episodes.items() if timestamp - ep['end_time'] > self.gap_s]:
+                closed.append(self.episodes.pop(key))
+        
+        self._emit(closed)
+    
+    def close_all(self):
+        """Đóng tất cả sự kiện đang mở (cảnh báo tắt, pipeline dừng hoặc bị tắt tiếng)"""
+        with self.lock:
+            closed = list(self.episodes.values())
+            self.episodes.clear()
+        self._emit(closed)
+    
+    def _emit(self, closed):
+        """Gọi on_close cho các sự kiện đã đóng (ngoài khóa)"""
+        for episode in closed:
+            episode['duration'] = episode['end_time'] - episode['start_time']
+            self.closed_count += 1
+            self.on_close(episode)
+    
+    def get_open_count(self):
+        """Số sự kiện đang mở"""
+        with self.lock:
+            return len(self.episodes)
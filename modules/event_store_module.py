@@ -0,0 +1,254 @@
+"""
+Module lưu trữ sự kiện cảnh báo trên đĩa (SQLite WAL, chỉ ghi thêm, có chỉ mục thời gian và mức độ)
+"""
+
+import csv
+import json
+import queue
+import sqlite3
+import threading
+from config.config import LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL_S
+
+
+# Các cột được lưu riêng để truy vấn/xuất, phần còn lại nằm trong cột data (JSON)
+EVENT_COLUMNS = ['id', 'ts', 'timestamp', 'kind', 'risk_level', 'class', 'track_id',
+                 'distance', 'min_ttc', 'duration', 'confidence']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    timestamp TEXT,
+    kind TEXT,
+    risk_level TEXT,
+    class TEXT,
+    track_id TEXT,
+    distance REAL,
+    min_ttc REAL,
+    duration REAL,
+    confidence REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS idx_events_level_ts ON events (risk_level, ts);
+"""
+
+_INSERT = ("INSERT INTO events (ts, timestamp, kind, risk_level, class, track_id, distance, "
+           "min_ttc, duration, confidence, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+_STOP = object()  # Báo hiệu dừng luồng ghi
+
+
+class EventStore:
+    """
+    Kho sự kiện chỉ ghi thêm, tồn tại suốt chuyến đi
+    
+    append() chỉ đưa sự kiện vào hàng đợi; luồng nền ghi theo lô trong một transaction.
+    Truy vấn và xuất dùng kết nối đọc riêng (WAL cho phép đọc song song với ghi)
+    và đọc dần từng dòng, không nạp toàn bộ vào bộ nhớ.
+    """
+    
+    def __init__(self, db_path, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL_S):
+        """
+        Args:
+            db_path: Đường dẫn file SQLite
+            batch_size: Số sự kiện tối đa mỗi transaction
+            flush_interval: Thời gian chờ tối đa trước khi ghi lô đang có (giây)
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.written = 0
+        self._thread = None
+    
+    def open(self):
+        """Tạo bảng/chỉ mục, bật WAL và khởi động luồng ghi"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+        self._thread = threading.Thread(target=self._run, name='EventStoreWriter', daemon=True)
+        self._thread.start()
+    
+    def append(self, event):
+        """
+        Thêm một sự kiện (không chặn, gọi được từ mọi luồng)
+        
+        Args:
+            event: dict có 'ts' (epoch giây) và các trường trong EVENT_COLUMNS
+        """
+        self.queue.put(event)
+    
+    def flush(self, timeout=2.0):
+        """Chờ các sự kiện đã append được ghi xuống đĩa"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+    
+    def close(self, timeout=2.0):
+        """Ghi nốt các sự kiện còn lại và dừng luồng ghi"""
+        if self._thread is None:
+            return
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+    
+    def _run(self):
+        """Vòng lặp luồng ghi: gom lô và ghi trong một transaction"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        stopping = False
+        try:
+            while not stopping:
+                try:
+                    batch = [self.queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    continue
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                
+                rows = []
+                waiters = []
+                for item in batch:
+                    if item is _STOP:
+                        stopping = True
+                    elif isinstance(item, threading.Event):
+                        waiters.append(item)
+                    else:
+                        rows.append(self._to_row(item))
+                
+                if rows:
+                    try:
+                        with conn:
+                            conn.executemany(_INSERT, rows)
+                        self.written += len(rows)
+                    except sqlite3.Error as e:
+                        print(f"Lỗi ghi kho sự kiện: {e}")
+                for waiter in waiters:
+                    waiter.set()
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _to_row(event):
+        """Chuyển dict sự kiện thành một dòng của bảng events"""
+        track_id = event.get('track_id')
+        return (
+            event['ts'],
+            event.get('timestamp'),
+            event.get('kind'),
+            event.get('risk_level'),
+            event.get('class'),
+            str(track_id) if track_id is not None else None,
+            event.get('distance'),
+            event.get('min_ttc'),
+            event.get('duration'),
+            event.get('confidence'),
+            json.dumps(event, ensure_ascii=False, default=str)
+        )
+    
+    def query(self, start=None, end=None, levels=None, kind=None, limit=None):
+        """
+        Truy vấn sự kiện theo khoảng thời gian và mức độ (đọc dần, dùng chỉ mục)
+        
+        Args:
+            start: Thời điểm bắt đầu (epoch giây), None nếu không giới hạn
+            end: Thời điểm kết thúc (epoch giây, không bao gồm), None nếu không giới hạn
+            levels: Danh sách mức nguy hiểm cần lấy, None nếu lấy tất cả
+            kind: Loại sự kiện ('episode'; 'warning' là bản ghi từng khung hình của kho cũ), None nếu lấy tất cả
+            limit: Số sự kiện tối đa
+        
+        Yields:
+            dict: Sự kiện đầy đủ (theo thứ tự thời gian)
+        """
+        where = []
+        params = []
+        if start is not None:
+            where.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("ts < ?")
+            params.append(end)
+        if levels:
+            where.append(f"risk_level IN ({', '.join('?' * len(levels))})")
+            params.extend(levels)
+        if kind is not None:
+            where.append("kind = ?")
+            params.append(kind)
+        
+        sql = "SELECT id, data FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for event_id, data in conn.execute(sql, params):
+                event = json.loads(data)
+                event['id'] = event_id
+                yield event
+        finally:
+            conn.close()
+    
+    def count(self):
+        """Tổng số sự kiện đã lưu"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        finally:
+            conn.close()
+    
+    def export_json(self, output_path, **filters):
+        """
+        Xuất sự kiện ra file JSON (mảng), ghi dần từng sự kiện
+        
+        Args:
+            output_path: Đường dẫn file output
+            **filters: Tham số của query()
+        
+        Returns:
+            int: Số sự kiện đã xuất
+        """
+        self.flush()
+        count = 0
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write('[')
+            for event in self.query(**filters):
+                f.write(',\n  ' if count else '\n  ')
+                f.write(json.dumps(event, ensure_ascii=False, default=str))
+                count += 1
+            f.write('\n]\n' if count else ']\n')
+        return count
+    
+    def export_csv(self, output_path, **filters):
+        """
+        Xuất sự kiện ra file CSV (các cột EVENT_COLUMNS), ghi dần từng sự kiện
+        
+        Args:
+            output_path: Đường dẫn file output
+            **filters: Tham số của query()
+        
+        Returns:
+            int: Số sự kiện đã xuất
+        """
+        self.flush()
+        count = 0
+        with open(output_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=EVENT_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            for event in self.query(**filters):
+                writer.writerow(event)
+                count += 1
+        return count
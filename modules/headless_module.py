@@ -0,0 +1,298 @@
+"""
+Module chạy pipeline không cần giao diện và âm thanh (server, benchmark, kiểm thử hồi quy)
+"""
+
+import json
+import time
+import cv2
+from modules.camera_module import CameraModule
+from modules.detection_module import DetectionModule
+from modules.distance_module import DistanceModule
+from modules.lane_filter_module import LaneFilterModule
+from modules.logger_module import LoggerModule
+from modules.motion_detection_module import MotionDetectionModule
+from modules.ttc_module import TTCModule
+from modules.pipeline_module import PipelineModule, result_to_dict
+from modules.telemetry_module import TelemetryRecorder
+from modules.incident_module import IncidentRecorder
+from modules.recorder_module import VideoRecorder
+from modules.speed_sensor_module import SpeedSensor
+from config.config import ENABLE_MOTION_DETECTION, ENABLE_TTC, FPS_TARGET
+
+
+class HeadlessRunner:
+    """Chạy chuỗi phát hiện → TTC → quyết định cảnh báo trên camera hoặc file video"""
+    
+    def __init__(self, source, duration=None, max_frames=None, output_path=None,
+                 video_out_path=None, realtime=False, hazard_onset=None, telemetry_path=None,
+                 detection=None, log_events=True, incident_dir=None, video_fps=None, video_size=None,
+                 video_segment_s=None, speed_source=None, resources=None):
+        """
+        Khởi tạo headless runner
+        
+        Args:
+            source: Chỉ số camera (int hoặc chuỗi số) hoặc đường dẫn file video
+            duration: Thời lượng xử lý tối đa (giây), None nếu xử lý hết nguồn.
+                      Với video offline tính theo thời gian trong video.
+            max_frames: Số khung hình tối đa, None nếu không giới hạn
+            output_path: File JSONL ghi kết quả từng khung hình, hoặc None
+            video_out_path: File video ghi khung hình đã vẽ, hoặc None
+            realtime: Đọc video theo tốc độ thực (bỏ khung hình khi xử lý chậm)
+                      thay vì xử lý tuần tự từng khung hình
+            hazard_onset: Thời điểm (giây, theo thời gian video) nguy hiểm bắt đầu xuất hiện
+                          trong clip kiểm thử, để đo độ trễ từ nguy hiểm đến cảnh báo
+            telemetry_path: File telemetry nhị phân ghi kết quả từng khung hình, hoặc None
+            detection: DetectionModule dùng chung (đã nạp mô hình thì không nạp lại), None để tạo mới
+            log_events: Ghi nhật ký và kho sự kiện trong LOG_DIR (tắt khi nhiều tiến trình chạy song song)
+            incident_dir: Thư mục ghi clip sự cố (vài giây trước và sau khi bắt đầu cảnh báo), hoặc None
+            video_fps: Tốc độ khung hình của video ghi, None để theo nguồn
+            video_size: Kích thước video ghi (rộng, cao), None để giữ kích thước khung hình
+            video_segment_s: Độ dài mỗi file video ghi (giây), None để ghi một file
+            speed_source: Nguồn vận tốc xe cho SpeedSensor ('serial:...', 'obd:...', 'udp:...', file ghi), hoặc None.
+                          Khi xử lý video offline, file ghi được nạp sẵn và khớp theo thời gian trong video.
+            resources: ResourceManager đặt số luồng torch/OpenCV và lõi CPU, hoặc None để giữ mặc định
+                       (luồng chính chạy suy luận, luồng đọc camera/video thời gian thực là 'capture')
+        """
+        self.source = source
+        self.is_camera = isinstance(source, int) or str(source).isdigit()
+        self.duration = duration
+        self.max_frames = max_frames
+        self.output_path = output_path
+        self.video_out_path = video_out_path
+        self.realtime = realtime or self.is_camera
+        self.hazard_onset = hazard_onset
+        self.telemetry_path = telemetry_path
+        self.telemetry = TelemetryRecorder() if telemetry_path else None
+        self.log_events = log_events
+        self.incident_dir = incident_dir
+        self.incidents = IncidentRecorder() if incident_dir else None
+        # Video offline cần đủ mọi khung hình nên chờ luồng ghi; thời gian thực thì bỏ khung hình
+        self.recorder = VideoRecorder(
+            fps=video_fps, frame_size=video_size, segment_s=video_segment_s,
+            policy='drop' if self.realtime else 'block'
+        ) if video_out_path else None
+        self.speed_sensor = SpeedSensor(speed_source) if speed_source else None
+        self.resources = resources
+        
+        self.logger = LoggerModule()
+        self.detection = detection if detection is not None else DetectionModule()
+        self.pipeline = None
+        self.episodes = []  # Các sự kiện cảnh báo đã đóng của lần chạy
+        self.source_fps = FPS_TARGET
+        
+        self._output_file = None
+        self.stats = {}
+    
+    def initialize(self):
+        """Khởi tạo logger, mô hình YOLO và pipeline"""
+        if self.log_events:
+            self.logger.initialize()
+        if self.detection.model is None and not self.detection.initialize():
+            return False
+        if self.resources is not None:
+            # Luồng chính chạy suy luận và các công đoạn sau; đo số luồng trên đúng các lõi này
+            self.resources.pin('inference')
+            self.resources.apply(self.detection)
+        
+        self.pipeline = PipelineModule(
+            self.detection,
+            DistanceModule(),
+            LaneFilterModule(),
+            self.logger,
+            alert=None,
+            ttc_module=TTCModule() if ENABLE_TTC else None,
+            motion_detection=MotionDetectionModule() if ENABLE_MOTION_DETECTION else None,
+            render=self.video_out_path is not None,
+            adaptive=self.realtime,
+            telemetry=self.telemetry,
+            incidents=self.incidents,
+            recorder=self.recorder,
+            speed_sensor=self.speed_sensor
+        )
+        
+        # Giữ lại các sự kiện cảnh báo của lần chạy (vẫn ghi vào logger như cũ)
+        alert_stage = self.pipeline.get_stage('alert')
+        if alert_stage is not None:
+            log_episode = alert_stage.episodes.on_close
+            
+            def on_close(episode):
+                self.episodes.append(episode)
+                log_episode(episode)
+            alert_stage.episodes.on_close = on_close
+        return True
+    
+    def run(self):
+        """
+        Chạy pipeline đến khi hết nguồn hoặc đạt giới hạn
+        
+        Returns:
+            dict: Thống kê lần chạy hoặc None nếu không khởi tạo được
+        """
+        if self.pipeline is None and not self.initialize():
+            return None
+        
+        self.episodes = []
+        self.stats = {
+            'source': str(self.source),
+            'frames': 0,
+            'alert_frames': 0,
+            'alert_events': 0,
+            'elapsed_s': 0.0,
+            'fps': 0.0
+        }
+        
+        if self.output_path:
+            self._output_file = open(self.output_path, 'w', encoding='utf-8')
+        if self.telemetry is not None:
+            self.telemetry.open(self.telemetry_path, metadata={'source': str(self.source)})
+        if self.incidents is not None:
+            self.incidents.open(self.incident_dir, metadata={'source': str(self.source)})
+        if self.speed_sensor is not None:
+            if self.speed_sensor.kind == 'file' and not self.realtime:
+                loaded = self.speed_sensor.load_log()
+            else:
+                loaded = self.speed_sensor.start()
+            if not loaded:
+                self.logger.log_error(f"Không đọc được cảm biến vận tốc: {self.speed_sensor.source}")
+        
+        if self.hazard_onset is not None:
+            self.stats['hazard_onset_s'] = self.hazard_onset
+            self.stats['hazard_alert_latency_ms'] = None
+            self.stats['alerts_before_onset'] = 0
+        
+        frames = self._realtime_frames() if self.realtime else self._offline_frames()
+        was_alerting = False
+        start_time = time.time()
+        self.pipeline.start(None, threaded=False)
+        
+        try:
+            for frame_seq, frame, timestamp, capture_time in frames:
+                if self.recorder is not None and not self.recorder.is_open:
+                    # Tốc độ khung hình của nguồn chỉ biết sau khi mở nguồn
+                    self.recorder.open(self.video_out_path, fps=self.source_fps)
+                result = self.pipeline.process_frame(frame, frame_seq, timestamp, capture_time)
+                self._handle_result(result)
+                
+                self.stats['frames'] += 1
+                if result.should_alert:
+                    self.stats['alert_frames'] += 1
+                    if not was_alerting:
+                        self.stats['alert_events'] += 1
+                        if self.hazard_onset is not None:
+                            self._record_hazard_alert(result)
+                was_alerting = result.should_alert
+                
+                if self.max_frames is not None and self.stats['frames'] >= self.max_frames:
+                    break
+        except KeyboardInterrupt:
+            self.logger.log_info("Headless runner bị dừng bởi người dùng")
+        finally:
+            self.pipeline.stop()
+            self._close_outputs()
+        
+        elapsed = time.time() - start_time
+        self.stats['elapsed_s'] = elapsed
+        if elapsed > 0:
+            self.stats['fps'] = self.stats['frames'] / elapsed
+        alert_stage = self.pipeline.get_stage('alert')
+        if alert_stage is not None:
+            self.stats['alert_episodes'] = alert_stage.episodes.closed_count
+        self.stats['latency'] = self.pipeline.get_latency_summary()
+        if self.incidents is not None:
+            self.stats['incidents'] = self.incidents.get_stats()
+        if self.recorder is not None:
+            self.stats['video'] = self.recorder.get_stats()
+        if self.speed_sensor is not None:
+            self.stats['speed'] = self.speed_sensor.get_stats()
+        if self.resources is not None:
+            self.stats['resources'] = self.resources.get_stats()
+        return self.stats
+    
+    def _record_hazard_alert(self, result):
+        """
+        Ghi độ trễ từ lúc nguy hiểm xuất hiện trong clip đến lúc bắt đầu cảnh báo:
+        thời gian video từ nguy hiểm đến khung hình cảnh báo + độ trễ xử lý khung hình đó
+        """
+        if result.timestamp < self.hazard_onset:
+            self.stats['alerts_before_onset'] += 1
+            return
+        if self.stats['hazard_alert_latency_ms'] is not None:
+            return
+        
+        processing_ms = result.alert_latency_ms or 0.0
+        self.stats['hazard_alert_latency_ms'] = (result.timestamp - self.hazard_onset) * 1000.0 + processing_ms
+        self.stats['hazard_alert_frame'] = result.frame_seq
+    
+    def _offline_frames(self):
+        """Đọc tuần tự từng khung hình của file video, thời gian lấy theo video"""
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            self.logger.log_error(f"Không thể mở file video: {self.source}")
+            return
+        
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.source_fps = fps if fps > 0 else FPS_TARGET
+        
+        frame_seq = 0
+        try:
+            while True:
+                ret, frame = cap.read()
+                capture_time = time.perf_counter()
+                if not ret:
+                    break
+                timestamp = frame_seq / self.source_fps
+                if self.duration is not None and timestamp >= self.duration:
+                    break
+                frame_seq += 1
+                yield frame_seq, frame, timestamp, capture_time
+        finally:
+            cap.release()
+    
+    def _realtime_frames(self):
+        """Đọc khung hình mới nhất từ CameraModule theo thời gian thực"""
+        cpu_cores = self.resources.cores('capture') if self.resources is not None else None
+        if self.is_camera:
+            camera = CameraModule(camera_index=int(self.source), cpu_cores=cpu_cores)
+        else:
+            camera = CameraModule(video_path=self.source, cpu_cores=cpu_cores)
+        
+        if not camera.start():
+            self.logger.log_error(f"Không thể mở nguồn: {self.source}")
+            return
+        if camera.video_fps > 0:
+            self.source_fps = camera.video_fps
+        
+        start_time = time.time()
+        last_seq = 0
+        try:
+            while camera.is_running:
+                if self.duration is not None and time.time() - start_time >= self.duration:
+                    break
+                frame_seq, frame, capture_time = camera.get_next_frame(last_seq, timeout=0.1)
+                if frame is None:
+                    continue
+                last_seq = frame_seq
+                timestamp = time.time() - (time.perf_counter() - capture_time)
+                yield frame_seq, frame, timestamp, capture_time
+        finally:
+            camera.stop()
+    
+    def _handle_result(self, result):
+        """Ghi kết quả khung hình ra JSONL (nếu bật)"""
+        if self._output_file is not None:
+            self._output_file.write(json.dumps(result_to_dict(result), ensure_ascii=False))
+            self._output_file.write('\n')
+    
+    def _close_outputs(self):
+        """Đóng các file output"""
+        if self._output_file is not None:
+            self._output_file.close()
+            self._output_file = None
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.speed_sensor is not None:
+            self.speed_sensor.stop()
+        if self.telemetry is not None:
+            self.telemetry.close()
+        if self.incidents is not None:
+            self.incidents.close()
@@ -0,0 +1,342 @@
+"""
+Module ghi clip sự cố: vùng đệm vòng các khung hình gần nhất (nén JPEG) và ghi clip khi bắt đầu cảnh báo
+
+Luồng pipeline chỉ đưa tham chiếu khung hình cùng thông tin rủi ro vào hàng đợi có giới hạn
+(đầy thì bỏ khung hình, không bao giờ chờ). Luồng nén thu nhỏ và nén JPEG rồi giữ trong vùng đệm
+vòng INCIDENT_PRE_S giây (giới hạn thêm theo dung lượng). Khi bắt đầu cảnh báo, vùng đệm cùng
+INCIDENT_POST_S giây tiếp theo được gom thành một sự cố và luồng ghi giải nén, vẽ thông tin rủi ro
+từng khung hình và ghi ra file video kèm file JSON mô tả.
+
+Bộ nhớ cố định theo độ dài chuyến đi: vùng đệm, clip đang gom và các clip chờ ghi
+(INCIDENT_MAX_PENDING_CLIPS) đều bị giới hạn bởi INCIDENT_BUFFER_MAX_BYTES.
+"""
+
+import json
+import os
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+import cv2
+from modules.render_module import RenderModule
+from config.config import (
+    INCIDENT_PRE_S, INCIDENT_POST_S, INCIDENT_MAX_CLIP_S, INCIDENT_FRAME_WIDTH, INCIDENT_JPEG_QUALITY,
+    INCIDENT_BUFFER_MAX_BYTES, INCIDENT_QUEUE_SIZE, INCIDENT_MAX_PENDING_CLIPS, FPS_TARGET
+)
+
+
+_STOP = object()  # Báo hiệu dừng luồng nén/ghi
+
+
+def _frame_info(ctx):
+    """Thông tin rủi ro của khung hình cần để vẽ lại lên clip (không giữ tham chiếu tới context)"""
+    detections = []
+    for det in ctx.detections:
+        risk = det.get('risk')
+        if risk is None:
+            continue
+        detections.append({
+            'bbox': tuple(det['bbox']),
+            'class': det.get('class', 'unknown'),
+            'confidence': det.get('confidence', 0.0),
+            'distance': det.get('distance'),
+            'risk': {'level': risk.get('level'), 'color': risk.get('color', (0, 255, 0)),
+                     'needs_alert': risk.get('needs_alert', False), 'ttc': risk.get('ttc')}
+        })
+    return {
+        'timestamp': ctx.timestamp,
+        'frame_seq': ctx.frame_seq,
+        'should_alert': ctx.should_alert,
+        'alert_count': ctx.alert_count,
+        'closest_distance': ctx.closest_distance,
+        'closest_ttc': ctx.closest_ttc,
+        'detections': detections
+    }
+
+
+class IncidentRecorder:
+    """Giữ các giây gần nhất dạng JPEG trong bộ nhớ và ghi clip sự cố khi cảnh báo bắt đầu"""
+    
+    def __init__(self, pre_s=INCIDENT_PRE_S, post_s=INCIDENT_POST_S, max_clip_s=INCIDENT_MAX_CLIP_S,
+                 frame_width=INCIDENT_FRAME_WIDTH, jpeg_quality=INCIDENT_JPEG_QUALITY,
+                 max_bytes=INCIDENT_BUFFER_MAX_BYTES, queue_size=INCIDENT_QUEUE_SIZE,
+                 max_pending_clips=INCIDENT_MAX_PENDING_CLIPS):
+        """
+        Args:
+            pre_s: Số giây giữ trước lúc bắt đầu cảnh báo
+            post_s: Số giây ghi tiếp sau lần bắt đầu cảnh báo gần nhất
+            max_clip_s: Độ dài tối đa một clip (giây)
+            frame_width: Chiều rộng khung hình lưu (pixel), không phóng to khung hình nhỏ hơn
+            jpeg_quality: Chất lượng JPEG (0-100)
+            max_bytes: Dung lượng tối đa của vùng đệm và của mỗi clip (byte)
+            queue_size: Số khung hình chờ nén tối đa
+            max_pending_clips: Số clip chờ ghi ra đĩa tối đa
+        """
+        self.pre_s = pre_s
+        self.post_s = post_s
+        self.max_clip_s = max_clip_s
+        self.frame_width = frame_width
+        self.jpeg_quality = jpeg_quality
+        self.max_bytes = max_bytes
+        self.queue_size = queue_size
+        self.max_pending_clips = max_pending_clips
+        
+        self.output_dir = None
+        self.metadata = {}
+        self.frames_encoded = 0
+        self.frames_dropped = 0  # Khung hình bị bỏ vì hàng đợi nén đầy
+        self.clips_written = 0
+        self.clips_dropped = 0  # Clip bị bỏ vì luồng ghi chưa kịp ghi các clip trước
+        self.clip_paths = []
+        self._frame_queue = None
+        self._clip_queue = None
+        self._encoder = None
+        self._writer = None
+        
+        # Chỉ luồng nén truy cập các trường dưới đây
+        self._buffer = deque()  # (thông tin khung hình, JPEG)
+        self._buffer_bytes = 0
+        self._incident = None  # Sự cố đang gom
+        self._was_alerting = False
+        self._last_clip_end = float('-inf')  # Thời điểm khung hình cuối của clip trước
+        self._clip_index = 0
+    
+    @property
+    def is_open(self):
+        return self._frame_queue is not None
+    
+    def open(self, output_dir, metadata=None):
+        """
+        Bắt đầu một phiên ghi (khởi động luồng nén và luồng ghi)
+        
+        Args:
+            output_dir: Thư mục lưu clip sự cố
+            metadata: dict ghi kèm vào file mô tả mỗi clip (nguồn video, ...)
+        """
+        if self.is_open:
+            self.close()
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.metadata = metadata or {}
+        self._buffer.clear()
+        self._buffer_bytes = 0
+        self._incident = None
+        self._was_alerting = False
+        self._last_clip_end = float('-inf')
+        
+        self._frame_queue = queue.Queue(maxsize=self.queue_size)
+        self._clip_queue = queue.Queue(maxsize=self.max_pending_clips)
+        self._encoder = threading.Thread(target=self._encode_loop, name='IncidentEncoder', daemon=True)
+        self._writer = threading.Thread(target=self._write_loop, name='IncidentWriter', daemon=True)
+        self._encoder.start()
+        self._writer.start()
+    
+    def record(self, ctx):
+        """
+        Đưa khung hình vào hàng đợi nén (gọi trên luồng pipeline, không bao giờ chờ)
+        
+        Args:
+            ctx: FrameContext đã qua các công đoạn quyết định
+        """
+        if not self.is_open:
+            return
+        try:
+            self._frame_queue.put_nowait((ctx.frame, _frame_info(ctx)))
+        except queue.Full:
+            self.frames_dropped += 1
+    
+    def close(self, timeout=10.0):
+        """Ghi sự cố đang gom (nếu có), chờ các luồng kết thúc"""
+        if not self.is_open:
+            return
+        self._frame_queue.put(_STOP)
+        self._encoder.join(timeout)
+        self._clip_queue.put(_STOP)
+        self._writer.join(timeout)
+        self._frame_queue = None
+        self._clip_queue = None
+        self._encoder = None
+        self._writer = None
+        self._buffer.clear()
+        self._buffer_bytes = 0
+    
+    def get_stats(self):
+        """Thống kê phiên ghi"""
+        return {
+            'frames_encoded': self.frames_encoded,
+            'frames_dropped': self.frames_dropped,
+            'buffered_frames': len(self._buffer),
+            'buffer_bytes': self._buffer_bytes,
+            'clips_written': self.clips_written,
+            'clips_dropped': self.clips_dropped,
+            'clips': list(self.clip_paths)
+        }
+    
+    def _encode_loop(self):
+        """Luồng nén: thu nhỏ, nén JPEG, cập nhật vùng đệm và sự cố đang gom"""
+        while True:
+            item = self._frame_queue.get()
+            if item is _STOP:
+                break
+            frame, info = item
+            try:
+                entry = self._encode(frame, info)
+            except Exception as e:
+                print(f"Lỗi nén khung hình sự cố: {e}")
+                continue
+            self._add_to_buffer(entry)
+            self._update_incident(entry)
+        
+        if self._incident is not None:
+            # Khi dừng, chờ luồng ghi thay vì bỏ clip cuối
+            self._finish_incident(block=True)
+    
+    def _encode(self, frame, info):
+        """Thu nhỏ và nén JPEG một khung hình, đổi tọa độ bounding box theo tỷ lệ thu nhỏ"""
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.frame_width / float(w))
+        if scale < 1.0:
+            frame = cv2.resize(frame, (int(round(w * scale)), int(round(h * scale))),
+                               interpolation=cv2.INTER_AREA)
+            for det in info['detections']:
+                det['bbox'] = tuple(int(round(v * scale)) for v in det['bbox'])
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("cv2.imencode thất bại")
+        self.frames_encoded += 1
+        return info, jpeg
+    
+    def _add_to_buffer(self, entry):
+        """Thêm vào vùng đệm vòng, bỏ khung hình cũ hơn pre_s giây hoặc vượt dung lượng"""
+        self._buffer.append(entry)
+        self._buffer_bytes += entry[1].nbytes
+        now = entry[0]['timestamp']
+        while self._buffer and (now - self._buffer[0][0]['timestamp'] > self.pre_s or
+                                self._buffer_bytes > self.max_bytes):
+            self._buffer_bytes -= self._buffer.popleft()[1].nbytes
+    
+    def _update_incident(self, entry):
+        """Bắt đầu, kéo dài hoặc kết thúc sự cố theo quyết định cảnh báo của khung hình"""
+        info = entry[0]
+        timestamp = info['timestamp']
+        starts_alert = info['should_alert'] and not self._was_alerting
+        self._was_alerting = info['should_alert']
+        
+        incident = self._incident
+        if incident is None:
+            if starts_alert:
+                # Vùng đệm đã gồm khung hình hiện tại; bỏ các khung hình đã nằm trong clip trước
+                frames = [e for e in self._buffer if e[0]['timestamp'] > self._last_clip_end]
+                self._start_incident(timestamp, frames, sum(e[1].nbytes for e in frames))
+            return
+        
+        incident['frames'].append(entry)
+        incident['bytes'] += entry[1].nbytes
+        if starts_alert:
+            incident['triggers'].append(timestamp)
+            incident['end_time'] = timestamp + self.post_s
+        too_long = (timestamp - incident['frames'][0][0]['timestamp'] >= self.max_clip_s or
+                    incident['bytes'] > self.max_bytes)
+        if timestamp >= incident['end_time'] or too_long:
+            self._finish_incident()
+            if too_long and info['should_alert']:
+                # Cảnh báo vẫn tiếp diễn: clip tiếp theo nối tiếp từ khung hình này
+                self._start_incident(timestamp, [entry], entry[1].nbytes)
+    
+    def _start_incident(self, timestamp, frames, nbytes):
+        """Mở sự cố mới bắt đầu cảnh báo tại timestamp"""
+        self._incident = {
+            'trigger_time': timestamp,
+            'triggers': [timestamp],
+            'end_time': timestamp + self.post_s,
+            'frames': frames,
+            'bytes': nbytes
+        }
+    
+    def _finish_incident(self, block=False):
+        """Chuyển sự cố đã gom đủ cho luồng ghi (bỏ nếu luồng ghi còn nhiều clip chưa ghi)"""
+        incident = self._incident
+        self._incident = None
+        self._last_clip_end = incident['frames'][-1][0]['timestamp']
+        try:
+            self._clip_queue.put(incident, block=block)
+        except queue.Full:
+            self.clips_dropped += 1
+    
+    def _write_loop(self):
+        """Luồng ghi: giải nén, vẽ thông tin rủi ro và ghi clip ra file video"""
+        while True:
+            incident = self._clip_queue.get()
+            if incident is _STOP:
+                break
+            try:
+                self._write_clip(incident)
+            except Exception as e:
+                print(f"Lỗi ghi clip sự cố: {e}")
+    
+    def _clip_name(self, incident):
+        """Tên file clip theo thời điểm bắt đầu cảnh báo"""
+        self._clip_index += 1
+        trigger = incident['trigger_time']
+        if trigger > 1e9:  # Thời gian thực (time.time()), ngược lại là thời gian trong video
+            label = datetime.fromtimestamp(trigger).strftime('%Y%m%d_%H%M%S')
+        else:
+            label = f"t{trigger:09.2f}s".replace('.', '_')
+        return f"incident_{label}_{self._clip_index:03d}"
+    
+    def _write_clip(self, incident):
+        """Ghi một clip sự cố và file JSON mô tả từng khung hình"""
+        frames = incident['frames']
+        if not frames:
+            return
+        first_t = frames[0][0]['timestamp']
+        span = frames[-1][0]['timestamp'] - first_t
+        fps = (len(frames) - 1) / span if span > 0 else FPS_TARGET
+        
+        name = self._clip_name(incident)
+        path = os.path.join(self.output_dir, name + '.mp4')
+        writer = None
+        try:
+            for info, jpeg in frames:
+                image = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+                if writer is None:
+                    h, w = image.shape[:2]
+                    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+                writer.write(self._draw(image, info, incident['trigger_time']))
+        finally:
+            if writer is not None:
+                writer.release()
+        
+        description = {
+            'clip': os.path.basename(path),
+            'trigger_time': incident['trigger_time'],
+            'alert_starts': incident['triggers'],
+            'start_time': first_t,
+            'end_time': frames[-1][0]['timestamp'],
+            'fps': fps,
+            'metadata': self.metadata,
+            'frames': [{key: info[key] for key in ('timestamp', 'frame_seq', 'should_alert', 'alert_count',
+                                                   'closest_distance', 'closest_ttc')}
+                       for info, _ in frames]
+        }
+        with open(os.path.join(self.output_dir, name + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(description, f, ensure_ascii=False, indent=2, default=float)
+        self.clip_paths.append(path)
+        self.clips_written += 1
+    
+    @staticmethod
+    def _draw(image, info, trigger_time):
+        """Vẽ bounding box theo mức rủi ro, thời điểm so với lúc cảnh báo và viền đỏ khi đang cảnh báo"""
+        image = RenderModule.draw_detections(image, info['detections'])
+        offset = info['timestamp'] - trigger_time
+        image = RenderModule.draw_status_overlay(
+            image,
+            alert_count=info['alert_count'],
+            closest_distance=info['closest_distance'],
+            closest_ttc=info['closest_ttc'],
+            status_text=f"Su co T{offset:+.1f}s"
+        )
+        if info['should_alert']:
+            h, w = image.shape[:2]
+            cv2.rectangle(image, (0, 0), (w - 1, h - 1), (0, 0, 255), 6)
+        return image
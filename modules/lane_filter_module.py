@@ -83,6 +83,21 @@ class LaneFilterModule:
         
         return filtered
     
+    def get_roi_bounds(self, frame_width, frame_height):
+        """
+        Lấy vùng chữ nhật chứa làn đường trước mặt
+        
+        Args:
+            frame_width: Chiều rộng khung hình
+            frame_height: Chiều cao khung hình
+            
+        Returns:
+            tuple: (x1, y1, x2, y2) theo pixel
+        """
+        left_bound = int(frame_width * self.left_margin)
+        right_bound = int(frame_width * (1 - self.right_margin))
+        return (left_bound, 0, right_bound, frame_height)
+    
     def draw_lane_roi(self, frame):
         """
         Vẽ vùng ROI (làn đường) lên khung hình
@@ -0,0 +1,199 @@
+"""
+Module đo độ trễ từng công đoạn và kiểm soát ngân sách thời gian xử lý khung hình
+"""
+
+import threading
+import time
+from collections import deque
+import numpy as np
+from config.config import MAX_PROCESSING_TIME_MS, LATENCY_WINDOW_SIZE
+
+
+# Thứ tự hiển thị các công đoạn
+STAGE_ORDER = ['capture', 'capture_wait', 'detect', 'lane_filter', 'distance', 'track', 'ttc', 'motion',
+               'decision', 'alert', 'render', 'display', 'total',
+               'glass_to_alarm', 'trigger_to_sound', 'glass_to_display']
+
+
+class LatencyMonitor:
+    """Thu thập độ trễ theo công đoạn, tính p50/p95/p99 trên cửa sổ trượt"""
+    
+    def __init__(self, window_size=LATENCY_WINDOW_SIZE, budget_ms=MAX_PROCESSING_TIME_MS):
+        """
+        Khởi tạo latency monitor
+        
+        Args:
+            window_size: Số mẫu gần nhất giữ lại cho mỗi công đoạn
+            budget_ms: Ngân sách thời gian xử lý một khung hình (ms)
+        """
+        self.window_size = window_size
+        self.budget_ms = budget_ms
+        self.samples = {}  # Tên công đoạn → deque các mẫu (ms)
+        self.frame_count = 0
+        self.overrun_count = 0  # Số khung hình vượt ngân sách
+        self.last_frame_ms = 0.0
+        self.last_frame_stages = {}  # Thời gian từng công đoạn của khung hình gần nhất (ms)
+        self._frame_stages = {}  # Thời gian từng công đoạn của khung hình đang xử lý (ms)
+        self.lock = threading.Lock()
+    
+    def record(self, stage_name, elapsed_ms):
+        """
+        Ghi một mẫu độ trễ
+        
+        Args:
+            stage_name: Tên công đoạn
+            elapsed_ms: Thời gian (ms)
+        """
+        with self.lock:
+            samples = self.samples.get(stage_name)
+            if samples is None:
+                samples = deque(maxlen=self.window_size)
+                self.samples[stage_name] = samples
+            samples.append(elapsed_ms)
+    
+    def stage_hook(self, stage_name, seconds, ctx):
+        """Hook dùng với PipelineModule.add_timing_hook"""
+        self.record(stage_name, seconds * 1000.0)
+        with self.lock:
+            self._frame_stages[stage_name] = seconds * 1000.0
+    
+    def record_frame(self, total_ms):
+        """
+        Ghi tổng thời gian xử lý một khung hình và đếm số lần vượt ngân sách
+        
+        Thời gian từng công đoạn của khung hình (stage_hook) chuyển vào last_frame_stages.
+        
+        Args:
+            total_ms: Tổng thời gian xử lý (ms)
+        
+        Returns:
+            bool: True nếu vượt ngân sách
+        """
+        self.record('total', total_ms)
+        over_budget = total_ms > self.budget_ms
+        with self.lock:
+            self.frame_count += 1
+            self.last_frame_ms = total_ms
+            self.last_frame_stages = self._frame_stages
+            self._frame_stages = {}
+            if over_budget:
+                self.overrun_count += 1
+        return over_budget
+    
+    def get_percentiles(self, stage_name):
+        """
+        Tính p50/p95/p99 của một công đoạn
+        
+        Returns:
+            dict: {'p50', 'p95', 'p99', 'mean', 'max', 'count'} (ms) hoặc None nếu chưa có mẫu
+        """
+        with self.lock:
+            samples = self.samples.get(stage_name)
+            if not samples:
+                return None
+            values = np.fromiter(samples, dtype=np.float64, count=len(samples))
+        
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {
+            'p50': float(p50),
+            'p95': float(p95),
+            'p99': float(p99),
+            'mean': float(values.mean()),
+            'max': float(values.max()),
+            'count': int(values.size)
+        }
+    
+    def get_histogram(self, stage_name, bucket_ms=10.0, max_ms=500.0):
+        """
+        Tạo histogram độ trễ của một công đoạn
+        
+        Args:
+            stage_name: Tên công đoạn
+            bucket_ms: Độ rộng mỗi khoảng (ms)
+            max_ms: Giới hạn trên; các mẫu lớn hơn được gộp vào khoảng cuối
+            
+        Returns:
+            list: [(cận dưới ms, số mẫu), ...] hoặc [] nếu chưa có mẫu
+        """
+        with self.lock:
+            samples = self.samples.get(stage_name)
+            if not samples:
+                return []
+            values = np.fromiter(samples, dtype=np.float64, count=len(samples))
+        
+        edges = np.arange(0.0, max_ms + bucket_ms, bucket_ms)
+        counts, _ = np.histogram(np.clip(values, 0.0, max_ms - 1e-9), bins=edges)
+        return [(float(edge), int(count)) for edge, count in zip(edges[:-1], counts)]
+    
+    def get_summary(self):
+        """
+        Lấy thống kê độ trễ của tất cả công đoạn
+        
+        Returns:
+            dict: {'stages': {tên: percentiles}, 'frames', 'overruns', 'overrun_ratio', 'budget_ms'}
+        """
+        with self.lock:
+            names = list(self.samples.keys())
+            frame_count = self.frame_count
+            overrun_count = self.overrun_count
+        
+        names.sort(key=lambda n: STAGE_ORDER.index(n) if n in STAGE_ORDER else len(STAGE_ORDER))
+        stages = {}
+        for name in names:
+            stats = self.get_percentiles(name)
+            if stats is not None:
+                stages[name] = stats
+        
+        return {
+            'stages': stages,
+            'frames': frame_count,
+            'overruns': overrun_count,
+            'overrun_ratio': overrun_count / frame_count if frame_count else 0.0,
+            'budget_ms': self.budget_ms
+        }
+    
+    def format_lines(self):
+        """
+        Tạo các dòng văn bản mô tả độ trễ (dùng cho giao diện hoặc console)
+        
+        Returns:
+            list: Danh sách chuỗi, mỗi công đoạn một dòng
+        """
+        summary = self.get_summary()
+        lines = []
+        for name, stats in summary['stages'].items():
+            lines.append(
+                f"{name:<13} p50 {stats['p50']:6.1f}  p95 {stats['p95']:6.1f}  p99 {stats['p99']:6.1f} ms"
+            )
+        lines.append(
+            f"Vượt ngân sách {summary['budget_ms']} ms: {summary['overruns']}/{summary['frames']}"
+        )
+        return lines
+    
+    def clear(self):
+        """Xóa tất cả mẫu"""
+        with self.lock:
+            self.samples.clear()
+            self.frame_count = 0
+            self.overrun_count = 0
+            self.last_frame_ms = 0.0
+            self.last_frame_stages = {}
+            self._frame_stages = {}
+
+
+class StageTimer:
+    """Context manager đo thời gian một đoạn code và ghi vào LatencyMonitor"""
+    
+    def __init__(self, monitor, stage_name):
+        self.monitor = monitor
+        self.stage_name = stage_name
+        self.start = 0.0
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if self.monitor is not None:
+            self.monitor.record(self.stage_name, (time.perf_counter() - self.start) * 1000.0)
+        return False
@@ -2,13 +2,376 @@
 Module ghi nhật ký cảnh báo và sự kiện hệ thống
 """
 
+import atexit
+import gzip
 import logging
+import logging.handlers
 import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from collections import deque
 from datetime import datetime
-from config.config import LOG_DIR, LOG_FILE, LOG_FORMAT, LOG_DATE_FORMAT
+from modules.event_store_module import EventStore
+from config.config import (LOG_DIR, LOG_FILE, LOG_FORMAT, LOG_DATE_FORMAT,
+                          LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL_S, LOG_QUEUE_MAX_SIZE,
+                          LOG_MEMORY_MAX_ENTRIES, ENABLE_EVENT_STORE, EVENT_DB_FILE,
+                          LOG_MAX_BYTES, LOG_MAX_AGE_S, LOG_COMPRESS_ROTATED, LOG_RETENTION_BYTES)
 import json
 
 
+_STOP = object()  # Báo hiệu dừng luồng ghi
+
+
+class _NonFormattingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler chỉ đưa bản ghi vào hàng đợi, việc định dạng để luồng ghi làm"""
+    
+    def __init__(self, writer):
+        super().__init__(writer.queue)
+        self.writer = writer
+    
+    def prepare(self, record):
+        return record
+    
+    def enqueue(self, record):
+        self.writer.put(record)
+
+
+class LogRotator:
+    """
+    Quản lý các phân đoạn nhật ký đã xoay vòng: nén gzip trên luồng nền và
+    xóa phân đoạn cũ nhất khi tổng dung lượng vượt giới hạn
+    """
+    
+    def __init__(self, log_file, compress=LOG_COMPRESS_ROTATED, retention_bytes=LOG_RETENTION_BYTES):
+        """
+        Args:
+            log_file: Đường dẫn file nhật ký đang ghi
+            compress: Nén gzip các phân đoạn đã xoay vòng
+            retention_bytes: Tổng dung lượng tối đa của các phân đoạn cũ (byte), None nếu không giới hạn
+        """
+        self.log_file = log_file
+        self.log_dir = os.path.dirname(log_file) or '.'
+        self.prefix = os.path.basename(log_file) + '.'
+        self.compress = compress
+        self.retention_bytes = retention_bytes
+        self.queue = queue.SimpleQueue()
+        self._thread = None
+    
+    def start(self):
+        """Khởi động luồng nén; xử lý luôn các phân đoạn chưa nén còn sót từ lần chạy trước"""
+        self._thread = threading.Thread(target=self._run, name='LogCompressor', daemon=True)
+        self._thread.start()
+        for path in self.get_segments():
+            if not path.endswith('.gz'):
+                self.queue.put(path)
+        self.queue.put(None)  # Áp dụng giới hạn dung lượng
+    
+    def stop(self, timeout=5.0):
+        """Nén nốt các phân đoạn đang chờ và dừng luồng nén"""
+        if self._thread is None:
+            return
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+    
+    def rotate(self):
+        """
+        Đổi tên file đang ghi thành một phân đoạn có dấu thời gian (file phải đã đóng)
+        và giao cho luồng nén
+        """
+        if not os.path.exists(self.log_file):
+            return
+        segment = os.path.join(self.log_dir, self.prefix + datetime.now().strftime('%Y%m%d_%H%M%S_%f'))
+        os.replace(self.log_file, segment)
+        self.queue.put(segment)
+    
+    def get_segments(self):
+        """Danh sách các phân đoạn đã xoay vòng, cũ → mới"""
+        try:
+            names = [n for n in os.listdir(self.log_dir) if n.startswith(self.prefix)]
+        except OSError:
+            return []
+        # Tên phân đoạn chứa dấu thời gian nên sắp xếp theo tên là theo thời gian
+        names.sort(key=lambda n: n[:-3] if n.endswith('.gz') else n)
+        return [os.path.join(self.log_dir, n) for n in names]
+    
+    def _run(self):
+        while True:
+            path = self.queue.get()
+            if path is _STOP:
+                break
+            try:
+                if path is not None and self.compress:
+                    self._compress(path)
+                self._enforce_retention()
+            except Exception as e:
+                print(f"Lỗi nén nhật ký: {e}")
+    
+    @staticmethod
+    def _compress(path):
+        """Nén một phân đoạn thành .gz rồi xóa bản gốc"""
+        if not os.path.exists(path):
+            return
+        tmp_path = path + '.gz.tmp'
+        with open(path, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp_path, path + '.gz')
+        os.remove(path)
+    
+    def _enforce_retention(self):
+        """Xóa các phân đoạn cũ nhất cho đến khi tổng dung lượng không vượt giới hạn"""
+        if self.retention_bytes is None:
+            return
+        segments = [p for p in self.get_segments() if not p.endswith('.tmp')]
+        sizes = []
+        for path in segments:
+            try:
+                sizes.append(os.path.getsize(path))
+            except OSError:
+                sizes.append(0)
+        total = sum(sizes)
+        for path, size in zip(segments, sizes):
+            if total <= self.retention_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                print(f"Không xóa được nhật ký cũ {path}: {e}")
+
+
+class AsyncLogWriter:
+    """
+    Luồng nền ghi nhật ký ra file và console theo lô
+    
+    Luồng xử lý chỉ đưa bản ghi vào queue.SimpleQueue (không chặn). Luồng ghi lấy
+    từng lô, định dạng, ghi vào file có bộ đệm và flush theo chu kỳ, nên đĩa chậm
+    hoặc bị treo không làm chậm vòng lặp phát hiện. File được xoay vòng theo dung lượng
+    và thời gian ngay trên luồng ghi; việc nén do LogRotator làm trên luồng riêng.
+    """
+    
+    def __init__(self, log_file, formatter, console_level=logging.WARNING,
+                 batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL_S,
+                 max_queue_size=LOG_QUEUE_MAX_SIZE, max_bytes=LOG_MAX_BYTES,
+                 max_age_s=LOG_MAX_AGE_S):
+        """
+        Args:
+            log_file: Đường dẫn file nhật ký
+            formatter: logging.Formatter dùng để định dạng bản ghi
+            console_level: Mức tối thiểu để ghi ra console
+            batch_size: Số bản ghi tối đa mỗi lô
+            flush_interval: Chu kỳ flush xuống đĩa (giây)
+            max_queue_size: Số bản ghi chờ tối đa, vượt quá thì bỏ bản ghi mới
+            max_bytes: Xoay vòng khi file vượt dung lượng này (byte), None nếu không giới hạn
+            max_age_s: Xoay vòng khi file được ghi quá số giây này, None nếu không giới hạn
+        """
+        self.log_file = log_file
+        self.formatter = formatter
+        self.console_level = console_level
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.rotator = LogRotator(log_file)
+        
+        self.queue = queue.SimpleQueue()
+        self.dropped = 0  # Số bản ghi bị bỏ do hàng đợi đầy
+        self.written = 0
+        self._stream = None
+        self._segment_bytes = 0
+        self._segment_start = 0.0
+        self._thread = None
+    
+    def start(self):
+        """Mở file nhật ký và khởi động luồng ghi"""
+        self.rotator.start()
+        self._open_stream()
+        self._thread = threading.Thread(target=self._run, name='LogWriter', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+    
+    def put(self, record):
+        """Đưa bản ghi vào hàng đợi (không chặn, gọi được từ mọi luồng)"""
+        if self.queue.qsize() >= self.max_queue_size:
+            self.dropped += 1
+            return
+        self.queue.put(record)
+    
+    def flush(self, timeout=2.0):
+        """
+        Chờ luồng ghi ghi xong các bản ghi đã đưa vào hàng đợi và flush xuống đĩa
+        
+        Returns:
+            bool: True nếu luồng ghi đã flush trong thời gian chờ
+        """
+        if self._thread is None:
+            return False
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+    
+    def stop(self, timeout=2.0):
+        """Ghi nốt các bản ghi còn lại, flush và dừng luồng ghi"""
+        if self._thread is None:
+            return
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        self.rotator.stop()
+        atexit.unregister(self.stop)
+    
+    def _open_stream(self):
+        """Mở (hoặc mở lại sau khi xoay vòng) file nhật ký đang ghi"""
+        self._stream = open(self.log_file, 'a', encoding='utf-8', buffering=64 * 1024)
+        try:
+            self._segment_bytes = os.path.getsize(self.log_file)
+        except OSError:
+            self._segment_bytes = 0
+        self._segment_start = time.time()
+    
+    def _should_rotate(self):
+        if self.max_bytes is not None and self._segment_bytes >= self.max_bytes:
+            return True
+        return (self.max_age_s is not None and self._segment_bytes > 0
+                and time.time() - self._segment_start >= self.max_age_s)
+    
+    def _rotate(self):
+        """Đóng file hiện tại, đổi tên thành phân đoạn cũ và mở file mới"""
+        try:
+            self._stream.close()
+            self.rotator.rotate()
+        except Exception as e:
+            print(f"Lỗi xoay vòng nhật ký: {e}")
+        self._open_stream()
+    
+    def _run(self):
+        """Vòng lặp luồng ghi: lấy lô, ghi vào bộ đệm, flush khi đủ lô hoặc hết chu kỳ"""
+        pending = 0
+        last_flush = time.monotonic()
+        reported_dropped = 0
+        stopping = False
+        
+        while not stopping:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            flushed = []
+            for record in batch:
+                if record is _STOP:
+                    stopping = True
+                elif isinstance(record, threading.Event):
+                    flushed.append(record)  # Yêu cầu flush() sau các bản ghi trước nó
+                else:
+                    self._write(record)
+                    pending += 1
+            
+            if self.dropped != reported_dropped:
+                self._write_text(f"Đã bỏ {self.dropped - reported_dropped} bản ghi nhật ký do hàng đợi đầy",
+                                 logging.WARNING)
+                reported_dropped = self.dropped
+            
+            now = time.monotonic()
+            if pending and (stopping or flushed or pending >= self.batch_size
+                            or now - last_flush >= self.flush_interval):
+                self._flush()
+                pending = 0
+                last_flush = now
+            for done in flushed:
+                done.set()
+            
+            if not stopping and self._should_rotate():
+                self._rotate()
+        
+        self._flush()
+        self._stream.close()
+    
+    def _write(self, record):
+        """Định dạng và ghi một bản ghi vào bộ đệm"""
+        try:
+            text = self.formatter.format(record)
+        except Exception as e:
+            text = f"Lỗi định dạng nhật ký: {e}"
+        self._write_text(text, record.levelno)
+    
+    def _write_text(self, text, levelno):
+        try:
+            line = text + '\n'
+            self._stream.write(line)
+            self._segment_bytes += len(line.encode('utf-8'))
+            if levelno >= self.console_level:
+                sys.stderr.write(text + '\n')
+            self.written += 1
+        except Exception as e:
+            print(f"Lỗi ghi nhật ký: {e}")
+    
+    def _flush(self):
+        try:
+            self._stream.flush()
+            sys.stderr.flush()
+        except Exception as e:
+            print(f"Lỗi ghi nhật ký: {e}")
+
+
+class _SharedLogWriter:
+    """
+    AsyncLogWriter dùng chung của logger 'ITS_CollisionWarning' (một file nhật ký cho cả tiến trình)
+    
+    Mỗi LoggerModule gọi acquire() khi khởi tạo và release() khi đóng. Writer được tạo và gắn vào
+    logger ở lần acquire() đầu tiên, gỡ ra và dừng ở lần release() cuối cùng, nên đóng một
+    LoggerModule không làm mất nhật ký của các LoggerModule khác.
+    """
+    
+    lock = threading.Lock()
+    writer = None
+    handler = None
+    users = 0
+    
+    @classmethod
+    def acquire(cls, logger, log_file):
+        """
+        Lấy writer dùng chung, tạo và gắn vào logger nếu chưa có
+        
+        Returns:
+            AsyncLogWriter: Writer dùng chung
+        """
+        with cls.lock:
+            if cls.writer is None:
+                formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+                writer = AsyncLogWriter(log_file, formatter)
+                writer.start()
+                cls.writer = writer
+                cls.handler = _NonFormattingQueueHandler(writer)
+                logger.addHandler(cls.handler)
+            cls.users += 1
+            return cls.writer
+    
+    @classmethod
+    def release(cls, logger):
+        """Trả writer dùng chung: flush nhật ký, người dùng cuối cùng thì gỡ khỏi logger và dừng writer"""
+        with cls.lock:
+            if cls.writer is None:
+                return
+            cls.users -= 1
+            if cls.users > 0:
+                cls.writer.flush()
+                return
+            logger.removeHandler(cls.handler)
+            cls.writer.stop()
+            cls.writer = None
+            cls.handler = None
+
+
 class LoggerModule:
     """Module quản lý logging và nhật ký cảnh báo"""
     
@@ -17,8 +380,14 @@ class LoggerModule:
         self.log_dir = LOG_DIR
         self.log_file = os.path.join(LOG_DIR, LOG_FILE)
         self.logger = None
-        self.warning_logs = []  # Lưu trữ cảnh báo trong bộ nhớ
-        
+        self.writer = None  # AsyncLogWriter dùng chung ghi nhật ký trên luồng nền (_SharedLogWriter)
+        self.event_store = None  # EventStore lưu cảnh báo trên đĩa suốt chuyến đi
+        self.session_start = time.time()
+        # Vùng đệm vòng các cảnh báo gần nhất trong bộ nhớ (thêm/bỏ O(1))
+        self.warning_logs = deque(maxlen=LOG_MEMORY_MAX_ENTRIES)
+        self.warning_seq = 0  # Số thứ tự bản ghi cảnh báo gần nhất (tăng dần)
+        self._seq_lock = threading.Lock()  # Đánh số và thêm bản ghi từ nhiều luồng
+    
     def initialize(self):
         """Khởi tạo logging system"""
         try:
@@ -29,23 +398,13 @@ class LoggerModule:
             self.logger = logging.getLogger('ITS_CollisionWarning')
             self.logger.setLevel(logging.INFO)
             
-            # Handler cho file
-            file_handler = logging.FileHandler(self.log_file, encoding='utf-8')
-            file_handler.setLevel(logging.INFO)
-            
-            # Formatter
-            formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
-            file_handler.setFormatter(formatter)
+            # Ghi file và console trên luồng nền, luồng gọi chỉ đưa bản ghi vào hàng đợi
+            if self.writer is None:
+                self.writer = _SharedLogWriter.acquire(self.logger, self.log_file)
             
-            # Handler cho console
-            console_handler = logging.StreamHandler()
-            console_handler.setLevel(logging.WARNING)
-            console_handler.setFormatter(formatter)
-            
-            # Thêm handlers
-            if not self.logger.handlers:
-                self.logger.addHandler(file_handler)
-                self.logger.addHandler(console_handler)
+            if ENABLE_EVENT_STORE and self.event_store is None:
+                self.event_store = EventStore(os.path.join(self.log_dir, EVENT_DB_FILE))
+                self.event_store.open()
             
             self.logger.info("Hệ thống logging đã được khởi tạo")
             return True
@@ -53,49 +412,57 @@ class LoggerModule:
             print(f"Lỗi khởi tạo logging: {e}")
             return False
     
-    def log_warning(self, detection_info):
+    def log_episode(self, episode):
         """
-        Ghi nhật ký cảnh báo va chạm
+        Ghi một bản tóm tắt sự kiện cảnh báo (thay cho một bản ghi mỗi khung hình)
         
         Args:
-            detection_info: Thông tin vật thể được phát hiện (dict)
+            episode: Dict sự kiện từ EpisodeAggregator
         """
         if self.logger is None:
             return
         
         try:
-            timestamp = datetime.now().strftime(LOG_DATE_FORMAT)
-            class_name = detection_info.get('class', 'unknown')
-            distance = detection_info.get('distance')
-            risk_level = detection_info.get('risk', {}).get('level', 'unknown')
-            confidence = detection_info.get('confidence', 0)
-            
             log_entry = {
-                'timestamp': timestamp,
-                'class': class_name,
-                'distance': distance,
-                'risk_level': risk_level,
-                'confidence': confidence,
-                'bbox': detection_info.get('bbox')
+                'kind': 'episode',
+                'timestamp': datetime.now().strftime(LOG_DATE_FORMAT),
+                'class': episode['class'],
+                'track_id': episode['track_id'],
+                'distance': episode['min_distance'],
+                'min_ttc': episode['min_ttc'],
+                'risk_level': episode['max_level'],
+                'confidence': episode['max_confidence'],
+                'duration': episode['duration'],
+                'frames': episode['frames'],
+                'start_time': episode['start_time'],
+                'bbox': episode['bbox']
             }
             
-            # Ghi vào file
-            message = (
-                f"CẢNH BÁO - Vật thể: {class_name}, "
-                f"Khoảng cách: {distance:.2f}m, "
-                f"Mức độ: {risk_level}, "
-                f"Độ tin cậy: {confidence:.1%}"
+            self.logger.warning(
+                "SỰ KIỆN CẢNH BÁO - Vật thể: %s (track %s), Thời lượng: %.1fs (%d khung hình), "
+                "Khoảng cách nhỏ nhất: %s, TTC nhỏ nhất: %s, Mức độ cao nhất: %s",
+                episode['class'], episode['track_id'], episode['duration'], episode['frames'],
+                f"{episode['min_distance']:.2f}m" if episode['min_distance'] is not None else "N/A",
+                f"{episode['min_ttc']:.1f}s" if episode['min_ttc'] is not None else "N/A",
+                episode['max_level']
             )
-            self.logger.warning(message)
             
-            # Lưu vào bộ nhớ (giữ tối đa 1000 bản ghi)
-            self.warning_logs.append(log_entry)
-            if len(self.warning_logs) > 1000:
-                self.warning_logs.pop(0)
-                
+            self._store_entry(log_entry)
         except Exception as e:
             print(f"Lỗi ghi nhật ký: {e}")
     
+    def _store_entry(self, log_entry):
+        """Đánh số, lưu vào vùng đệm vòng trong bộ nhớ và kho sự kiện trên đĩa"""
+        with self._seq_lock:
+            seq = self.warning_seq + 1
+            log_entry['seq'] = seq
+            log_entry['ts'] = time.time()
+            self.warning_logs.append(log_entry)
+            # Tăng số thứ tự sau khi thêm để luồng đọc không thấy số thứ tự chưa có bản ghi
+            self.warning_seq = seq
+            if self.event_store is not None:
+                self.event_store.append(log_entry)
+    
     def log_info(self, message):
         """
         Ghi thông tin hệ thống
@@ -122,19 +489,52 @@ class LoggerModule:
         
         Args:
             limit: Số lượng bản ghi tối đa
-            
+        
         Returns:
             list: Danh sách cảnh báo
         """
-        return self.warning_logs[-limit:]
+        return self.get_warning_logs_since(0, limit)
     
-    def export_logs_to_json(self, output_path=None):
+    def get_warning_logs_since(self, last_seq, limit=100):
+        """
+        Lấy các cảnh báo mới hơn số thứ tự đã biết
+        
+        Args:
+            last_seq: Số thứ tự bản ghi cuối cùng đã đọc
+            limit: Số lượng bản ghi tối đa
+        
+        Returns:
+            list: Danh sách cảnh báo mới (cũ → mới)
+        """
+        # Đọc từ cuối vùng đệm vòng: chi phí theo số bản ghi mới, không theo kích thước vùng đệm
+        new_count = min(self.warning_seq - last_seq, limit, len(self.warning_logs))
+        logs = []
+        prev_seq = None
+        for i in range(1, new_count + 1):
+            try:
+                entry = self.warning_logs[-i]
+            except IndexError:
+                break
+            if entry['seq'] <= last_seq or (prev_seq is not None and entry['seq'] >= prev_seq):
+                break
+            logs.append(entry)
+            prev_seq = entry['seq']
+        logs.reverse()
+        return logs
+    
+    def export_logs_to_json(self, output_path=None, start=None, end=None, levels=None):
         """
         Xuất nhật ký ra file JSON
         
+        Khi có kho sự kiện, xuất dần từ đĩa (mặc định các cảnh báo từ đầu phiên chạy),
+        không nạp toàn bộ vào bộ nhớ.
+        
         Args:
             output_path: Đường dẫn file output (mặc định: logs/warnings_export.json)
-            
+            start: Thời điểm bắt đầu (epoch giây), mặc định là lúc bắt đầu phiên
+            end: Thời điểm kết thúc (epoch giây), None nếu đến hiện tại
+            levels: Danh sách mức nguy hiểm cần xuất, None nếu tất cả
+        
         Returns:
             str: Đường dẫn file đã xuất
         """
@@ -143,15 +543,57 @@ class LoggerModule:
             output_path = os.path.join(self.log_dir, f'warnings_export_{timestamp}.json')
         
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(self.warning_logs, f, ensure_ascii=False, indent=2)
+            if self.event_store is not None:
+                self.event_store.export_json(output_path, start=self._export_start(start),
+                                             end=end, levels=levels)
+            else:
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    json.dump(list(self.warning_logs), f, ensure_ascii=False, indent=2)
             return output_path
         except Exception as e:
             self.log_error(f"Lỗi xuất nhật ký: {e}")
             return None
     
+    def export_logs_to_csv(self, output_path, start=None, end=None, levels=None):
+        """
+        Xuất nhật ký ra file CSV (cần kho sự kiện)
+        
+        Args:
+            output_path: Đường dẫn file output
+            start: Thời điểm bắt đầu (epoch giây), mặc định là lúc bắt đầu phiên
+            end: Thời điểm kết thúc (epoch giây), None nếu đến hiện tại
+            levels: Danh sách mức nguy hiểm cần xuất, None nếu tất cả
+        
+        Returns:
+            str: Đường dẫn file đã xuất hoặc None nếu lỗi
+        """
+        if self.event_store is None:
+            self.log_error("Chưa bật kho sự kiện (ENABLE_EVENT_STORE), không thể xuất CSV")
+            return None
+        try:
+            self.event_store.export_csv(output_path, start=self._export_start(start),
+                                        end=end, levels=levels)
+            return output_path
+        except Exception as e:
+            self.log_error(f"Lỗi xuất nhật ký: {e}")
+            return None
+    
+    def _export_start(self, start):
+        """Thời điểm bắt đầu xuất mặc định: đầu phiên chạy"""
+        return self.session_start if start is None else start
+    
     def clear_logs(self):
         """Xóa tất cả nhật ký trong bộ nhớ"""
         self.warning_logs.clear()
         self.log_info("Đã xóa tất cả nhật ký trong bộ nhớ")
+    
+    def close(self):
+        """Ghi nốt nhật ký còn trong hàng đợi, dừng luồng ghi khi không còn LoggerModule nào dùng"""
+        if self.event_store is not None:
+            self.event_store.close()
+            self.event_store = None
+        if self.writer is None:
+            return
+        _SharedLogWriter.release(self.logger)
+        self.writer = None
 
@@ -0,0 +1,235 @@
+"""
+Module đo hiệu năng toàn bộ chuỗi xử lý trên các file video (YOLO thật, không giới hạn tốc độ)
+
+Chuỗi đo: đọc khung hình → phát hiện → lọc làn → khoảng cách → TTC → chuyển động → quyết định → vẽ.
+Kết quả gồm thông lượng, p50/p95/p99 từng công đoạn, bộ nhớ đỉnh (RSS) và mức sử dụng từng lõi CPU.
+"""
+
+import os
+import resource
+import time
+import cv2
+from modules.batch_module import find_videos
+from modules.benchmark_module import benchmark_metadata
+from modules.detection_module import DetectionModule
+from modules.distance_module import DistanceModule
+from modules.lane_filter_module import LaneFilterModule
+from modules.latency_module import LatencyMonitor
+from modules.logger_module import LoggerModule
+from modules.motion_detection_module import MotionDetectionModule
+from modules.pipeline_module import PipelineModule
+from modules.ttc_module import TTCModule
+from config.config import ENABLE_MOTION_DETECTION, ENABLE_TTC, YOLO_MODEL_PATH
+
+
+_MAX_SAMPLES = 10 ** 7  # Số mẫu tối đa giữ lại cho mỗi công đoạn
+
+
+def read_cpu_times():
+    """
+    Đọc thời gian CPU của từng lõi từ /proc/stat (Linux)
+    
+    Returns:
+        dict: Tên lõi ('cpu0', ...) → (thời gian bận, tổng thời gian) theo jiffies, hoặc {} nếu không đọc được
+    """
+    times = {}
+    try:
+        with open('/proc/stat', 'r') as f:
+            for line in f:
+                if not line.startswith('cpu') or line.startswith('cpu '):
+                    continue
+                parts = line.split()
+                values = [int(v) for v in parts[1:]]
+                idle = values[3] + (values[4] if len(values) > 4 else 0)  # idle + iowait
+                total = sum(values[:8])
+                times[parts[0]] = (total - idle, total)
+    except OSError:
+        return {}
+    return times
+
+
+def cpu_utilization(before, after):
+    """Tỷ lệ sử dụng (%) của từng lõi giữa hai lần đọc read_cpu_times()"""
+    usage = {}
+    for core, (busy_after, total_after) in after.items():
+        if core not in before:
+            continue
+        busy_before, total_before = before[core]
+        total = total_after - total_before
+        usage[core] = 100.0 * (busy_after - busy_before) / total if total > 0 else 0.0
+    return usage
+
+
+def peak_rss_mb():
+    """Bộ nhớ thường trú đỉnh của tiến trình (MB, ru_maxrss tính bằng KB trên Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class PipelineBenchmark:
+    """Chạy toàn bộ pipeline trên các file video, đọc tuần tự từng khung hình (không đồng bộ thời gian thực)"""
+    
+    def __init__(self, videos, max_frames=None, warmup=10, render=True, model_path=YOLO_MODEL_PATH):
+        """
+        Khởi tạo pipeline benchmark
+        
+        Args:
+            videos: Danh sách file video hoặc thư mục
+            max_frames: Số khung hình tối đa mỗi video, None nếu đọc hết
+            warmup: Số khung hình đầu tiên của mỗi video không tính vào thống kê
+            render: Có vẽ cảnh báo lên khung hình không (giống giao diện)
+            model_path: Đường dẫn mô hình YOLO (file cục bộ, không tải về)
+        """
+        self.videos = find_videos(videos)
+        self.max_frames = max_frames
+        self.warmup = warmup
+        self.render = render
+        self.model_path = model_path
+        self.detection = DetectionModule(model_path)
+        self.pipeline = None
+        self.report = {}
+    
+    def initialize(self):
+        """Nạp mô hình YOLO và dựng pipeline (không tự giảm chất lượng để kết quả ổn định)"""
+        if not os.path.exists(self.model_path):
+            print(f"Lỗi khởi tạo mô hình YOLO: không có file {self.model_path}")
+            return False
+        if not self.detection.initialize():
+            return False
+        self.pipeline = PipelineModule(
+            self.detection,
+            DistanceModule(),
+            LaneFilterModule(),
+            LoggerModule(),
+            alert=None,
+            ttc_module=TTCModule() if ENABLE_TTC else None,
+            motion_detection=MotionDetectionModule() if ENABLE_MOTION_DETECTION else None,
+            render=self.render,
+            adaptive=False
+        )
+        return True
+    
+    def _attach_monitor(self, monitor):
+        """Thay LatencyMonitor của pipeline bằng monitor giữ đủ mẫu của cả video"""
+        if self.pipeline.latency is not None:
+            self.pipeline.remove_timing_hook(self.pipeline.latency.stage_hook)
+        self.pipeline.latency = monitor
+        self.pipeline.add_timing_hook(monitor.stage_hook)
+    
+    def _run_video(self, path, totals):
+        """
+        Chạy pipeline trên một video
+        
+        Returns:
+            dict: Thống kê của video hoặc None nếu không mở được
+        """
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"Lỗi mở file video: {path}")
+            return None
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        fps = fps if fps > 0 else 30.0
+        
+        # Giữ toàn bộ mẫu của video (số khung hình trong header video không luôn chính xác)
+        monitor = LatencyMonitor(window_size=_MAX_SAMPLES)
+        self._attach_monitor(monitor)
+        self.pipeline.reset()
+        self.pipeline.start(None, threaded=False)
+        
+        frames = 0
+        measured = 0
+        measured_time = 0.0
+        try:
+            while self.max_frames is None or frames < self.max_frames:
+                start = time.perf_counter()
+                ret, frame = cap.read()
+                capture_ms = (time.perf_counter() - start) * 1000.0
+                if not ret:
+                    break
+                frames += 1
+                if frames == self.warmup + 1:
+                    # Bỏ các mẫu khởi động (nạp mô hình, cấp phát bộ nhớ lần đầu)
+                    monitor.clear()
+                self.pipeline.process_frame(frame, frames, (frames - 1) / fps)
+                if frames > self.warmup:
+                    monitor.record('capture', capture_ms)
+                    measured += 1
+                    measured_time += (time.perf_counter() - start)
+        finally:
+            self.pipeline.stop()
+            cap.release()
+        
+        for name, samples in monitor.samples.items():
+            for value in samples:
+                totals.record(name, value)
+        return {
+            'video': path,
+            'frames': frames,
+            'measured_frames': measured,
+            'throughput_fps': measured / measured_time if measured_time > 0 else 0.0,
+            'stages': monitor.get_summary()['stages']
+        }
+    
+    def run(self):
+        """
+        Chạy benchmark trên tất cả video
+        
+        Returns:
+            dict: Báo cáo {'meta', 'results' (percentiles từng công đoạn, gộp mọi video),
+                  'throughput_fps', 'videos', 'peak_rss_mb', 'cpu'} hoặc None nếu không khởi tạo được
+        """
+        if self.pipeline is None and not self.initialize():
+            return None
+        
+        totals = LatencyMonitor(window_size=_MAX_SAMPLES)
+        videos = []
+        cpu_before = read_cpu_times()
+        process_before = os.times()
+        start_time = time.perf_counter()
+        for path in self.videos:
+            stats = self._run_video(path, totals)
+            if stats is not None:
+                videos.append(stats)
+        elapsed = time.perf_counter() - start_time
+        process_after = os.times()
+        cpu_after = read_cpu_times()
+        
+        measured = sum(v['measured_frames'] for v in videos)
+        measured_time = sum(v['measured_frames'] / v['throughput_fps'] for v in videos if v['throughput_fps'] > 0)
+        process_cpu_s = ((process_after.user - process_before.user) +
+                         (process_after.system - process_before.system))
+        summary = totals.get_summary()
+        self.report = {
+            'meta': benchmark_metadata(self._meta()),
+            'results': summary['stages'],
+            'throughput_fps': measured / measured_time if measured_time > 0 else 0.0,
+            'frames': sum(v['frames'] for v in videos),
+            'measured_frames': measured,
+            'elapsed_s': elapsed,
+            'peak_rss_mb': peak_rss_mb(),
+            'cpu': {
+                'process_cpu_s': process_cpu_s,
+                'process_cores_used': process_cpu_s / elapsed if elapsed > 0 else 0.0,
+                'per_core_percent': cpu_utilization(cpu_before, cpu_after)
+            },
+            'videos': videos
+        }
+        return self.report
+    
+    def _meta(self):
+        """Thông tin cấu hình lần đo"""
+        meta = {
+            'model': self.model_path,
+            'input_size': self.detection.input_size,
+            'render': self.render,
+            'warmup_frames': self.warmup,
+            'max_frames': self.max_frames,
+            'opencv_threads': cv2.getNumThreads()
+        }
+        try:
+            import torch
+            meta['torch'] = torch.__version__
+            meta['torch_threads'] = torch.get_num_threads()
+            meta['cuda_available'] = torch.cuda.is_available()
+        except ImportError:
+            pass
+        return meta
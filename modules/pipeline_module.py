@@ -0,0 +1,455 @@
+"""
+Module pipeline xử lý khung hình chạy trên luồng riêng
+(phát hiện → lọc làn → khoảng cách → TTC → chuyển động → quyết định cảnh báo)
+"""
+
+import threading
+import time
+from collections import namedtuple
+from modules.stages_module import EgoSpeedStage, FrameContext, IncidentStage, RecordStage, TelemetryStage, build_default_stages
+from modules.latency_module import LatencyMonitor
+from modules.degradation_module import DegradationController
+from modules.resource_module import pin_current_thread
+from config.config import ENABLE_LATENCY_MONITOR, ENABLE_DEGRADATION
+
+
+# Kết quả xử lý của một khung hình. Sau khi được công bố, kết quả không bị
+# thay đổi nữa nên luồng giao diện có thể đọc mà không cần khóa.
+FrameResult = namedtuple('FrameResult', [
+    'frame_seq',           # Số thứ tự khung hình từ CameraModule
+    'timestamp',           # Thời điểm của khung hình (giây)
+    'detections',          # tuple các vật thể đã xử lý (không được sửa)
+    'display_frame',       # Khung hình đã vẽ (chỉ đọc)
+    'fps',                 # FPS xử lý trung bình
+    'alert_count',         # Số vật thể cần cảnh báo
+    'has_risk',            # Có vật thể nằm trong ngưỡng nguy hiểm
+    'should_alert',        # Quyết định phát cảnh báo
+    'is_vehicle_stopped',  # Xe đang dừng
+    'alert_disabled',      # Cảnh báo đang bị tắt tạm thời
+    'closest_distance',    # Khoảng cách vật thể nguy hiểm gần nhất
+    'closest_ttc',         # TTC của vật thể nguy hiểm gần nhất
+    'degradation_level',   # Mức giảm chất lượng đang áp dụng (0 = đầy đủ)
+    'capture_time',        # Thời điểm thu nhận khung hình (time.perf_counter())
+    'alert_latency_ms',    # Độ trễ thu nhận → bắt đầu cảnh báo (chỉ có ở khung hình bắt đầu cảnh báo)
+    'ego_velocity',        # Vận tốc xe (m/s) từ cảm biến, None nếu không có
+])
+
+
+class PipelineModule:
+    """Module điều phối chuỗi công đoạn xử lý khung hình (trên luồng nền hoặc đồng bộ)"""
+    
+    def __init__(self, detection, distance, lane_filter, logger, alert=None,
+                 ttc_module=None, motion_detection=None, render=True, stages=None,
+                 adaptive=ENABLE_DEGRADATION, telemetry=None, incidents=None,
+                 recorder=None, speed_sensor=None):
+        """
+        Khởi tạo pipeline module
+        
+        Args:
+            detection: DetectionModule đã khởi tạo
+            distance: DistanceModule
+            lane_filter: LaneFilterModule
+            logger: LoggerModule
+            alert: AlertModule để phát âm thanh, hoặc None nếu chạy không âm thanh
+            ttc_module: TTCModule hoặc None nếu tắt TTC
+            motion_detection: MotionDetectionModule hoặc None nếu tắt
+            render: Có vẽ khung hình hiển thị không (tắt khi chỉ cần kết quả)
+            stages: Danh sách Stage tùy biến, mặc định dùng build_default_stages()
+            adaptive: Tự động giảm chất lượng khi vượt ngân sách thời gian
+                      (nên tắt khi cần kết quả lặp lại được, ví dụ xử lý video offline)
+            telemetry: TelemetryRecorder để ghi kết quả từng khung hình, hoặc None
+            incidents: IncidentRecorder để ghi clip sự cố khi bắt đầu cảnh báo, hoặc None
+            recorder: VideoRecorder để ghi khung hình đã vẽ ra file video, hoặc None
+                      (cần bật render)
+            speed_sensor: SpeedSensor cung cấp vận tốc xe cho TTC và quyết định, hoặc None
+        """
+        self.logger = logger
+        
+        if stages is None:
+            stages = build_default_stages(
+                detection, distance, lane_filter, logger, alert=alert,
+                ttc_module=ttc_module, motion_detection=motion_detection, render=render
+            )
+        self.stages = list(stages)
+        self.speed_sensor = speed_sensor
+        if speed_sensor is not None:
+            self.stages.insert(0, EgoSpeedStage(speed_sensor))
+        self.telemetry = telemetry
+        if telemetry is not None:
+            self.stages.append(TelemetryStage(telemetry))
+        self.incidents = incidents
+        if incidents is not None:
+            self.stages.append(IncidentStage(incidents))
+        self.recorder = recorder
+        if recorder is not None:
+            self.stages.append(RecordStage(recorder))
+        self._active_stages = []
+        self.timing_hooks = []  # Hàm gọi sau mỗi công đoạn: hook(stage_name, seconds, ctx)
+        self._rebuild_active_stages()
+        
+        # Đo độ trễ từng công đoạn
+        self.latency = LatencyMonitor() if ENABLE_LATENCY_MONITOR else None
+        if self.latency is not None:
+            self.add_timing_hook(self.latency.stage_hook)
+        if telemetry is not None:
+            self.add_timing_hook(telemetry.stage_hook)
+        self._wait_start = None
+        
+        # Giảm chất lượng khi vượt ngân sách thời gian
+        self.degradation = DegradationController(self, logger) if adaptive else None
+        
+        self.camera = None
+        self.is_running = False
+        self.worker_thread = None
+        self.cpu_cores = None
+        
+        # Kết quả mới nhất (thay thế nguyên tử, không cần khóa khi đọc)
+        self.latest_result = None
+        
+        # Thống kê
+        self.frame_count = 0
+        self.start_time = time.time()
+        self.fps = 0
+        self.last_frame_seq = 0
+    
+    def get_stage(self, name):
+        """
+        Lấy công đoạn theo tên
+        
+        Args:
+            name: Tên công đoạn ('detect', 'ttc', 'decision', ...)
+        
+        Returns:
+            Stage: Công đoạn hoặc None nếu không có
+        """
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+    
+    def set_stage_enabled(self, name, enabled):
+        """
+        Bật/tắt một công đoạn. Công đoạn bị tắt được loại khỏi vòng lặp nên không tốn chi phí.
+        
+        Returns:
+            bool: True nếu tìm thấy công đoạn
+        """
+        stage = self.get_stage(name)
+        if stage is None:
+            return False
+        stage.enabled = enabled
+        self._rebuild_active_stages()
+        return True
+    
+    def replace_stage(self, name, new_stage):
+        """
+        Thay thế một công đoạn (giữ nguyên vị trí)
+        
+        Returns:
+            bool: True nếu tìm thấy công đoạn
+        """
+        for i, stage in enumerate(self.stages):
+            if stage.name == name:
+                self.stages[i] = new_stage
+                self._rebuild_active_stages()
+                return True
+        return False
+    
+    def add_timing_hook(self, hook):
+        """
+        Đăng ký hàm đo thời gian, được gọi sau mỗi công đoạn
+        
+        Args:
+            hook: Hàm hook(stage_name, seconds, ctx)
+        """
+        self.timing_hooks.append(hook)
+    
+    def remove_timing_hook(self, hook):
+        """Hủy đăng ký hàm đo thời gian"""
+        if hook in self.timing_hooks:
+            self.timing_hooks.remove(hook)
+    
+    def _rebuild_active_stages(self):
+        """Cập nhật danh sách công đoạn đang bật"""
+        self._active_stages = [stage for stage in self.stages if stage.enabled]
+    
+    @property
+    def alert_disabled(self):
+        """Cảnh báo đang bị tắt tạm thời"""
+        decision = self.get_stage('decision')
+        return decision.alert_disabled if decision is not None else False
+    
+    def start(self, camera, threaded=True, cpu_cores=None):
+        """
+        Bắt đầu pipeline
+        
+        Args:
+            camera: CameraModule đã khởi động
+            threaded: Chạy trên luồng nền (True) hoặc để bên gọi tự gọi step()
+            cpu_cores: Các lõi CPU dành cho luồng nền (suy luận), None để không gán
+        """
+        self.camera = camera
+        self.cpu_cores = cpu_cores
+        self.is_running = True
+        self.start_time = time.time()
+        self.frame_count = 0
+        self.last_frame_seq = 0
+        self.latest_result = None
+        self._wait_start = None
+        if self.latency is not None:
+            self.latency.clear()
+        
+        if threaded:
+            # Luồng nền của lần chạy trước chưa thoát (stop() gọi từ chính luồng đó): chờ để không có
+            # hai luồng cùng xử lý
+            if self.worker_thread is not None and self.worker_thread.is_alive():
+                self.worker_thread.join()
+            self.worker_thread = threading.Thread(target=self._worker_loop, name='Pipeline', daemon=True)
+            self.worker_thread.start()
+    
+    def stop(self):
+        """
+        Dừng pipeline và chờ luồng nền kết thúc
+        
+        Không đặt thời gian chờ: luồng nền không bao giờ chặn trong camera (chỉ chờ khung hình mới
+        tối đa 0.1s qua CameraModule.get_next_frame, việc đọc camera ở luồng thu nhận riêng) và kiểm tra
+        is_running sau mỗi lần chờ, nên thoát ngay sau khung hình đang xử lý. Bên gọi chỉ đóng
+        telemetry/bộ ghi, reset() các công đoạn khi không còn luồng nào dùng chúng.
+        """
+        self.is_running = False
+        if self.worker_thread is not None and self.worker_thread is not threading.current_thread():
+            self.worker_thread.join()
+            self.worker_thread = None
+        self._stop_alert()
+    
+    def reset(self):
+        """Đặt lại trạng thái của tất cả công đoạn"""
+        for stage in self.stages:
+            stage.reset()
+        if self.degradation is not None:
+            self.degradation.reset()
+    
+    def mute(self, seconds):
+        """Tắt cảnh báo tạm thời trong một khoảng thời gian"""
+        decision = self.get_stage('decision')
+        if decision is not None:
+            decision.mute(seconds)
+        # Chỉ tắt âm thanh: sự kiện đang mở do luồng xử lý tự đóng (AlertStage.process), không đóng
+        # từ luồng giao diện song song với luồng xử lý
+        alert_stage = self.get_stage('alert')
+        if alert_stage is not None:
+            alert_stage.stop_sound()
+    
+    def unmute(self):
+        """Bật lại cảnh báo"""
+        decision = self.get_stage('decision')
+        if decision is not None:
+            decision.unmute()
+    
+    def _stop_alert(self):
+        """Dừng âm thanh cảnh báo"""
+        alert_stage = self.get_stage('alert')
+        if alert_stage is not None:
+            alert_stage.stop()
+    
+    def is_source_finished(self):
+        """Kiểm tra nguồn khung hình đã kết thúc (video hết)"""
+        return self.camera is not None and not self.camera.is_running
+    
+    def get_latest_result(self):
+        """
+        Lấy kết quả mới nhất
+        
+        Returns:
+            FrameResult: Kết quả khung hình mới nhất hoặc None
+        """
+        return self.latest_result
+    
+    def _worker_loop(self):
+        """Vòng lặp của luồng nền: chờ khung hình mới và xử lý"""
+        pin_current_thread(self.cpu_cores)
+        while self.is_running:
+            if self.step(timeout=0.1) is None and self.is_source_finished():
+                break
+        self._stop_alert()
+    
+    def step(self, timeout=0):
+        """
+        Lấy khung hình mới (nếu có) và xử lý
+        
+        Args:
+            timeout: Thời gian chờ khung hình mới (giây)
+        
+        Returns:
+            FrameResult: Kết quả hoặc None nếu chưa có khung hình mới
+        """
+        if self.camera is None:
+            return None
+        
+        if self._wait_start is None:
+            self._wait_start = time.perf_counter()
+        frame_seq, frame, capture_time = self.camera.get_next_frame(self.last_frame_seq, timeout)
+        if frame is None:
+            return None
+        self.last_frame_seq = frame_seq
+        
+        # Thời gian chờ khung hình mới kể từ khi xử lý xong khung hình trước
+        if self.latency is not None:
+            self.latency.record('capture_wait', (time.perf_counter() - self._wait_start) * 1000.0)
+        self._wait_start = None
+        
+        # Thời điểm thu nhận theo đồng hồ thực (dùng cho TTC)
+        timestamp = time.time() - (time.perf_counter() - capture_time)
+        
+        try:
+            result = self.process_frame(frame, frame_seq, timestamp, capture_time)
+        except Exception as e:
+            self.logger.log_error(f"Lỗi xử lý: {e}")
+            return None
+        
+        self.latest_result = result
+        return result
+    
+    def process_frame(self, frame, frame_seq=0, timestamp=None, capture_time=None):
+        """
+        Xử lý một khung hình qua toàn bộ chuỗi công đoạn
+        
+        Args:
+            frame: Khung hình đầu vào (numpy array)
+            frame_seq: Số thứ tự khung hình
+            timestamp: Thời điểm của khung hình (giây), mặc định time.time().
+                       Khi xử lý video offline nên truyền thời gian trong video.
+            capture_time: Thời điểm thu nhận theo time.perf_counter(), mặc định là lúc gọi hàm
+        
+        Returns:
+            FrameResult: Kết quả xử lý
+        """
+        ctx = FrameContext(frame, frame_seq, timestamp, capture_time)
+        
+        # Tính FPS
+        self.frame_count += 1
+        elapsed = time.time() - self.start_time
+        if elapsed > 0:
+            self.fps = self.frame_count / elapsed
+        ctx.fps = self.fps
+        if self.degradation is not None:
+            ctx.degradation_level = self.degradation.level
+        
+        start = time.perf_counter()
+        self.run_stages(ctx)
+        frame_ms = (time.perf_counter() - start) * 1000.0
+        
+        if self.latency is not None:
+            self.latency.record_frame(frame_ms)
+            if ctx.alert_trigger_time is not None:
+                self.latency.record('glass_to_alarm', (ctx.alert_trigger_time - ctx.capture_time) * 1000.0)
+        if self.degradation is not None:
+            stage_ms = self.latency.last_frame_stages if self.latency is not None else None
+            self.degradation.update(frame_ms, stage_ms)
+        return self.make_result(ctx)
+    
+    def get_latency_summary(self):
+        """
+        Lấy thống kê độ trễ p50/p95/p99 của từng công đoạn
+        
+        Returns:
+            dict: Thống kê từ LatencyMonitor.get_summary() hoặc None nếu tắt đo độ trễ
+        """
+        if self.latency is None:
+            return None
+        return self.latency.get_summary()
+    
+    def run_stages(self, ctx):
+        """
+        Chạy các công đoạn đang bật trên context
+        
+        Args:
+            ctx: FrameContext của khung hình
+        """
+        hooks = self.timing_hooks
+        if not hooks:
+            for stage in self._active_stages:
+                stage.process(ctx)
+            return
+        
+        for stage in self._active_stages:
+            start = time.perf_counter()
+            stage.process(ctx)
+            elapsed = time.perf_counter() - start
+            for hook in hooks:
+                hook(stage.name, elapsed, ctx)
+    
+    @staticmethod
+    def make_result(ctx):
+        """
+        Tạo FrameResult bất biến từ context
+        
+        Args:
+            ctx: FrameContext đã xử lý
+        
+        Returns:
+            FrameResult: Kết quả khung hình
+        """
+        return FrameResult(
+            frame_seq=ctx.frame_seq,
+            timestamp=ctx.timestamp,
+            detections=tuple(ctx.detections),
+            display_frame=ctx.display_frame,
+            fps=ctx.fps,
+            alert_count=ctx.alert_count,
+            has_risk=ctx.has_risk,
+            should_alert=ctx.should_alert,
+            is_vehicle_stopped=ctx.is_vehicle_stopped,
+            alert_disabled=ctx.alert_disabled,
+            closest_distance=ctx.closest_distance,
+            closest_ttc=ctx.closest_ttc,
+            degradation_level=ctx.degradation_level,
+            capture_time=ctx.capture_time,
+            alert_latency_ms=((ctx.alert_trigger_time - ctx.capture_time) * 1000.0
+                              if ctx.alert_trigger_time is not None else None),
+            ego_velocity=ctx.ego_velocity
+        )
+
+
+def result_to_dict(result):
+    """
+    Chuyển FrameResult thành dict có thể ghi JSON (bỏ khung hình)
+    
+    Args:
+        result: FrameResult
+    
+    Returns:
+        dict: Kết quả khung hình
+    """
+    detections = []
+    for det in result.detections:
+        risk = det.get('risk', {})
+        detections.append({
+            'track_id': det.get('track_id'),
+            'class': det.get('class'),
+            'confidence': det.get('confidence'),
+            'bbox': list(det.get('bbox', ())),
+            'distance': det.get('distance'),
+            'relative_velocity': det.get('relative_velocity'),
+            'risk_level': risk.get('level'),
+            'ttc': risk.get('ttc'),
+            'stopping_distance': risk.get('stopping_distance'),
+            'needs_alert': risk.get('needs_alert', False)
+        })
+    
+    return {
+        'frame_seq': result.frame_seq,
+        'timestamp': result.timestamp,
+        'fps': result.fps,
+        'alert_count': result.alert_count,
+        'has_risk': result.has_risk,
+        'should_alert': result.should_alert,
+        'is_vehicle_stopped': result.is_vehicle_stopped,
+        'alert_disabled': result.alert_disabled,
+        'closest_distance': result.closest_distance,
+        'closest_ttc': result.closest_ttc,
+        'degradation_level': result.degradation_level,
+        'alert_latency_ms': result.alert_latency_ms,
+        'ego_velocity': result.ego_velocity,
+        'detections': detections
+    }
@@ -0,0 +1,249 @@
+"""
+Module ghi video đã vẽ (khung hình hiển thị của pipeline) trên luồng nền
+
+Luồng pipeline chỉ đưa tham chiếu khung hình hiển thị (chỉ đọc, không cần sao chép) vào hàng đợi
+có giới hạn. Khi hàng đợi đầy, chính sách 'drop' bỏ khung hình và đếm lại, 'block' chờ luồng ghi
+(dùng khi cần file đầy đủ, ví dụ xử lý video offline). Luồng ghi đổi kích thước, ghi bằng
+cv2.VideoWriter và chuyển sang file mới sau mỗi segment_s giây video.
+
+Tốc độ khung hình của file cố định: khung hình được đặt vào ô thời gian theo timestamp,
+khung hình đến sớm hơn ô kế tiếp bị bỏ qua (giảm tốc độ), khoảng trống (khung hình bị bỏ,
+pipeline chậm) được lấp bằng cách lặp khung hình trước nên thời lượng video khớp thời gian thực.
+"""
+
+import os
+import queue
+import threading
+import time
+import cv2
+from config.config import (
+    VIDEO_RECORD_FPS, VIDEO_RECORD_SIZE, VIDEO_RECORD_SEGMENT_S, VIDEO_RECORD_FOURCC,
+    VIDEO_RECORD_QUEUE_SIZE, VIDEO_RECORD_POLICY, VIDEO_RECORD_MAX_GAP_S
+)
+
+
+_STOP = object()  # Báo hiệu dừng luồng ghi
+
+
+class VideoRecorder:
+    """Ghi khung hình hiển thị ra file video trên luồng riêng, chia file theo thời lượng"""
+    
+    def __init__(self, fps=VIDEO_RECORD_FPS, frame_size=VIDEO_RECORD_SIZE, segment_s=VIDEO_RECORD_SEGMENT_S,
+                 fourcc=VIDEO_RECORD_FOURCC, queue_size=VIDEO_RECORD_QUEUE_SIZE, policy=VIDEO_RECORD_POLICY,
+                 max_gap_s=VIDEO_RECORD_MAX_GAP_S):
+        """
+        Args:
+            fps: Tốc độ khung hình của file ghi, None để lấy theo tham số của open()
+            frame_size: Kích thước file ghi (rộng, cao), None để giữ kích thước khung hình đầu tiên
+            segment_s: Độ dài mỗi file (giây video), 0 hoặc None để ghi một file
+            fourcc: Codec (4 ký tự)
+            queue_size: Số khung hình chờ ghi tối đa
+            policy: 'drop' bỏ khung hình khi hàng đợi đầy, 'block' chờ luồng ghi
+            max_gap_s: Khoảng trống tối đa được lấp bằng khung hình lặp lại (giây)
+        """
+        if policy not in ('drop', 'block'):
+            raise ValueError(f"Chính sách ghi không hợp lệ: {policy}")
+        self.fps = fps
+        self.frame_size = tuple(frame_size) if frame_size else None
+        self.segment_s = segment_s
+        self.fourcc = fourcc
+        self.queue_size = queue_size
+        self.policy = policy
+        self.max_gap_s = max_gap_s
+        
+        self.output_path = None
+        self.segment_paths = []
+        self.frames_received = 0
+        self.frames_skipped = 0  # Khung hình đến sớm hơn ô thời gian kế tiếp (giảm tốc độ)
+        self.frames_dropped = 0  # Khung hình bị bỏ vì hàng đợi đầy
+        self.frames_written = 0  # Khung hình đã ghi ra file (kể cả khung hình lặp lại)
+        self.frames_repeated = 0  # Khung hình lặp lại để lấp khoảng trống
+        self.frames_failed = 0  # Khung hình không ghi được (không mở được file, lỗi codec)
+        self.block_wait_s = 0.0  # Tổng thời gian pipeline chờ luồng ghi (chính sách 'block')
+        self._queue = None
+        self._thread = None
+        
+        # Ô thời gian (chỉ luồng pipeline truy cập)
+        self._start_ts = None
+        self._next_slot = 0
+        
+        # Chỉ luồng ghi truy cập các trường dưới đây
+        self._writer = None
+        self._writer_size = None
+        self._segment_frames = 0
+        self._failed = False  # Không mở được file ghi, bỏ các khung hình còn lại
+    
+    @property
+    def is_open(self):
+        return self._queue is not None
+    
+    def open(self, output_path, fps=None):
+        """
+        Bắt đầu một phiên ghi (khởi động luồng ghi)
+        
+        Args:
+            output_path: File video. Khi chia file, các đoạn được đặt tên <tên>_000<đuôi>, <tên>_001<đuôi>, ...
+            fps: Tốc độ khung hình dùng khi không cấu hình fps (thường là tốc độ của nguồn)
+        """
+        if self.is_open:
+            self.close()
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if fps:
+            self.fps = self.fps or fps
+        if not self.fps:
+            raise ValueError("Chưa xác định tốc độ khung hình của file ghi")
+        
+        self.output_path = output_path
+        self.segment_paths = []
+        self.frames_received = 0
+        self.frames_skipped = 0
+        self.frames_dropped = 0
+        self.frames_written = 0
+        self.frames_repeated = 0
+        self.frames_failed = 0
+        self.block_wait_s = 0.0
+        self._start_ts = None
+        self._next_slot = 0
+        self._writer_size = None
+        self._segment_frames = 0
+        self._failed = False
+        
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._thread = threading.Thread(target=self._write_loop, name='VideoRecorder', daemon=True)
+        self._thread.start()
+    
+    def record(self, frame, timestamp=None):
+        """
+        Đưa khung hình vào hàng đợi ghi (gọi trên luồng pipeline)
+        
+        Args:
+            frame: Khung hình BGR (không được sửa sau khi đưa vào, ví dụ khung hình hiển thị chỉ đọc)
+            timestamp: Thời điểm khung hình (giây), None để ghi mỗi khung hình đúng một lần
+        
+        Returns:
+            bool: False nếu khung hình bị bỏ qua hoặc bị bỏ vì hàng đợi đầy
+        """
+        if not self.is_open:
+            return False
+        self.frames_received += 1
+        
+        repeat = 1
+        if timestamp is not None:
+            if self._start_ts is None:
+                self._start_ts = timestamp
+            slot = int((timestamp - self._start_ts) * self.fps + 0.5)
+            if slot < self._next_slot:
+                self.frames_skipped += 1
+                return False
+            repeat = min(slot - self._next_slot + 1, max(1, int(self.max_gap_s * self.fps)))
+        
+        if self.policy == 'block':
+            try:
+                self._queue.put_nowait((frame, repeat))
+            except queue.Full:
+                wait_start = time.perf_counter()
+                self._queue.put((frame, repeat))
+                self.block_wait_s += time.perf_counter() - wait_start
+        else:
+            try:
+                self._queue.put_nowait((frame, repeat))
+            except queue.Full:
+                # Không tiến ô thời gian: khung hình sau sẽ lặp lại để lấp chỗ trống
+                self.frames_dropped += 1
+                return False
+        
+        if timestamp is not None:
+            self._next_slot = slot + 1
+        return True
+    
+    def close(self, timeout=10.0):
+        """Ghi nốt các khung hình trong hàng đợi, đóng file"""
+        if not self.is_open:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._queue = None
+        self._thread = None
+    
+    def get_stats(self):
+        """Thống kê phiên ghi"""
+        return {
+            'fps': self.fps,
+            'policy': self.policy,
+            'frames_received': self.frames_received,
+            'frames_written': self.frames_written,
+            'frames_repeated': self.frames_repeated,
+            'frames_skipped': self.frames_skipped,
+            'frames_dropped': self.frames_dropped,
+            'frames_failed': self.frames_failed,
+            'block_wait_s': self.block_wait_s,
+            'duration_s': self.frames_written / self.fps if self.fps else 0.0,
+            'segments': list(self.segment_paths)
+        }
+    
+    def _write_loop(self):
+        """Luồng ghi: đổi kích thước, ghi khung hình, chuyển file khi đủ thời lượng"""
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                frame, repeat = item
+                try:
+                    self._write(frame, repeat)
+                except Exception as e:
+                    self.frames_failed += repeat
+                    print(f"Lỗi ghi video: {e}")
+        finally:
+            self._release()
+    
+    def _write(self, frame, repeat):
+        """Ghi một khung hình repeat lần"""
+        if self._failed:
+            self.frames_failed += repeat
+            return
+        if self._writer_size is None:
+            h, w = frame.shape[:2]
+            self._writer_size = self.frame_size or (w, h)
+        if (frame.shape[1], frame.shape[0]) != self._writer_size:
+            frame = cv2.resize(frame, self._writer_size, interpolation=cv2.INTER_AREA)
+        
+        segment_frames = int(round(self.segment_s * self.fps)) if self.segment_s else 0
+        for i in range(repeat):
+            if self._writer is None or (segment_frames and self._segment_frames >= segment_frames):
+                self._open_segment()
+            if self._failed:
+                self.frames_failed += repeat - i
+                return
+            self._writer.write(frame)
+            self._segment_frames += 1
+            self.frames_written += 1
+            if i > 0:
+                self.frames_repeated += 1
+    
+    def _segment_path(self, index):
+        """Đường dẫn file thứ index (giữ nguyên output_path khi không chia file)"""
+        if not self.segment_s:
+            return self.output_path
+        root, ext = os.path.splitext(self.output_path)
+        return f"{root}_{index:03d}{ext or '.mp4'}"
+    
+    def _open_segment(self):
+        """Đóng file hiện tại và mở file tiếp theo"""
+        self._release()
+        path = self._segment_path(len(self.segment_paths))
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, self._writer_size)
+        self._segment_frames = 0
+        if not writer.isOpened():
+            print(f"Lỗi mở file ghi video: {path}")
+            self._failed = True
+            return
+        self._writer = writer
+        self.segment_paths.append(path)
+    
+    def _release(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None
@@ -0,0 +1,190 @@
+"""
+Module vẽ thông tin cảnh báo lên khung hình (không phụ thuộc thư viện âm thanh/giao diện)
+"""
+
+import cv2
+
+
+class RenderModule:
+    """Module vẽ bounding box và thông tin trạng thái lên khung hình"""
+    
+    @staticmethod
+    def draw_detections(frame, processed_detections):
+        """
+        Vẽ bounding box và thông tin lên khung hình
+        
+        Args:
+            frame: Khung hình đầu vào
+            processed_detections: Danh sách vật thể đã được xử lý
+        
+        Returns:
+            numpy.ndarray: Khung hình đã được vẽ
+        """
+        display_frame = frame.copy()
+        
+        for detection in processed_detections:
+            x1, y1, x2, y2 = detection['bbox']
+            distance = detection['distance']
+            class_name = detection['class']
+            confidence = detection['confidence']
+            risk = detection['risk']
+            
+            # Màu sắc dựa trên mức độ nguy hiểm
+            color = risk['color']
+            thickness = 3 if risk['needs_alert'] else 2
+            
+            # Vẽ bounding box
+            cv2.rectangle(display_frame, (x1, y1), (x2, y2), color, thickness)
+            
+            # Vẽ nhãn với thông tin
+            label_parts = []
+            if distance is not None:
+                label_parts.append(f"{distance:.2f}m")
+            
+            # Thêm TTC nếu có
+            ttc = risk.get('ttc')
+            if ttc is not None:
+                label_parts.append(f"TTC: {ttc:.1f}s")
+            
+            label_parts.append(class_name)
+            label_parts.append(f"{confidence:.1%}")
+            
+            label = " | ".join(label_parts)
+            
+            # Tính kích thước text
+            font = cv2.FONT_HERSHEY_SIMPLEX
+            font_scale = 0.6
+            (text_width, text_height), baseline = cv2.getTextSize(
+                label, font, font_scale, 2
+            )
+            
+            # Vẽ background cho text
+            cv2.rectangle(
+                display_frame,
+                (x1, y1 - text_height - baseline - 5),
+                (x1 + text_width, y1),
+                color,
+                -1
+            )
+            
+            # Vẽ text
+            cv2.putText(
+                display_frame,
+                label,
+                (x1, y1 - 5),
+                font,
+                font_scale,
+                (255, 255, 255),
+                2
+            )
+        
+        return display_frame
+    
+    @staticmethod
+    def draw_status_overlay(frame, fps=None, alert_count=0, closest_distance=None, status_text=None, closest_ttc=None):
+        """
+        Vẽ thông tin trạng thái lên khung hình
+        
+        Args:
+            frame: Khung hình đầu vào
+            fps: FPS hiện tại
+            alert_count: Số lượng cảnh báo
+            closest_distance: Khoảng cách gần nhất
+            status_text: Text trạng thái bổ sung (ví dụ: "Xe: DỪNG", "Cảnh báo: TẮT")
+        
+        Returns:
+            numpy.ndarray: Khung hình đã được vẽ
+        """
+        display_frame = frame.copy()
+        h, w = display_frame.shape[:2]
+        
+        # Vẽ background cho thông tin (mở rộng nếu có status_text)
+        overlay = display_frame.copy()
+        height = 130 if status_text else 100
+        cv2.rectangle(overlay, (10, 10), (350, height), (0, 0, 0), -1)
+        cv2.addWeighted(overlay, 0.7, display_frame, 0.3, 0, display_frame)
+        
+        y_offset = 30
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        
+        # FPS
+        if fps is not None:
+            cv2.putText(
+                display_frame,
+                f"FPS: {fps}",
+                (20, y_offset),
+                font,
+                0.6,
+                (0, 255, 0),
+                2
+            )
+            y_offset += 25
+        
+        # Số lượng cảnh báo
+        if alert_count > 0:
+            cv2.putText(
+                display_frame,
+                f"Canh bao: {alert_count}",
+                (20, y_offset),
+                font,
+                0.6,
+                (0, 0, 255),
+                2
+            )
+            y_offset += 25
+        
+        # Khoảng cách gần nhất
+        if closest_distance is not None:
+            distance_text = f"Gan nhat: {closest_distance:.2f}m"
+            if closest_ttc is not None:
+                distance_text += f" (TTC: {closest_ttc:.1f}s)"
+            cv2.putText(
+                display_frame,
+                distance_text,
+                (20, y_offset),
+                font,
+                0.6,
+                (0, 255, 255),
+                2
+            )
+            y_offset += 25
+        
+        # Trạng thái bổ sung
+        if status_text:
+            cv2.putText(
+                display_frame,
+                status_text,
+                (20, y_offset),
+                font,
+                0.6,
+                (0, 165, 255),  # Màu cam
+                2
+            )
+        
+        return display_frame
+    
+    @staticmethod
+    def to_display_rgb(frame, target_size):
+        """
+        Thu nhỏ/phóng to khung hình vừa vùng hiển thị (giữ tỷ lệ) và chuyển sang RGB
+        
+        Args:
+            frame: Khung hình BGR
+            target_size: (rộng, cao) của vùng hiển thị
+        
+        Returns:
+            numpy.ndarray: Khung hình RGB đã đổi kích thước
+        """
+        h, w = frame.shape[:2]
+        target_w, target_h = target_size
+        
+        # Tính scale để giữ tỷ lệ khung hình
+        scale = min(target_w / w, target_h / h)
+        new_w = int(w * scale)
+        new_h = int(h * scale)
+        
+        # Chỉ resize nếu cần thiết
+        if new_w != w or new_h != h:
+            frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
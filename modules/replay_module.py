@@ -0,0 +1,167 @@
+"""
+Module phát lại kết quả phát hiện đã ghi trong file telemetry (bỏ qua YOLO)
+
+Dùng để chỉnh ngưỡng (TTC, debounce, vận tốc tối thiểu, lề làn đường, ...): các công đoạn
+lọc làn → khoảng cách → TTC → chuyển động → quyết định chạy lại trên vật thể đã ghi,
+cho ra dòng thời gian cảnh báo như hệ thống thực tế, với tốc độ hàng nghìn khung hình/giây.
+"""
+
+import json
+import time
+import numpy as np
+from modules.distance_module import DistanceModule
+from modules.lane_filter_module import LaneFilterModule
+from modules.logger_module import LoggerModule
+from modules.motion_detection_module import MotionDetectionModule
+from modules.ttc_module import TTCModule
+from modules.pipeline_module import PipelineModule, result_to_dict
+from modules.stages_module import Stage
+from modules.telemetry_module import TelemetryReader
+from config.config import ENABLE_MOTION_DETECTION, ENABLE_TTC
+
+
+# Các trường của vật thể thô do DetectionModule.detect trả về
+RAW_DETECTION_KEYS = ('class', 'class_id', 'confidence', 'bbox', 'pixel_height', 'pixel_width')
+
+
+class ReplayDetectStage(Stage):
+    """Thay thế DetectStage: lấy vật thể từ khung hình telemetry thay vì chạy YOLO"""
+    
+    name = 'detect'
+    
+    def __init__(self, enabled=True):
+        super().__init__(enabled)
+        self.current = None  # dict khung hình từ TelemetryReader.iter_frames()
+    
+    def process(self, ctx):
+        frame = self.current
+        detections = [{key: det[key] for key in RAW_DETECTION_KEYS} for det in frame['detections']]
+        ctx.detections = detections
+        ctx.raw_detections = detections
+        ctx.detections_reused = frame['detections_reused']
+        ctx.ego_velocity = frame['ego_velocity']
+
+
+class ReplayRunner:
+    """Chạy lại chuỗi quyết định cảnh báo trên file telemetry"""
+    
+    def __init__(self, telemetry_path, max_frames=None, output_path=None, start=None, end=None):
+        """
+        Khởi tạo replay runner
+        
+        Args:
+            telemetry_path: File telemetry ghi bởi TelemetryRecorder
+            max_frames: Số khung hình tối đa, None nếu không giới hạn
+            output_path: File JSONL ghi kết quả từng khung hình, hoặc None
+            start: Thời điểm bắt đầu (giây, theo timestamp đã ghi), None nếu từ đầu
+            end: Thời điểm kết thúc (giây), None nếu đến cuối
+        """
+        self.telemetry_path = telemetry_path
+        self.max_frames = max_frames
+        self.output_path = output_path
+        self.start = start
+        self.end = end
+        
+        # Logger không khởi tạo: không ghi file/kho sự kiện khi phát lại
+        self.logger = LoggerModule()
+        self.detect_stage = ReplayDetectStage()
+        self.pipeline = PipelineModule(
+            None,
+            DistanceModule(),
+            LaneFilterModule(),
+            self.logger,
+            alert=None,
+            ttc_module=TTCModule() if ENABLE_TTC else None,
+            motion_detection=MotionDetectionModule() if ENABLE_MOTION_DETECTION else None,
+            render=False,
+            adaptive=False
+        )
+        self.pipeline.replace_stage('detect', self.detect_stage)
+        # Không đo thời gian từng công đoạn khi phát lại
+        if self.pipeline.latency is not None:
+            self.pipeline.remove_timing_hook(self.pipeline.latency.stage_hook)
+        self.stats = {}
+    
+    def run(self):
+        """
+        Phát lại toàn bộ file
+        
+        Returns:
+            dict: Thống kê, gồm dòng thời gian cảnh báo khi phát lại ('alert_timeline')
+                  và khi ghi ('recorded_timeline') cùng số khung hình quyết định khác nhau
+        """
+        reader = TelemetryReader(self.telemetry_path)
+        output_file = open(self.output_path, 'w', encoding='utf-8') if self.output_path else None
+        placeholders = {}
+        
+        replay_timeline = []
+        recorded_timeline = []
+        replay_open = None
+        recorded_open = None
+        last_timestamp = None
+        frames = 0
+        mismatched = 0
+        
+        start_time = time.time()
+        self.pipeline.start(None, threaded=False)
+        try:
+            for frame in reader.iter_frames(self.start, self.end):
+                # Khung hình rỗng chỉ mang kích thước (lọc làn đường cần chiều rộng/cao)
+                size = (frame['height'], frame['width'])
+                placeholder = placeholders.get(size)
+                if placeholder is None:
+                    placeholder = np.empty((size[0], size[1], 0), dtype=np.uint8)
+                    placeholders[size] = placeholder
+                
+                self.detect_stage.current = frame
+                timestamp = frame['timestamp']
+                result = self.pipeline.process_frame(placeholder, frame['frame_seq'], timestamp)
+                frames += 1
+                
+                if result.should_alert != frame['should_alert']:
+                    mismatched += 1
+                replay_open = self._update_timeline(replay_timeline, replay_open,
+                                                    result.should_alert, timestamp)
+                recorded_open = self._update_timeline(recorded_timeline, recorded_open,
+                                                      frame['should_alert'], timestamp)
+                last_timestamp = timestamp
+                
+                if output_file is not None:
+                    output_file.write(json.dumps(result_to_dict(result), ensure_ascii=False))
+                    output_file.write('\n')
+                
+                if self.max_frames is not None and frames >= self.max_frames:
+                    break
+        finally:
+            self.pipeline.stop()
+            reader.close()
+            if output_file is not None:
+                output_file.close()
+        
+        for timeline, open_start in ((replay_timeline, replay_open), (recorded_timeline, recorded_open)):
+            if open_start is not None:
+                timeline.append((open_start, last_timestamp))
+        
+        elapsed = time.time() - start_time
+        self.stats = {
+            'telemetry': self.telemetry_path,
+            'frames': frames,
+            'elapsed_s': elapsed,
+            'fps': frames / elapsed if elapsed > 0 else 0.0,
+            'alert_events': len(replay_timeline),
+            'recorded_alert_events': len(recorded_timeline),
+            'mismatched_frames': mismatched,
+            'alert_timeline': replay_timeline,
+            'recorded_timeline': recorded_timeline
+        }
+        return self.stats
+    
+    @staticmethod
+    def _update_timeline(timeline, open_start, alerting, timestamp):
+        """Cập nhật danh sách khoảng cảnh báo (bắt đầu, kết thúc); trả về thời điểm bắt đầu đang mở"""
+        if alerting and open_start is None:
+            return timestamp
+        if not alerting and open_start is not None:
+            timeline.append((open_start, timestamp))
+            return None
+        return open_start
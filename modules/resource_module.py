@@ -0,0 +1,338 @@
+"""
+Module phân bổ luồng và lõi CPU cho thu nhận khung hình, suy luận YOLO và giao diện
+
+Mặc định torch tạo bao nhiêu luồng tính toán tùy ý và mọi luồng tranh nhau cùng các lõi, làm
+nhịp đọc khung hình của CameraModule và nhịp cập nhật giao diện bị giật. Module này:
+- đặt số luồng torch (intra-op/inter-op) và OpenCV,
+- gán luồng thu nhận ('capture'), luồng suy luận ('inference') và luồng giao diện ('render')
+  vào các tập lõi riêng bằng os.sched_setaffinity (trên Linux pid 0 là luồng đang gọi, nên mỗi
+  luồng tự gán khi bắt đầu chạy; các luồng tạo sau đó, kể cả nhóm luồng OpenMP của torch, kế thừa),
+- đo thời gian suy luận với các số luồng khác nhau lúc khởi động và lưu lựa chọn tốt nhất theo máy.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import numpy as np
+import cv2
+from config.config import (
+    TORCH_INTRA_OP_THREADS, TORCH_INTER_OP_THREADS, OPENCV_THREADS, CPU_AFFINITY,
+    THREAD_TUNE_CACHE, THREAD_TUNE_ITERATIONS, THREAD_TUNE_WARMUP, THREAD_TUNE_TOLERANCE,
+    CAMERA_WIDTH, CAMERA_HEIGHT
+)
+
+ROLES = ('capture', 'inference', 'render')
+
+
+def _torch():
+    """Nạp torch khi cần (các lệnh không dùng YOLO như phát lại telemetry không phải chờ nạp torch)"""
+    try:
+        import torch
+        return torch
+    except ImportError:
+        return None
+
+
+def parse_cores(spec):
+    """
+    Đọc tập lõi CPU
+    
+    Args:
+        spec: Chuỗi dạng '0-3,6' hoặc danh sách số lõi
+    
+    Returns:
+        list: Các lõi đã sắp xếp, không trùng
+    """
+    if isinstance(spec, int):
+        return [spec]
+    if not isinstance(spec, str):
+        return sorted(set(int(core) for core in spec))
+    cores = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cores.update(range(int(first), int(last) + 1))
+        else:
+            cores.add(int(part))
+    return sorted(cores)
+
+
+def available_cores():
+    """Các lõi tiến trình được phép chạy (theo cgroup/taskset nếu có)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def plan_affinity(cores=None):
+    """
+    Chia lõi tự động: thu nhận và giao diện dùng chung lõi đầu tiên, suy luận dùng các lõi còn lại
+    
+    Args:
+        cores: Các lõi được dùng, None để lấy available_cores()
+    
+    Returns:
+        dict: Vai trò → danh sách lõi, rỗng nếu chỉ có một lõi (không cần gán)
+    """
+    cores = sorted(cores) if cores is not None else available_cores()
+    if len(cores) < 2:
+        return {}
+    return {'capture': cores[:1], 'render': cores[:1], 'inference': cores[1:]}
+
+
+def parse_affinity(spec):
+    """
+    Đọc cấu hình gán lõi
+    
+    Args:
+        spec: None, 'auto', dict vai trò → lõi, hoặc danh sách chuỗi 'vai_trò=lõi' (tham số dòng lệnh)
+    
+    Returns:
+        dict: Vai trò → danh sách lõi (rỗng nếu không gán)
+    """
+    if not spec:
+        return {}
+    if isinstance(spec, str):
+        spec = [spec]
+    if not isinstance(spec, dict):
+        if list(spec) == ['auto']:
+            return plan_affinity()
+        if list(spec) == ['none']:
+            return {}
+        pairs = {}
+        for item in spec:
+            if '=' not in item:
+                raise ValueError(f"Cấu hình lõi không hợp lệ: {item} (dạng vai_trò=lõi, vd. inference=1-3)")
+            role, cores = item.split('=', 1)
+            pairs[role.strip()] = cores
+        spec = pairs
+    affinity = {}
+    for role, cores in spec.items():
+        if role not in ROLES:
+            raise ValueError(f"Vai trò không hợp lệ: {role} (chọn trong {', '.join(ROLES)})")
+        affinity[role] = parse_cores(cores)
+    return affinity
+
+
+def pin_current_thread(cores):
+    """
+    Gán luồng đang chạy vào tập lõi
+    
+    Args:
+        cores: Danh sách lõi, None hoặc rỗng để giữ nguyên
+    
+    Returns:
+        bool: True nếu đã gán
+    """
+    if not cores or not hasattr(os, 'sched_setaffinity'):
+        return False
+    try:
+        os.sched_setaffinity(0, cores)
+        return True
+    except OSError as e:
+        print(f"Lỗi gán lõi CPU {cores}: {e}")
+        return False
+
+
+def set_thread_counts(intra_op=None, inter_op=None, opencv=None):
+    """
+    Đặt số luồng torch và OpenCV (None để giữ nguyên)
+    
+    Returns:
+        dict: Số luồng đang dùng sau khi đặt
+    """
+    torch = _torch()
+    if opencv is not None:
+        cv2.setNumThreads(int(opencv))
+    if torch is not None:
+        if intra_op is not None:
+            torch.set_num_threads(int(intra_op))
+        if inter_op is not None and torch.get_num_interop_threads() != inter_op:
+            try:
+                torch.set_num_interop_threads(int(inter_op))
+            except RuntimeError as e:
+                # Chỉ đặt được trước khi torch chạy phép tính song song đầu tiên
+                print(f"Lỗi đặt số luồng inter-op của torch: {e}")
+    return {
+        'intra_op_threads': torch.get_num_threads() if torch is not None else None,
+        'inter_op_threads': torch.get_num_interop_threads() if torch is not None else None,
+        'opencv_threads': cv2.getNumThreads()
+    }
+
+
+def thread_candidates(max_threads):
+    """Các số luồng cần đo: 1, 2, 4, ... và max_threads"""
+    candidates = []
+    threads = 1
+    while threads < max_threads:
+        candidates.append(threads)
+        threads *= 2
+    candidates.append(max(1, max_threads))
+    return candidates
+
+
+def machine_key(detection, cores):
+    """Khóa của kết quả đo trong file lưu: tên máy, số lõi, tập lõi suy luận và cấu hình mô hình"""
+    return '|'.join([
+        socket.gethostname(),
+        f"{os.cpu_count()}cpu",
+        ','.join(str(core) for core in cores),
+        os.path.basename(str(detection.model_path)),
+        str(detection.input_size),
+        str(detection.device or 'auto')
+    ])
+
+
+def _load_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(path, cache):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def autotune_threads(detection, cores=None, cache_path=THREAD_TUNE_CACHE, iterations=THREAD_TUNE_ITERATIONS,
+                     warmup=THREAD_TUNE_WARMUP, tolerance=THREAD_TUNE_TOLERANCE, force=False):
+    """
+    Đo thời gian suy luận với các số luồng torch khác nhau và chọn số luồng tốt nhất
+    
+    Kết quả được lưu theo machine_key(), các lần khởi động sau đọc lại mà không đo.
+    Khi đo, luồng gọi được gán tạm vào các lõi suy luận để kết quả khớp lúc chạy thật.
+    
+    Args:
+        detection: DetectionModule đã nạp mô hình
+        cores: Các lõi dành cho suy luận, None để dùng mọi lõi được phép
+        cache_path: File lưu kết quả, None để không lưu
+        iterations: Số lần suy luận đo cho mỗi số luồng
+        warmup: Số lần suy luận chạy trước khi đo
+        tolerance: Chọn số luồng ít nhất có thời gian trung vị không quá (1 + tolerance) × nhanh nhất
+        force: Đo lại kể cả khi đã có kết quả lưu
+    
+    Returns:
+        tuple: (số luồng đã chọn, dict thông tin đo: 'source' là 'cache' hoặc 'benchmark', 'median_ms' theo số luồng)
+    """
+    cores = sorted(cores) if cores else available_cores()
+    key = machine_key(detection, cores)
+    cache = _load_cache(cache_path) if cache_path else {}
+    if not force and key in cache:
+        entry = cache[key]
+        return entry['threads'], {'source': 'cache', 'key': key, 'median_ms': entry.get('median_ms', {})}
+    
+    previous_cores = available_cores()
+    pinned = pin_current_thread(cores)
+    torch = _torch()
+    previous_threads = torch.get_num_threads() if torch is not None else None
+    frame = np.random.default_rng(0).integers(0, 256, (CAMERA_HEIGHT, CAMERA_WIDTH, 3), dtype=np.uint8)
+    median_ms = {}
+    try:
+        for threads in thread_candidates(len(cores)):
+            set_thread_counts(intra_op=threads)
+            for _ in range(warmup):
+                detection.detect(frame)
+            times = []
+            for _ in range(max(1, iterations)):
+                start = time.perf_counter()
+                detection.detect(frame)
+                times.append((time.perf_counter() - start) * 1000)
+            median_ms[threads] = float(np.median(times))
+    finally:
+        set_thread_counts(intra_op=previous_threads)
+        if pinned:
+            pin_current_thread(previous_cores)
+    
+    fastest = min(median_ms.values())
+    best = min(threads for threads, ms in median_ms.items() if ms <= fastest * (1 + tolerance))
+    info = {'source': 'benchmark', 'key': key, 'median_ms': {str(t): ms for t, ms in median_ms.items()}}
+    if cache_path:
+        cache = _load_cache(cache_path)  # Đọc lại phòng khi tiến trình khác vừa ghi
+        cache[key] = {'threads': best, 'median_ms': info['median_ms'],
+                      'tuned_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        try:
+            _save_cache(cache_path, cache)
+        except OSError as e:
+            print(f"Lỗi lưu kết quả đo số luồng: {e}")
+    return best, info
+
+
+class ResourceManager:
+    """Cấu hình số luồng torch/OpenCV và lõi CPU của từng vai trò trong một lần chạy"""
+    
+    def __init__(self, intra_op_threads=TORCH_INTRA_OP_THREADS, inter_op_threads=TORCH_INTER_OP_THREADS,
+                 opencv_threads=OPENCV_THREADS, affinity=CPU_AFFINITY, cache_path=THREAD_TUNE_CACHE,
+                 retune=False):
+        """
+        Args:
+            intra_op_threads: Số luồng torch trong một phép tính, 'auto' để đo và chọn, None để giữ mặc định
+            inter_op_threads: Số luồng torch chạy song song các phép tính độc lập, None để giữ mặc định
+            opencv_threads: Số luồng OpenCV, None để giữ mặc định
+            affinity: Lõi của từng vai trò (xem parse_affinity), None để không gán
+            cache_path: File lưu kết quả đo số luồng
+            retune: Đo lại kể cả khi đã có kết quả lưu
+        """
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.opencv_threads = opencv_threads
+        self.affinity = parse_affinity(affinity)
+        self.cache_path = cache_path
+        self.retune = retune
+        self.tuning = None  # Thông tin đo số luồng (khi intra_op_threads là 'auto')
+        self.applied = {}  # Số luồng đang dùng sau apply()
+        self.pinned = {}  # Vai trò → native id của các luồng đã gán qua pin()
+    
+    def cores(self, role):
+        """Các lõi của vai trò, None nếu không gán"""
+        return self.affinity.get(role) or None
+    
+    def apply(self, detection=None):
+        """
+        Đặt số luồng torch/OpenCV (gọi sau khi nạp mô hình, trước lần suy luận đầu tiên)
+        
+        Args:
+            detection: DetectionModule đã nạp mô hình, dùng để đo khi intra_op_threads là 'auto'
+        """
+        intra_op = self.intra_op_threads
+        if intra_op == 'auto':
+            intra_op = None
+            if _torch() is not None and detection is not None and detection.model is not None:
+                try:
+                    intra_op, self.tuning = autotune_threads(detection, cores=self.cores('inference'),
+                                                             cache_path=self.cache_path, force=self.retune)
+                except Exception as e:
+                    print(f"Lỗi đo số luồng suy luận: {e}")
+        elif intra_op is None and self.cores('inference'):
+            # Không tạo nhiều luồng hơn số lõi dành cho suy luận
+            intra_op = len(self.cores('inference'))
+        self.applied = set_thread_counts(intra_op, self.inter_op_threads, self.opencv_threads)
+        return self.applied
+    
+    def pin(self, role):
+        """Gán luồng đang chạy vào các lõi của vai trò"""
+        if not pin_current_thread(self.cores(role)):
+            return False
+        self.pinned.setdefault(role, []).append(threading.get_native_id())
+        return True
+    
+    def get_stats(self):
+        """Cấu hình đang áp dụng"""
+        return {
+            **self.applied,
+            'affinity': dict(self.affinity),
+            'pinned': {role: list(ids) for role, ids in self.pinned.items()},
+            'tuning': self.tuning
+        }
+
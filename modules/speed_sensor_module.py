@@ -0,0 +1,461 @@
+"""
+Module đọc vận tốc xe từ cảm biến (NMEA 0183 từ GPS, PID 0D của OBD-II)
+
+Luồng đọc nhận dữ liệu từ cổng serial, socket UDP hoặc file phát lại và ghi từng mẫu
+(thời điểm nhận theo time.perf_counter(), vận tốc m/s) vào vùng đệm vòng. Pipeline nội suy
+vận tốc tại thời điểm thu nhận khung hình mà không cần khóa: chỉ có một luồng ghi, mẫu được
+ghi xong trước khi tăng bộ đếm nên luồng đọc luôn thấy các mẫu đã hoàn chỉnh.
+"""
+
+import os
+import re
+import socket
+import threading
+import time
+from config.config import (
+    SPEED_SERIAL_BAUDRATE, SPEED_OBD_POLL_HZ, SPEED_BUFFER_SIZE, SPEED_MAX_AGE_S, SPEED_LATENCY_S,
+    SPEED_REPLAY_RATE_HZ
+)
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+
+KNOTS_TO_MS = 0.514444
+KMH_TO_MS = 1.0 / 3.6
+
+
+def _nmea_checksum_ok(sentence):
+    """Kiểm tra checksum của câu NMEA (câu không có checksum được chấp nhận)"""
+    if '*' not in sentence:
+        return True
+    body, checksum = sentence[1:].split('*', 1)
+    value = 0
+    for ch in body:
+        value ^= ord(ch)
+    try:
+        return value == int(checksum[:2], 16)
+    except ValueError:
+        return False
+
+
+def parse_nmea_speed(line):
+    """
+    Đọc vận tốc từ câu NMEA RMC hoặc VTG (mọi talker: GP, GN, GL, ...)
+    
+    Args:
+        line: Một câu NMEA, vd. '$GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*6A'
+    
+    Returns:
+        float: Vận tốc (m/s) hoặc None nếu không phải câu vận tốc hợp lệ
+    """
+    line = line.strip()
+    if not line.startswith('$') or len(line) < 7 or not _nmea_checksum_ok(line):
+        return None
+    fields = line.split('*', 1)[0].split(',')
+    kind = fields[0][3:]
+    try:
+        if kind == 'RMC' and len(fields) > 7:
+            if fields[2] != 'A':  # V = không có định vị
+                return None
+            return float(fields[7]) * KNOTS_TO_MS
+        if kind == 'VTG' and len(fields) > 7:
+            if fields[7]:
+                return float(fields[7]) * KMH_TO_MS
+            return float(fields[5]) * KNOTS_TO_MS
+    except ValueError:
+        return None
+    return None
+
+
+def parse_obd_speed(line):
+    """
+    Đọc vận tốc từ phản hồi OBD-II mode 01 PID 0D (vd. '41 0D 3C' hoặc '7E8 03 41 0D 3C' = 60 km/h)
+    
+    Returns:
+        float: Vận tốc (m/s) hoặc None
+    """
+    compact = ''.join(line.split()).upper()
+    index = compact.find('410D')
+    if index < 0 or len(compact) < index + 6:
+        return None
+    try:
+        return int(compact[index + 4:index + 6], 16) * KMH_TO_MS
+    except ValueError:
+        return None
+
+
+def parse_speed_line(line):
+    """Đọc vận tốc (m/s) từ một dòng NMEA hoặc OBD, None nếu không đọc được"""
+    line = line.strip()
+    if line.startswith('$'):
+        return parse_nmea_speed(line)
+    return parse_obd_speed(line)
+
+
+def parse_log_line(line):
+    """
+    Đọc một dòng của file ghi cảm biến, có thể có cột thời gian (giây, viết có dấu chấm thập phân
+    để không nhầm với byte của phản hồi OBD) ở đầu: '12.35 $GPRMC,...' hoặc '12.35,41 0D 3C'
+    
+    Returns:
+        tuple: (thời điểm hoặc None, vận tốc m/s hoặc None)
+    """
+    parts = re.split(r'[\s,]', line.strip(), maxsplit=1)
+    if len(parts) == 2 and '.' in parts[0] and not parts[0].startswith('$'):
+        try:
+            timestamp = float(parts[0])
+        except ValueError:
+            timestamp = None
+        if timestamp is not None:
+            return timestamp, parse_speed_line(parts[1])
+    return None, parse_speed_line(line)
+
+
+class SpeedBuffer:
+    """
+    Vùng đệm vòng các mẫu (thời điểm, vận tốc) với một luồng ghi và nhiều luồng đọc không cần khóa
+    
+    Thời điểm các mẫu phải tăng dần. Tra cứu quanh mẫu mới nhất là O(1),
+    thời điểm cũ hơn được tìm nhị phân trong vùng đệm.
+    """
+    
+    def __init__(self, capacity=SPEED_BUFFER_SIZE):
+        self.capacity = capacity
+        self._times = [0.0] * capacity
+        self._speeds = [0.0] * capacity
+        self._count = 0  # Tổng số mẫu đã ghi; chỉ tăng sau khi mẫu đã được ghi xong
+    
+    def append(self, timestamp, speed):
+        """Ghi một mẫu (chỉ gọi từ một luồng)"""
+        index = self._count % self.capacity
+        self._times[index] = timestamp
+        self._speeds[index] = speed
+        self._count += 1
+    
+    def clear(self):
+        self._count = 0
+    
+    def latest(self):
+        """
+        Returns:
+            tuple: (thời điểm, vận tốc) của mẫu mới nhất hoặc None
+        """
+        n = self._count
+        if n == 0:
+            return None
+        index = (n - 1) % self.capacity
+        return self._times[index], self._speeds[index]
+    
+    def at(self, timestamp, max_age=SPEED_MAX_AGE_S):
+        """
+        Nội suy tuyến tính vận tốc tại một thời điểm
+        
+        Args:
+            timestamp: Thời điểm cần tra (cùng gốc thời gian với các mẫu)
+            max_age: Khoảng cách tối đa (giây) tới mẫu gần nhất khi nằm ngoài vùng có mẫu
+                     hoặc giữa hai mẫu cách xa nhau
+        
+        Returns:
+            float: Vận tốc (m/s) hoặc None nếu không có mẫu đủ gần
+        """
+        n = self._count
+        if n == 0:
+            return None
+        cap = self.capacity
+        times = self._times
+        speeds = self._speeds
+        # Ô ứng với mẫu thứ n - capacity có thể đang bị ghi đè bởi mẫu thứ n
+        lo = max(0, n - cap + 1)
+        hi = n - 1
+        
+        t_hi = times[hi % cap]
+        if timestamp >= t_hi:
+            # Sau mẫu mới nhất: giữ nguyên giá trị (không ngoại suy)
+            return speeds[hi % cap] if timestamp - t_hi <= max_age else None
+        
+        if hi > lo and timestamp >= times[(hi - 1) % cap]:
+            j = hi
+        else:
+            t_lo = times[lo % cap]
+            if timestamp <= t_lo:
+                return speeds[lo % cap] if t_lo - timestamp <= max_age else None
+            # Tìm mẫu đầu tiên có thời điểm > timestamp
+            left, right = lo + 1, hi - 1
+            while left < right:
+                mid = (left + right) // 2
+                if times[mid % cap] > timestamp:
+                    right = mid
+                else:
+                    left = mid + 1
+            j = left
+        
+        t0, v0 = times[(j - 1) % cap], speeds[(j - 1) % cap]
+        t1, v1 = times[j % cap], speeds[j % cap]
+        if t1 - t0 > 2 * max_age:
+            # Khoảng trống dài (mất tín hiệu): chỉ dùng mẫu đủ gần
+            if timestamp - t0 <= max_age:
+                return v0
+            return v1 if t1 - timestamp <= max_age else None
+        if t1 <= t0:
+            return v1
+        return v0 + (v1 - v0) * (timestamp - t0) / (t1 - t0)
+
+
+class SpeedSensor:
+    """Đọc vận tốc xe trên luồng nền và cung cấp vận tốc đã nội suy theo thời điểm khung hình"""
+    
+    def __init__(self, source, latency_s=SPEED_LATENCY_S, max_age_s=SPEED_MAX_AGE_S,
+                 capacity=SPEED_BUFFER_SIZE, replay_rate_hz=SPEED_REPLAY_RATE_HZ):
+        """
+        Args:
+            source: Nguồn dữ liệu:
+                    'serial:/dev/ttyUSB0[@baud]' - câu NMEA từ GPS qua cổng serial,
+                    'obd:/dev/ttyUSB0[@baud]' - hỏi PID 0D qua bộ chuyển đổi OBD kiểu ELM327,
+                    'udp:[host:]port' - câu NMEA/OBD trong gói UDP,
+                    'file:path' hoặc đường dẫn file - phát lại file ghi theo thời gian thực
+            latency_s: Độ trễ truyền của cảm biến (giây), trừ vào thời điểm nhận mẫu
+            max_age_s: Mẫu cách thời điểm khung hình quá thời gian này coi như mất tín hiệu
+            capacity: Số mẫu giữ trong vùng đệm vòng
+            replay_rate_hz: Tốc độ phát lại dòng không có cột thời gian (mẫu/giây)
+        """
+        self.source = source
+        self.kind, self.address = self._parse_source(source)
+        self.latency_s = latency_s
+        self.max_age_s = max_age_s
+        self.replay_rate_hz = replay_rate_hz
+        self.buffer = SpeedBuffer(capacity)
+        # True khi các mẫu được gắn thời gian trong video (file ghi nạp sẵn cho xử lý offline)
+        # thay vì thời điểm nhận theo time.perf_counter()
+        self.video_time = False
+        
+        self.samples = 0
+        self.parse_errors = 0
+        self.is_running = False
+        self._thread = None
+        self._handle = None
+    
+    @staticmethod
+    def _parse_source(source):
+        """Tách loại nguồn và địa chỉ từ chuỗi cấu hình"""
+        kind, sep, address = str(source).partition(':')
+        if sep and kind in ('serial', 'obd', 'udp', 'file'):
+            return kind, address
+        return 'file', str(source)
+    
+    def _serial_address(self, default_baud):
+        port, _, baud = self.address.partition('@')
+        return port, int(baud) if baud else default_baud
+    
+    def start(self):
+        """
+        Mở nguồn và bắt đầu luồng đọc
+        
+        Returns:
+            bool: True nếu mở được nguồn
+        """
+        if self.is_running:
+            return True
+        try:
+            self._handle = self._open()
+        except Exception as e:
+            print(f"Lỗi mở cảm biến vận tốc {self.source}: {e}")
+            return False
+        self.buffer.clear()
+        self.video_time = False
+        self.is_running = True
+        self._thread = threading.Thread(target=self._read_loop, name='SpeedSensor', daemon=True)
+        self._thread.start()
+        return True
+    
+    def load_log(self):
+        """
+        Nạp toàn bộ file ghi cảm biến, gắn mỗi mẫu với thời gian trong video
+        (cột thời gian ở đầu dòng, hoặc số thứ tự dòng / replay_rate_hz) - dùng khi xử lý video offline
+        
+        Returns:
+            bool: True nếu đọc được ít nhất một mẫu
+        """
+        if self.kind != 'file':
+            return False
+        try:
+            with open(self.address, 'r', encoding='utf-8', errors='replace') as f:
+                lines = f.readlines()
+        except OSError as e:
+            print(f"Lỗi đọc file cảm biến vận tốc: {e}")
+            return False
+        
+        samples = []
+        for i, line in enumerate(lines):
+            timestamp, speed = parse_log_line(line)
+            if speed is None:
+                if line.strip():
+                    self.parse_errors += 1
+                continue
+            if timestamp is None:
+                timestamp = i / self.replay_rate_hz
+            if samples and timestamp < samples[-1][0]:
+                continue  # Bỏ mẫu lùi thời gian
+            samples.append((timestamp, speed))
+        
+        self.buffer = SpeedBuffer(max(len(samples) + 1, self.buffer.capacity))
+        for timestamp, speed in samples:
+            self.buffer.append(timestamp, speed)
+        self.samples = len(samples)
+        self.video_time = True
+        return bool(samples)
+    
+    def stop(self):
+        """Dừng luồng đọc và đóng nguồn"""
+        self.is_running = False
+        handle = self._handle
+        if handle is not None:
+            try:
+                handle.close()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+        self._handle = None
+    
+    def speed_at(self, timestamp):
+        """
+        Vận tốc xe (m/s) tại một thời điểm (gọi từ luồng pipeline, không chờ)
+        
+        Args:
+            timestamp: time.perf_counter() lúc thu nhận khung hình,
+                       hoặc thời gian trong video nếu video_time
+        
+        Returns:
+            float: Vận tốc (m/s) hoặc None nếu chưa có mẫu hoặc mất tín hiệu
+        """
+        return self.buffer.at(timestamp, self.max_age_s)
+    
+    def get_stats(self):
+        """Thống kê cảm biến"""
+        latest = self.buffer.latest()
+        return {
+            'source': str(self.source),
+            'samples': self.samples,
+            'parse_errors': self.parse_errors,
+            'latest_speed_ms': latest[1] if latest else None,
+            'latest_age_s': (time.perf_counter() - latest[0]
+                             if latest and not self.video_time else None)
+        }
+    
+    def _add_sample(self, speed, received):
+        """Ghi một mẫu vào vùng đệm (chỉ luồng đọc gọi)"""
+        timestamp = received - self.latency_s
+        latest = self.buffer.latest()
+        if latest is not None and timestamp < latest[0]:
+            timestamp = latest[0]
+        self.buffer.append(timestamp, speed)
+        self.samples += 1
+    
+    def _handle_line(self, line, received):
+        speed = parse_speed_line(line)
+        if speed is None:
+            if line.strip():
+                self.parse_errors += 1
+            return
+        self._add_sample(speed, received)
+    
+    def _open(self):
+        """Mở cổng serial, socket UDP hoặc file tùy loại nguồn"""
+        if self.kind in ('serial', 'obd'):
+            if serial is None:
+                raise RuntimeError("Chưa cài đặt pyserial (pip install pyserial)")
+            port, baud = self._serial_address(SPEED_SERIAL_BAUDRATE)
+            return serial.Serial(port, baud, timeout=0.5)
+        if self.kind == 'udp':
+            host, _, port = self.address.rpartition(':')
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((host or '0.0.0.0', int(port)))
+            sock.settimeout(0.5)
+            return sock
+        if not os.path.isfile(self.address):
+            raise FileNotFoundError(self.address)
+        return open(self.address, 'r', encoding='utf-8', errors='replace')
+    
+    def _read_loop(self):
+        """Luồng đọc theo loại nguồn"""
+        try:
+            if self.kind == 'serial':
+                self._read_serial()
+            elif self.kind == 'obd':
+                self._read_obd()
+            elif self.kind == 'udp':
+                self._read_udp()
+            else:
+                self._replay_file()
+        except Exception as e:
+            if self.is_running:
+                print(f"Lỗi đọc cảm biến vận tốc: {e}")
+        finally:
+            self.is_running = False
+    
+    def _read_serial(self):
+        """Đọc từng câu NMEA từ cổng serial"""
+        while self.is_running:
+            raw = self._handle.readline()
+            if raw:
+                self._handle_line(raw.decode('ascii', errors='replace'), time.perf_counter())
+    
+    def _read_obd(self):
+        """Hỏi vận tốc (01 0D) định kỳ qua bộ chuyển đổi ELM327 và đọc phản hồi đến dấu nhắc '>'"""
+        handle = self._handle
+        for command in (b'ATZ\r', b'ATE0\r', b'ATL0\r'):  # Khởi động lại, tắt echo và xuống dòng thừa
+            handle.write(command)
+            handle.read_until(b'>')
+        period = 1.0 / SPEED_OBD_POLL_HZ
+        while self.is_running:
+            started = time.perf_counter()
+            handle.write(b'010D\r')
+            response = handle.read_until(b'>').decode('ascii', errors='replace')
+            received = time.perf_counter()
+            # Thời điểm của mẫu lấy ở giữa lúc hỏi và lúc nhận
+            speed = parse_obd_speed(response)
+            if speed is None:
+                self.parse_errors += 1
+            else:
+                self._add_sample(speed, (started + received) / 2.0)
+            remaining = period - (time.perf_counter() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+    
+    def _read_udp(self):
+        """Đọc các gói UDP, mỗi gói có thể chứa nhiều dòng"""
+        while self.is_running:
+            try:
+                data, _ = self._handle.recvfrom(4096)
+            except socket.timeout:
+                continue
+            received = time.perf_counter()
+            for line in data.decode('ascii', errors='replace').splitlines():
+                self._handle_line(line, received)
+    
+    def _replay_file(self):
+        """Phát lại file ghi theo thời gian thực (theo cột thời gian hoặc replay_rate_hz)"""
+        start = time.perf_counter()
+        first_timestamp = None
+        for i, line in enumerate(self._handle):
+            if not self.is_running:
+                break
+            timestamp, speed = parse_log_line(line)
+            if speed is None:
+                if line.strip():
+                    self.parse_errors += 1
+                continue
+            if timestamp is None:
+                offset = i / self.replay_rate_hz
+            else:
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                offset = timestamp - first_timestamp
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self._add_sample(speed, time.perf_counter())
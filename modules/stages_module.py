@@ -0,0 +1,564 @@
+"""
+Module các công đoạn (stage) của pipeline xử lý khung hình
+
+Mỗi công đoạn có cùng giao diện: đọc/ghi vào FrameContext dùng chung của khung hình.
+Các công đoạn có thể được sắp xếp lại, thay thế hoặc tắt riêng lẻ trong PipelineModule.
+"""
+
+import time
+from modules.render_module import RenderModule
+from modules.episode_module import EpisodeAggregator
+from modules.trajectory_module import BoxTracker
+from config.config import (MIN_VELOCITY_FOR_ALERT, MAX_TTC_FOR_ALERT,
+                          CONSECUTIVE_RISK_THRESHOLD, CONSECUTIVE_SAFE_THRESHOLD,
+                          TTC_DANGER, TTC_WARNING, SPEED_STOPPED_MS)
+
+
+class FrameContext:
+    """Dữ liệu dùng chung giữa các công đoạn khi xử lý một khung hình"""
+    
+    def __init__(self, frame, frame_seq=0, timestamp=None, capture_time=None):
+        """
+        Khởi tạo context
+        
+        Args:
+            frame: Khung hình đầu vào (numpy array)
+            frame_seq: Số thứ tự khung hình
+            timestamp: Thời điểm của khung hình (giây), mặc định time.time()
+            capture_time: Thời điểm thu nhận khung hình theo time.perf_counter(),
+                          mặc định là thời điểm tạo context
+        """
+        self.frame = frame
+        self.frame_seq = frame_seq
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.capture_time = capture_time if capture_time is not None else time.perf_counter()
+        self.height, self.width = frame.shape[:2]
+        
+        self.fps = 0
+        self.ego_velocity = None  # Vận tốc xe (m/s) nếu có cảm biến
+        self.detections = []
+        self.raw_detections = None  # Kết quả YOLO trước khi lọc làn đường
+        self.detections_reused = False  # Dùng lại kết quả phát hiện của khung hình trước
+        self.is_vehicle_stopped = False
+        self.has_risk = False
+        self.should_alert = False
+        self.alert_disabled = False
+        self.alert_count = 0
+        self.closest_distance = None
+        self.closest_ttc = None
+        self.display_frame = None
+        self.alert_trigger_time = None  # Thời điểm bắt đầu phát cảnh báo (perf_counter), nếu có
+        self.degradation_level = 0  # Mức giảm chất lượng đang áp dụng
+        self.extra = {}  # Dữ liệu bổ sung cho các công đoạn tùy biến
+
+
+class Stage:
+    """Lớp cơ sở cho một công đoạn của pipeline"""
+    
+    name = 'stage'
+    
+    def __init__(self, enabled=True):
+        """
+        Args:
+            enabled: Công đoạn có được chạy không
+        """
+        self.enabled = enabled
+    
+    def process(self, ctx):
+        """
+        Xử lý khung hình, đọc và ghi kết quả vào context
+        
+        Args:
+            ctx: FrameContext của khung hình hiện tại
+        """
+        raise NotImplementedError
+    
+    def reset(self):
+        """Xóa trạng thái giữa các lần chạy (mặc định không có trạng thái)"""
+        pass
+
+
+class DetectStage(Stage):
+    """Phát hiện vật thể bằng DetectionModule"""
+    
+    name = 'detect'
+    
+    def __init__(self, detection, lane_filter=None, enabled=True):
+        """
+        Args:
+            detection: DetectionModule
+            lane_filter: LaneFilterModule để lấy vùng làn đường khi cắt ảnh, hoặc None
+            enabled: Công đoạn có được chạy không
+        """
+        super().__init__(enabled)
+        self.detection = detection
+        self.lane_filter = lane_filter
+        self.crop_to_roi = False  # Chỉ phát hiện trong vùng làn đường
+        self.detect_interval = 1  # Chỉ phát hiện 1 trên N khung hình
+        self._frame_index = 0
+        self._last_detections = None
+    
+    def process(self, ctx):
+        self._frame_index += 1
+        if (self.detect_interval > 1 and self._last_detections is not None and
+                self._frame_index % self.detect_interval != 0):
+            # Bỏ qua phát hiện, dùng lại kết quả khung hình trước
+            ctx.detections = self._last_detections
+            ctx.raw_detections = self._last_detections
+            ctx.detections_reused = True
+            return
+        
+        roi = None
+        if self.crop_to_roi and self.lane_filter is not None:
+            roi = self.lane_filter.get_roi_bounds(ctx.width, ctx.height)
+        ctx.detections = self.detection.detect(ctx.frame, roi)
+        ctx.raw_detections = ctx.detections
+        self._last_detections = ctx.detections
+    
+    def reset(self):
+        self._frame_index = 0
+        self._last_detections = None
+
+
+class LaneFilterStage(Stage):
+    """Chỉ giữ lại vật thể ở làn đường trước mặt"""
+    
+    name = 'lane_filter'
+    
+    def __init__(self, lane_filter, enabled=True):
+        super().__init__(enabled)
+        self.lane_filter = lane_filter
+    
+    def process(self, ctx):
+        ctx.detections = self.lane_filter.filter_detections(ctx.detections, ctx.width, ctx.height)
+
+
+class DistanceStage(Stage):
+    """Tính khoảng cách và mức độ nguy hiểm theo khoảng cách"""
+    
+    name = 'distance'
+    
+    def __init__(self, distance, enabled=True):
+        super().__init__(enabled)
+        self.distance = distance
+    
+    def process(self, ctx):
+        ctx.detections = self.distance.process_detections(ctx.detections)
+
+
+class EgoSpeedStage(Stage):
+    """Gán vận tốc xe (nội suy từ cảm biến tại thời điểm thu nhận khung hình) vào context"""
+    
+    name = 'ego_speed'
+    
+    def __init__(self, sensor, enabled=True):
+        """
+        Args:
+            sensor: SpeedSensor
+            enabled: Công đoạn có được chạy không
+        """
+        super().__init__(enabled)
+        self.sensor = sensor
+    
+    def process(self, ctx):
+        # File ghi nạp sẵn gắn mẫu theo thời gian trong video, nguồn trực tiếp theo thời điểm thu nhận
+        ctx.ego_velocity = self.sensor.speed_at(ctx.timestamp if self.sensor.video_time else ctx.capture_time)
+
+
+class TrackStage(Stage):
+    """Gán track id ổn định cho vật thể khi tắt TTC (TTCStage tự gán track id khi nối quỹ đạo)"""
+    
+    name = 'track'
+    
+    def __init__(self, tracker=None, enabled=True):
+        super().__init__(enabled)
+        self.tracker = tracker if tracker is not None else BoxTracker()
+        self._last_output = None
+    
+    def process(self, ctx):
+        if ctx.detections_reused and self._last_output is not None:
+            ctx.detections = self._last_output
+            return
+        
+        slots = self.tracker.update(ctx.detections, ctx.timestamp)
+        ctx.detections = [
+            {**det, 'track_id': int(self.tracker.track_ids[slot])} if slot is not None else det
+            for det, slot in zip(ctx.detections, slots)
+        ]
+        self._last_output = ctx.detections
+    
+    def reset(self):
+        self.tracker.reset()
+        self._last_output = None
+
+
+class TTCStage(Stage):
+    """Tính vận tốc tương đối, TTC và đánh giá rủi ro nâng cao"""
+    
+    name = 'ttc'
+    
+    def __init__(self, ttc_module, enabled=True):
+        super().__init__(enabled)
+        self.ttc_module = ttc_module
+        self._last_output = None
+    
+    def process(self, ctx):
+        if ctx.detections_reused and self._last_output is not None:
+            # Không cập nhật lịch sử khoảng cách bằng dữ liệu cũ (vận tốc sẽ bằng 0)
+            ctx.detections = self._last_output
+            return
+        
+        if ctx.detections:
+            ctx.detections = self.ttc_module.process_detections_with_ttc(
+                ctx.detections,
+                ctx.timestamp,
+                ctx.ego_velocity
+            )
+        self._last_output = ctx.detections
+    
+    def reset(self):
+        self.ttc_module.clear_history()
+        self._last_output = None
+
+
+class MotionStage(Stage):
+    """Phát hiện xe đang dừng dựa trên chuyển động của vật thể"""
+    
+    name = 'motion'
+    
+    def __init__(self, motion_detection, enabled=True):
+        super().__init__(enabled)
+        self.motion_detection = motion_detection
+        self._last_stopped = False
+    
+    def process(self, ctx):
+        if ctx.ego_velocity is not None:
+            # Có cảm biến vận tốc: tin cậy hơn ước lượng từ chuyển động của vật thể
+            ctx.is_vehicle_stopped = ctx.ego_velocity < SPEED_STOPPED_MS
+            self._last_stopped = ctx.is_vehicle_stopped
+            return
+        
+        if ctx.detections_reused:
+            ctx.is_vehicle_stopped = self._last_stopped
+            return
+        
+        if ctx.detections:
+            self.motion_detection.update_frame_size(ctx.width, ctx.height)
+            movement_info = self.motion_detection.calculate_movement(ctx.detections)
+            ctx.is_vehicle_stopped = self.motion_detection.is_vehicle_stopped(
+                ctx.detections, movement_info
+            )
+        self._last_stopped = ctx.is_vehicle_stopped
+    
+    def reset(self):
+        self.motion_detection.clear_history()
+        self._last_stopped = False
+
+
+class DecisionStage(Stage):
+    """Quyết định cảnh báo: lọc vận tốc/TTC, đếm liên tục và tắt cảnh báo tạm thời"""
+    
+    name = 'decision'
+    
+    def __init__(self, distance, enabled=True):
+        super().__init__(enabled)
+        self.distance = distance
+        self.consecutive_risk_count = 0  # Đếm số lần liên tục phát hiện nguy hiểm
+        self.consecutive_safe_count = 0  # Đếm số lần liên tục an toàn
+        self.alert_disabled = False  # Tắt cảnh báo tạm thời
+        self.alert_disabled_until = 0  # Thời gian tắt cảnh báo đến khi nào
+    
+    def mute(self, seconds):
+        """Tắt cảnh báo tạm thời trong một khoảng thời gian"""
+        self.alert_disabled_until = time.time() + seconds
+        self.alert_disabled = True
+    
+    def unmute(self):
+        """Bật lại cảnh báo"""
+        self.alert_disabled = False
+        self.alert_disabled_until = 0
+    
+    def reset(self):
+        self.unmute()
+        self.consecutive_risk_count = 0
+        self.consecutive_safe_count = 0
+    
+    def is_real_risk(self, det):
+        """
+        Kiểm tra một vật thể cần cảnh báo có thực sự nguy hiểm không
+        
+        Args:
+            det: Vật thể đã xử lý
+        
+        Returns:
+            bool: True nếu vật thể đang tiếp cận đáng kể
+        """
+        if not det['risk']['needs_alert']:
+            return False
+        
+        # Kiểm tra vận tốc tương đối (nếu có)
+        rel_velocity = det.get('relative_velocity', 0)
+        ttc = det['risk'].get('ttc')
+        distance = det.get('distance')
+        
+        # Nếu vận tốc tương đối rất thấp hoặc TTC rất lớn
+        # thì không cảnh báo (có thể là vật thể đứng yên)
+        if abs(rel_velocity) < MIN_VELOCITY_FOR_ALERT or (ttc is not None and ttc > MAX_TTC_FOR_ALERT):
+            return False
+        
+        # Nếu khoảng cách xa (>15m) và vận tốc thấp, không cảnh báo
+        if distance is not None and distance > 15.0 and abs(rel_velocity) < 1.5:
+            return False
+        
+        return True
+    
+    def process(self, ctx):
+        # Kiểm tra thời gian tắt cảnh báo tạm thời
+        if self.alert_disabled_until > 0 and time.time() >= self.alert_disabled_until:
+            self.unmute()
+        
+        detections = ctx.detections
+        
+        # Kiểm tra nguy cơ va chạm
+        ctx.has_risk = self.distance.has_collision_risk(detections)
+        
+        # Kiểm tra thêm điều kiện: nếu vận tốc tương đối gần 0 thì không cảnh báo
+        has_real_risk = ctx.has_risk and any(self.is_real_risk(det) for det in detections)
+        
+        # Hệ thống đếm liên tục: chỉ cảnh báo sau N lần liên tục phát hiện nguy hiểm
+        # (khung hình dùng lại kết quả cũ không được tính là một lần phát hiện mới)
+        if not ctx.detections_reused:
+            if has_real_risk:
+                self.consecutive_risk_count += 1
+                self.consecutive_safe_count = 0
+            else:
+                self.consecutive_risk_count = 0
+                self.consecutive_safe_count += 1
+        
+        # Chỉ cảnh báo khi:
+        # 1. Phát hiện nguy hiểm liên tục đủ số lần
+        # 2. Người dùng chưa tắt tạm thời
+        # 3. Xe không đang dừng
+        # 4. Chưa có đủ số lần an toàn liên tục để tắt cảnh báo
+        ctx.should_alert = (self.consecutive_risk_count >= CONSECUTIVE_RISK_THRESHOLD and
+                            not self.alert_disabled and
+                            not ctx.is_vehicle_stopped and
+                            self.consecutive_safe_count < CONSECUTIVE_SAFE_THRESHOLD)
+        ctx.alert_disabled = self.alert_disabled
+        
+        # Vật thể nguy hiểm gần nhất
+        closest_obj = self.distance.get_closest_object(detections)
+        ctx.closest_distance = closest_obj['distance'] if closest_obj else None
+        ctx.closest_ttc = closest_obj['risk'].get('ttc') if closest_obj else None
+        ctx.alert_count = sum(1 for d in detections if d['risk']['needs_alert'])
+
+
+class AlertStage(Stage):
+    """Phát/dừng âm thanh cảnh báo và ghi nhật ký theo quyết định"""
+    
+    name = 'alert'
+    
+    def __init__(self, logger, alert=None, enabled=True):
+        """
+        Args:
+            logger: LoggerModule
+            alert: AlertModule để phát âm thanh, hoặc None nếu chạy không âm thanh
+            enabled: Công đoạn có được chạy không
+        """
+        super().__init__(enabled)
+        self.logger = logger
+        self.alert = alert
+        self.is_alerting = False
+        self._stopped_logged = False  # Đã ghi log tắt cảnh báo do xe dừng
+        # Gộp các khung hình cảnh báo của cùng vật thể thành một bản ghi nhật ký
+        self.episodes = EpisodeAggregator(on_close=logger.log_episode)
+    
+    def process(self, ctx):
+        if ctx.should_alert:
+            if not self.is_alerting:
+                # Bắt đầu một lần cảnh báo: ghi thời điểm để đo độ trễ từ lúc thu nhận
+                ctx.alert_trigger_time = time.perf_counter()
+                self.is_alerting = True
+            if self.alert is not None:
+                # Không chặn: AlertModule chỉ đổi âm thanh khi mức cảnh báo thay đổi
+                self.alert.play_alert(level=self.get_alert_level(ctx),
+                                      trigger_time=ctx.alert_trigger_time)
+            self.episodes.update(ctx.detections, ctx.timestamp, ctx.detections_reused)
+            self._stopped_logged = False
+        else:
+            self.stop_sound()
+            # Sự kiện đang mở chỉ đóng khi hết nguy hiểm quá EPISODE_GAP_S
+            self.episodes.update([], ctx.timestamp)
+            if ctx.is_vehicle_stopped and ctx.has_risk:
+                if not self._stopped_logged:
+                    # Ghi log khi tắt cảnh báo do xe dừng
+                    self.logger.log_info("Cảnh báo đã tắt do phát hiện xe đang dừng")
+                    self._stopped_logged = True
+            else:
+                self._stopped_logged = False
+    
+    @staticmethod
+    def get_alert_level(ctx):
+        """
+        Chọn mức âm thanh cảnh báo theo TTC và mức nguy hiểm của các vật thể cần cảnh báo
+        
+        Returns:
+            str: 'danger', 'warning' hoặc 'caution'
+        """
+        levels = {det['risk']['level'] for det in ctx.detections if det['risk']['needs_alert']}
+        ttc = ctx.closest_ttc
+        if 'danger' in levels or (ttc is not None and ttc <= TTC_DANGER):
+            return 'danger'
+        if 'warning' in levels or (ttc is not None and ttc <= TTC_WARNING):
+            return 'warning'
+        return 'caution'
+    
+    def stop_sound(self):
+        """Dừng âm thanh cảnh báo (nếu có AlertModule)"""
+        self.is_alerting = False
+        if self.alert is not None:
+            self.alert.stop_alert()
+    
+    def stop(self):
+        """Dừng âm thanh cảnh báo và đóng các sự kiện cảnh báo đang mở"""
+        self.stop_sound()
+        self.episodes.close_all()
+    
+    def reset(self):
+        self.stop()
+
+
+class RenderStage(Stage):
+    """Vẽ vùng làn đường, vật thể và thông tin trạng thái lên khung hình"""
+    
+    name = 'render'
+    
+    def __init__(self, lane_filter, enabled=True):
+        super().__init__(enabled)
+        self.lane_filter = lane_filter
+        self.draw_overlay = True  # Vẽ vùng làn đường và bảng trạng thái
+        self.render_interval = 1  # Chỉ vẽ 1 trên N khung hình
+        self._frame_index = 0
+    
+    def process(self, ctx):
+        self._frame_index += 1
+        if self.render_interval > 1 and self._frame_index % self.render_interval != 0:
+            ctx.display_frame = None
+            return
+        
+        if not self.draw_overlay:
+            # Chỉ vẽ bounding box
+            display_frame = RenderModule.draw_detections(ctx.frame, ctx.detections)
+            display_frame.setflags(write=False)
+            ctx.display_frame = display_frame
+            return
+        
+        # Vẽ vùng ROI làn đường (nếu bật)
+        display_frame = self.lane_filter.draw_lane_roi(ctx.frame)
+        
+        # Vẽ lên khung hình
+        display_frame = RenderModule.draw_detections(display_frame, ctx.detections)
+        
+        # Thêm thông tin trạng thái
+        status_text = []
+        if ctx.alert_disabled:
+            status_text.append("Cảnh báo: TẮT")
+        if ctx.is_vehicle_stopped:
+            status_text.append("Xe: DỪNG")
+        elif ctx.ego_velocity is not None:
+            status_text.append(f"Xe: {ctx.ego_velocity * 3.6:.0f} km/h")
+        
+        display_frame = RenderModule.draw_status_overlay(
+            display_frame,
+            fps=int(ctx.fps),
+            alert_count=ctx.alert_count,
+            closest_distance=ctx.closest_distance,
+            closest_ttc=ctx.closest_ttc,
+            status_text=" | ".join(status_text) if status_text else None
+        )
+        display_frame.setflags(write=False)
+        ctx.display_frame = display_frame
+
+
+class TelemetryStage(Stage):
+    """Ghi kết quả khung hình vào TelemetryRecorder (đặt sau các công đoạn quyết định)"""
+    
+    name = 'telemetry'
+    
+    def __init__(self, recorder, enabled=True):
+        """
+        Args:
+            recorder: TelemetryRecorder
+            enabled: Công đoạn có được chạy không
+        """
+        super().__init__(enabled)
+        self.recorder = recorder
+    
+    def process(self, ctx):
+        if self.recorder.is_open:
+            self.recorder.record(ctx)
+
+
+class IncidentStage(Stage):
+    """Đưa khung hình vào vùng đệm clip sự cố của IncidentRecorder (đặt sau các công đoạn quyết định)"""
+    
+    name = 'incident'
+    
+    def __init__(self, recorder, enabled=True):
+        """
+        Args:
+            recorder: IncidentRecorder
+            enabled: Công đoạn có được chạy không
+        """
+        super().__init__(enabled)
+        self.recorder = recorder
+    
+    def process(self, ctx):
+        if self.recorder.is_open:
+            self.recorder.record(ctx)
+
+
+class RecordStage(Stage):
+    """Đưa khung hình hiển thị vào VideoRecorder (đặt sau công đoạn vẽ)"""
+    
+    name = 'record'
+    
+    def __init__(self, recorder, enabled=True):
+        """
+        Args:
+            recorder: VideoRecorder
+            enabled: Công đoạn có được chạy không
+        """
+        super().__init__(enabled)
+        self.recorder = recorder
+    
+    def process(self, ctx):
+        if ctx.display_frame is not None and self.recorder.is_open:
+            self.recorder.record(ctx.display_frame, ctx.timestamp)
+
+
+def build_default_stages(detection, distance, lane_filter, logger, alert=None,
+                         ttc_module=None, motion_detection=None, render=True):
+    """
+    Tạo chuỗi công đoạn mặc định:
+    phát hiện → lọc làn → khoảng cách → TTC (hoặc chỉ gán track id khi tắt TTC) → chuyển động
+    → quyết định → cảnh báo → vẽ
+    
+    Returns:
+        list: Danh sách Stage theo thứ tự chạy
+    """
+    stages = [
+        DetectStage(detection, lane_filter),
+        LaneFilterStage(lane_filter),
+        DistanceStage(distance),
+    ]
+    if ttc_module is not None:
+        stages.append(TTCStage(ttc_module))
+    else:
+        stages.append(TrackStage())
+    if motion_detection is not None:
+        stages.append(MotionStage(motion_detection))
+    stages.append(DecisionStage(distance))
+    stages.append(AlertStage(logger, alert))
+    stages.append(RenderStage(lane_filter, enabled=render))
+    return stages
@@ -0,0 +1,491 @@
+"""
+Module quét lưới tham số cảnh báo trên các chuyến đi đã ghi telemetry
+
+Thay vì phát lại từng tổ hợp tham số qua pipeline (ReplayRunner, vài nghìn khung hình/giây
+cho mỗi tổ hợp), các vật thể đã ghi được nạp thành mảng numpy và luật đánh giá rủi ro
+(TTCModule.assess_risk_with_ttc), bộ lọc vận tốc/TTC (DecisionStage.is_real_risk) và bộ đếm
+liên tục được tính vectơ hóa cho cả khối tổ hợp cùng lúc, song song trên nhiều tiến trình.
+
+Giả định: vận tốc tương đối, TTC, kết quả lọc làn đường và trạng thái xe dừng lấy từ bản ghi
+(không phụ thuộc các tham số được quét); tắt tiếng tạm thời của người dùng bị bỏ qua.
+"""
+
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+from modules.telemetry_module import TelemetryReader, FLAG_DETECTIONS_REUSED, FLAG_VEHICLE_STOPPED
+from config.config import (
+    TTC_DANGER, TTC_WARNING, TTC_CAUTION, SAFE_DISTANCE, WARNING_DISTANCE,
+    MIN_VELOCITY_FOR_ALERT, MAX_TTC_FOR_ALERT, CONSECUTIVE_RISK_THRESHOLD,
+    CONSECUTIVE_SAFE_THRESHOLD, SWEEP_EVENT_TOLERANCE_S, SWEEP_BLOCK_ELEMENTS, REACTION_TIME, DECELERATION
+)
+
+
+# Tham số có thể quét và giá trị mặc định (giống hệ thống đang chạy)
+RULE_PARAMS = {
+    'ttc_danger': TTC_DANGER,  # TTC ≤ ngưỡng này → nguy hiểm
+    'ttc_warning': TTC_WARNING,  # TTC ≤ ngưỡng này → cảnh báo
+    'ttc_caution': TTC_CAUTION,  # TTC ≤ ngưỡng này → thận trọng (không cảnh báo)
+    'slow_velocity': 1.0,  # Vận tốc tương đối (m/s) dưới ngưỡng này là tiếp cận chậm
+    'near_distance': 5.0,  # Rất gần (m): luôn nguy hiểm
+    'safe_distance': SAFE_DISTANCE,  # Khoảng cách nguy hiểm (m) khi không có TTC
+    'warning_distance': WARNING_DISTANCE,  # Khoảng cách cảnh báo (m) khi không có TTC
+    'min_velocity': MIN_VELOCITY_FOR_ALERT,  # Vận tốc tương đối tối thiểu để cảnh báo
+    'max_ttc': MAX_TTC_FOR_ALERT,  # TTC tối đa để cảnh báo
+    'far_distance': 15.0,  # Xa hơn ngưỡng này thì cần vận tốc far_min_velocity
+    'far_min_velocity': 1.5,
+    'reaction_time': REACTION_TIME,  # Thời gian phản ứng (giây) trong khoảng cách dừng
+    'deceleration': DECELERATION,  # Gia tốc hãm (m/s²) trong khoảng cách dừng
+}
+DEBOUNCE_PARAMS = {
+    'consecutive_risk': CONSECUTIVE_RISK_THRESHOLD,
+    'consecutive_safe': CONSECUTIVE_SAFE_THRESHOLD,
+}
+SWEEP_PARAMS = {**RULE_PARAMS, **DEBOUNCE_PARAMS}
+
+_DRIVE_CACHE = {}  # Chuyến đi đã nạp trong tiến trình con (mỗi tiến trình giữ một chuyến)
+
+
+def parse_param_values(name, text):
+    """
+    Đọc danh sách giá trị của một tham số
+    
+    Args:
+        name: Tên tham số trong SWEEP_PARAMS
+        text: 'a,b,c' hoặc khoảng 'bắt_đầu:kết_thúc:bước' (bao gồm kết thúc)
+    
+    Returns:
+        list: Các giá trị (kiểu giống giá trị mặc định)
+    """
+    if name not in SWEEP_PARAMS:
+        raise ValueError(f"Tham số không hỗ trợ: {name} (hỗ trợ: {', '.join(SWEEP_PARAMS)})")
+    cast = type(SWEEP_PARAMS[name])
+    if ':' in text:
+        parts = [float(x) for x in text.split(':')]
+        start, stop = parts[0], parts[1]
+        step = parts[2] if len(parts) > 2 else 1.0
+        if step <= 0:
+            raise ValueError(f"Bước của {name} phải dương")
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        values = [start + i * step for i in range(count)]
+    else:
+        values = [float(x) for x in text.split(',') if x.strip()]
+    return [cast(round(v, 6)) for v in values]
+
+
+def load_labels(path):
+    """
+    Đọc file nhãn sự kiện nguy hiểm
+    
+    Định dạng JSON: {"tên_file.tlm": [{"start": 12.0, "end": 15.5, "name": "cat_ngang"}, ...]}
+    Thời điểm tính bằng giây kể từ khung hình đầu tiên của chuyến đi; 'end' là thời điểm
+    nguy hiểm nhất (lead time = end − thời điểm cảnh báo đầu tiên trong [start, end]).
+    
+    Returns:
+        dict: Tên file (basename) → danh sách sự kiện
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    labels = {}
+    for drive, events in data.items():
+        parsed = []
+        for i, event in enumerate(events):
+            start = float(event['start'])
+            end = float(event.get('end', start))
+            parsed.append({'name': str(event.get('name', i)), 'start': start, 'end': max(start, end)})
+        labels[os.path.basename(drive)] = parsed
+    return labels
+
+
+def load_drive(path):
+    """
+    Nạp một chuyến đi thành các mảng dùng cho quét tham số
+    
+    Chỉ giữ vật thể trong làn đường có khoảng cách, thuộc các khung hình phát hiện mới
+    (khung hình dùng lại kết quả cũ không làm thay đổi bộ đếm liên tục).
+    
+    Returns:
+        dict: Mảng khung hình ('timestamp', 'stopped', 'live_index') và vật thể
+              ('det_live', 'distance', 'relative_velocity', 'ttc', 'ego_velocity')
+    """
+    reader = TelemetryReader(path)
+    try:
+        frames, dets, _ = reader.read_arrays()
+    finally:
+        reader.close()
+    
+    timestamps = frames['timestamp'].astype(np.float64)
+    flags = frames['flags']
+    reused = (flags & FLAG_DETECTIONS_REUSED) != 0
+    # Chỉ số khung hình phát hiện mới gần nhất (-1 nếu chưa có)
+    live_index = np.cumsum(~reused) - 1
+    det_frame = np.repeat(np.arange(len(timestamps)), frames['n_dets'])
+    
+    distance = dets['distance'].astype(np.float32)
+    keep = (dets['in_lane'] != 0) & np.isfinite(distance) & ~reused[det_frame]
+    relative_velocity = dets['relative_velocity'][keep].astype(np.float32)
+    relative_velocity[np.isnan(relative_velocity)] = 0.0
+    
+    return {
+        'path': path,
+        'name': os.path.basename(path),
+        'timestamp': timestamps,
+        'stopped': (flags & FLAG_VEHICLE_STOPPED) != 0,
+        'live_index': live_index,
+        'live_count': int((~reused).sum()),
+        'det_live': live_index[det_frame[keep]],
+        'distance': distance[keep],
+        'relative_velocity': relative_velocity,
+        'ttc': dets['ttc'][keep].astype(np.float32),  # NaN = không có TTC
+        'ego_velocity': frames['ego_velocity'][det_frame[keep]].astype(np.float32)  # NaN = không có cảm biến
+    }
+
+
+def real_risk_mask(distance, relative_velocity, ttc, params, ego_velocity=None):
+    """
+    Vật thể cần cảnh báo và thực sự nguy hiểm, cho cả khối tổ hợp tham số
+    
+    Cùng luật với TTCModule.assess_risk_with_ttc (needs_alert) và DecisionStage.is_real_risk.
+    
+    Args:
+        distance, relative_velocity, ttc: Mảng (D,) của các vật thể
+        ego_velocity: Mảng (D,) vận tốc xe tại khung hình của vật thể (NaN nếu không có), hoặc None
+        params: dict tên tham số → mảng (C, 1)
+    
+    Returns:
+        np.ndarray: Mảng bool (C, D)
+    """
+    fast = relative_velocity >= params['slow_velocity']
+    slow = ~fast
+    
+    # Nhánh TTC (so sánh với NaN luôn sai nên vật thể không có TTC tự rơi xuống nhánh khoảng cách)
+    ttc_danger = ttc <= params['ttc_danger']
+    danger_fast = ttc_danger & fast
+    danger_near = ttc_danger & slow & (distance <= params['near_distance'])
+    warning_fast = (ttc <= params['ttc_warning']) & fast
+    decided = danger_fast | danger_near | warning_fast | (ttc <= params['ttc_caution'])
+    ttc_alert = danger_fast | danger_near | warning_fast
+    
+    # Nhánh khoảng cách
+    distance_alert = ((distance <= params['near_distance']) |
+                      (distance <= params['safe_distance']) |
+                      ((distance <= params['warning_distance']) & fast))
+    needs_alert = np.where(decided, ttc_alert, distance_alert)
+    
+    # Vật thể tiến gần trong khoảng cách dừng của xe luôn cần cảnh báo (NaN: không có vận tốc xe)
+    if ego_velocity is not None:
+        stopping = (ego_velocity * params['reaction_time'] +
+                    ego_velocity ** 2 / (2.0 * params['deceleration']))
+        needs_alert |= (ego_velocity > 0) & (distance <= stopping) & fast
+    
+    # Lọc vật thể đứng yên / tiếp cận chậm
+    speed = np.abs(relative_velocity)
+    return (needs_alert &
+            (speed >= params['min_velocity']) &
+            ~(ttc > params['max_ttc']) &
+            ~((distance > params['far_distance']) & (speed < params['far_min_velocity'])))
+
+
+def _run_lengths(risk):
+    """
+    Bộ đếm liên tục của DecisionStage cho từng khung hình phát hiện mới
+    
+    Returns:
+        tuple: (số lần nguy hiểm liên tục, số lần an toàn liên tục), mảng (C, N + 1);
+               cột 0 là trạng thái ban đầu (cả hai bằng 0)
+    """
+    n_blocks, n_live = risk.shape
+    index = np.arange(n_live, dtype=np.int32)
+    last_safe = np.maximum.accumulate(np.where(risk, -1, index), axis=1)
+    last_risk = np.maximum.accumulate(np.where(risk, index, -1), axis=1)
+    risk_run = np.zeros((n_blocks, n_live + 1), dtype=np.int32)
+    safe_run = np.zeros((n_blocks, n_live + 1), dtype=np.int32)
+    risk_run[:, 1:] = index - last_safe
+    safe_run[:, 1:] = index - last_risk
+    return risk_run, safe_run
+
+
+def evaluate_drive(drive, rule_combos, debounce_combos, events=None, tolerance=SWEEP_EVENT_TOLERANCE_S):
+    """
+    Đánh giá các tổ hợp tham số trên một chuyến đi
+    
+    Args:
+        drive: dict từ load_drive()
+        rule_combos: Danh sách dict tham số luật (RULE_PARAMS)
+        debounce_combos: Danh sách dict tham số đếm liên tục (DEBOUNCE_PARAMS)
+        events: Danh sách sự kiện đã gán nhãn của chuyến đi, None nếu không có nhãn
+        tolerance: Cảnh báo bắt đầu trong khoảng này quanh sự kiện không bị tính là báo sai
+    
+    Returns:
+        dict: Mảng (R, B) 'alert_frames', 'alert_events', 'false_alerts' (None nếu không có nhãn)
+              và 'lead_times' (R, B, E) — NaN nếu bỏ lỡ sự kiện
+    """
+    n_rules = len(rule_combos)
+    n_debounce = len(debounce_combos)
+    timestamps = drive['timestamp']
+    n_frames = len(timestamps)
+    labelled = events is not None
+    events = events or []
+    
+    relative_time = timestamps - timestamps[0] if n_frames else timestamps
+    gather = drive['live_index'] + 1
+    not_stopped = ~drive['stopped']
+    
+    # Khung hình nằm trong (hoặc sát) một sự kiện đã gán nhãn
+    in_window = np.zeros(n_frames, dtype=bool)
+    event_ranges = []
+    for event in events:
+        i0 = np.searchsorted(relative_time, event['start'] - tolerance)
+        i1 = np.searchsorted(relative_time, event['end'] + tolerance, side='right')
+        in_window[i0:i1] = True
+        event_ranges.append((np.searchsorted(relative_time, event['start']),
+                             np.searchsorted(relative_time, event['end'], side='right'),
+                             event['end']))
+    
+    alert_frames = np.zeros((n_rules, n_debounce), dtype=np.int64)
+    alert_events = np.zeros((n_rules, n_debounce), dtype=np.int64)
+    false_alerts = np.zeros((n_rules, n_debounce), dtype=np.int64)
+    lead_times = np.full((n_rules, n_debounce, len(events)), np.nan)
+    
+    det_live = drive['det_live']
+    if len(det_live):
+        group_start = np.flatnonzero(np.r_[True, det_live[1:] != det_live[:-1]])
+        group_frame = det_live[group_start]
+    distance = drive['distance']
+    relative_velocity = drive['relative_velocity']
+    ttc = drive['ttc']
+    ego_velocity = drive['ego_velocity'] if np.isfinite(drive['ego_velocity']).any() else None
+    
+    block = max(1, SWEEP_BLOCK_ELEMENTS // max(len(det_live), n_frames, 1))
+    for b0 in range(0, n_rules, block):
+        combos = rule_combos[b0:b0 + block]
+        params = {name: np.array([[c[name]] for c in combos], dtype=np.float32) for name in RULE_PARAMS}
+        
+        # Khung hình có ít nhất một vật thể thực sự nguy hiểm
+        risk = np.zeros((len(combos), drive['live_count']), dtype=bool)
+        if len(det_live):
+            real = real_risk_mask(distance, relative_velocity, ttc, params, ego_velocity)
+            risk[:, group_frame] = np.logical_or.reduceat(real, group_start, axis=1)
+        risk_run, safe_run = _run_lengths(risk)
+        # Khung hình dùng lại kết quả giữ bộ đếm của khung hình phát hiện mới gần nhất
+        risk_run = risk_run[:, gather]
+        safe_run = safe_run[:, gather]
+        
+        for d, debounce in enumerate(debounce_combos):
+            alert = ((risk_run >= debounce['consecutive_risk']) &
+                     (safe_run < debounce['consecutive_safe']) &
+                     not_stopped)
+            starts = alert.copy()
+            starts[:, 1:] &= ~alert[:, :-1]
+            
+            rows = slice(b0, b0 + len(combos))
+            alert_frames[rows, d] = alert.sum(axis=1)
+            alert_events[rows, d] = starts.sum(axis=1)
+            false_alerts[rows, d] = (starts & ~in_window).sum(axis=1)
+            for e, (i0, i1, end) in enumerate(event_ranges):
+                window = alert[:, i0:i1]
+                if window.shape[1] == 0:
+                    continue
+                hit = window.any(axis=1)
+                first = window.argmax(axis=1)
+                lead_times[rows, d, e] = np.where(hit, end - relative_time[i0 + first], np.nan)
+    
+    return {
+        'alert_frames': alert_frames,
+        'alert_events': alert_events,
+        'false_alerts': false_alerts if labelled else None,
+        'lead_times': lead_times,
+        'duration_s': float(relative_time[-1]) if n_frames else 0.0,
+        'frames': n_frames
+    }
+
+
+def _evaluate_task(task):
+    """Hàm chạy trong tiến trình con: nạp chuyến đi (có cache) và đánh giá một khối luật"""
+    path, r0, rule_combos, debounce_combos, events, tolerance = task
+    drive = _DRIVE_CACHE.get(path)
+    if drive is None:
+        _DRIVE_CACHE.clear()
+        drive = load_drive(path)
+        _DRIVE_CACHE[path] = drive
+    return path, r0, evaluate_drive(drive, rule_combos, debounce_combos, events, tolerance)
+
+
+class ParameterSweep:
+    """Quét lưới tham số cảnh báo trên nhiều chuyến đi đã ghi telemetry"""
+    
+    def __init__(self, telemetry_paths, grid, labels=None, workers=None,
+                 tolerance=SWEEP_EVENT_TOLERANCE_S):
+        """
+        Khởi tạo parameter sweep
+        
+        Args:
+            telemetry_paths: Danh sách file telemetry (mỗi file một chuyến đi)
+            grid: dict tên tham số → danh sách giá trị; tham số không có giữ giá trị mặc định
+            labels: dict từ load_labels(), None nếu không có nhãn (không tính báo sai/lead time)
+            workers: Số tiến trình, None = số lõi CPU
+            tolerance: Khoảng dung sai quanh sự kiện khi tính báo sai (giây)
+        """
+        unknown = [name for name in grid if name not in SWEEP_PARAMS]
+        if unknown:
+            raise ValueError(f"Tham số không hỗ trợ: {', '.join(unknown)}")
+        self.telemetry_paths = list(dict.fromkeys(telemetry_paths))
+        self.grid = {name: list(grid.get(name, [default])) for name, default in SWEEP_PARAMS.items()}
+        self.labels = labels
+        self.workers = workers or os.cpu_count() or 1
+        self.tolerance = tolerance
+        self.rule_combos = self._combos(RULE_PARAMS)
+        self.debounce_combos = self._combos(DEBOUNCE_PARAMS)
+        self.results = []
+        self.stats = {}
+    
+    def _combos(self, names):
+        """Tích Descartes của các giá trị tham số trong nhóm"""
+        keys = list(names)
+        return [dict(zip(keys, values)) for values in itertools.product(*(self.grid[k] for k in keys))]
+    
+    def _events(self, path):
+        """Sự kiện đã gán nhãn của một chuyến đi (None nếu không có file nhãn)"""
+        if self.labels is None:
+            return None
+        return self.labels.get(os.path.basename(path), [])
+    
+    def run(self):
+        """
+        Chạy quét tham số
+        
+        Returns:
+            list: Mỗi tổ hợp một dict gồm tham số, 'alert_frames', 'alert_events', 'false_alerts',
+                  'false_alerts_per_hour', 'events_detected', 'recall', 'mean_lead_s', 'min_lead_s'
+                  và 'lead_times' (tên sự kiện → lead time, None nếu bỏ lỡ); sắp xếp theo
+                  recall giảm dần, báo sai/giờ tăng dần
+        """
+        n_rules = len(self.rule_combos)
+        n_debounce = len(self.debounce_combos)
+        # Chia khối luật để tận dụng đủ tiến trình kể cả khi chỉ có một chuyến đi
+        n_parts = max(1, -(-self.workers * 2 // max(len(self.telemetry_paths), 1)))
+        part_size = max(1, -(-n_rules // n_parts))
+        tasks = [(path, r0, self.rule_combos[r0:r0 + part_size], self.debounce_combos,
+                  self._events(path), self.tolerance)
+                 for path in self.telemetry_paths
+                 for r0 in range(0, n_rules, part_size)]
+        
+        totals = {
+            'alert_frames': np.zeros((n_rules, n_debounce), dtype=np.int64),
+            'alert_events': np.zeros((n_rules, n_debounce), dtype=np.int64),
+            'false_alerts': np.zeros((n_rules, n_debounce), dtype=np.int64)
+        }
+        lead_parts = {}
+        durations = {}
+        frames = {}
+        
+        start_time = time.time()
+        if self.workers > 1 and len(tasks) > 1:
+            with multiprocessing.Pool(min(self.workers, len(tasks))) as pool:
+                outputs = pool.imap_unordered(_evaluate_task, tasks)
+                for output in outputs:
+                    self._accumulate(output, totals, lead_parts, durations, frames)
+        else:
+            for task in tasks:
+                self._accumulate(_evaluate_task(task), totals, lead_parts, durations, frames)
+            _DRIVE_CACHE.clear()
+        elapsed = time.time() - start_time
+        
+        # Ghép lead time theo thứ tự chuyến đi → sự kiện
+        event_names = []
+        lead_columns = []
+        for path in self.telemetry_paths:
+            events = self._events(path) or []
+            name = os.path.basename(path)
+            event_names.extend(f"{name}:{event['name']}" for event in events)
+            if events:
+                lead_columns.append(lead_parts[path])
+        lead_times = (np.concatenate(lead_columns, axis=2) if lead_columns
+                      else np.full((n_rules, n_debounce, 0), np.nan))
+        
+        hours = sum(durations.values()) / 3600.0
+        self.results = []
+        for r, rule in enumerate(self.rule_combos):
+            for d, debounce in enumerate(self.debounce_combos):
+                self.results.append(self._result_row(rule, debounce, r, d, totals, lead_times,
+                                                     event_names, hours))
+        self.results.sort(key=lambda row: (
+            -(row['recall'] if row['recall'] is not None else 0.0),
+            row['false_alerts_per_hour'] if row['false_alerts_per_hour'] is not None else 0.0,
+            -(row['mean_lead_s'] if row['mean_lead_s'] is not None else 0.0)
+        ))
+        
+        combos = n_rules * n_debounce
+        total_frames = sum(frames.values())
+        self.stats = {
+            'drives': len(self.telemetry_paths),
+            'frames': total_frames,
+            'drive_hours': hours,
+            'combinations': combos,
+            'labelled_events': len(event_names),
+            'elapsed_s': elapsed,
+            'frame_evaluations_per_s': combos * total_frames / elapsed if elapsed > 0 else 0.0,
+            'workers': self.workers
+        }
+        return self.results
+    
+    @staticmethod
+    def _accumulate(output, totals, lead_parts, durations, frames):
+        """Cộng kết quả một khối luật của một chuyến đi vào tổng"""
+        path, r0, result = output
+        rows = slice(r0, r0 + result['alert_frames'].shape[0])
+        totals['alert_frames'][rows] += result['alert_frames']
+        totals['alert_events'][rows] += result['alert_events']
+        if result['false_alerts'] is not None:
+            totals['false_alerts'][rows] += result['false_alerts']
+        if result['lead_times'].shape[2]:
+            if path not in lead_parts:
+                n_rules = totals['alert_frames'].shape[0]
+                lead_parts[path] = np.full((n_rules,) + result['lead_times'].shape[1:], np.nan)
+            lead_parts[path][rows] = result['lead_times']
+        durations[path] = result['duration_s']
+        frames[path] = result['frames']
+    
+    def _result_row(self, rule, debounce, r, d, totals, lead_times, event_names, hours):
+        """Một dòng kết quả cho tổ hợp (r, d)"""
+        leads = lead_times[r, d]
+        detected = leads[~np.isnan(leads)]
+        labelled = self.labels is not None
+        false_alerts = int(totals['false_alerts'][r, d]) if labelled else None
+        return {
+            **rule,
+            **debounce,
+            'alert_frames': int(totals['alert_frames'][r, d]),
+            'alert_events': int(totals['alert_events'][r, d]),
+            'false_alerts': false_alerts,
+            'false_alerts_per_hour': (false_alerts / hours if hours > 0 else None) if labelled else None,
+            'events_detected': len(detected),
+            'recall': len(detected) / len(event_names) if event_names else None,
+            'mean_lead_s': float(detected.mean()) if len(detected) else None,
+            'min_lead_s': float(detected.min()) if len(detected) else None,
+            'lead_times': {name: (None if np.isnan(lead) else float(lead))
+                           for name, lead in zip(event_names, leads)}
+        }
+    
+    def export_json(self, output_path):
+        """Ghi kết quả và thống kê ra file JSON"""
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump({'stats': self.stats, 'results': self.results}, f, ensure_ascii=False, indent=2)
+    
+    def export_csv(self, output_path):
+        """Ghi kết quả ra file CSV (mỗi sự kiện đã gán nhãn một cột lead time)"""
+        if not self.results:
+            return
+        event_names = list(self.results[0]['lead_times'])
+        fieldnames = [k for k in self.results[0] if k != 'lead_times'] + [f"lead:{name}" for name in event_names]
+        with open(output_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            for row in self.results:
+                flat = {k: v for k, v in row.items() if k != 'lead_times'}
+                flat.update({f"lead:{name}": lead for name, lead in row['lead_times'].items()})
+                writer.writerow(flat)
@@ -0,0 +1,451 @@
+"""
+Module ghi telemetry từng khung hình ra file nhị phân gọn (để tái dựng sự cố và phát lại)
+
+Định dạng file:
+    header:  TELEMETRY_MAGIC | uint32 độ dài | JSON mô tả (phiên bản, danh sách lớp, công đoạn, ...)
+    chunk:   _CHUNK_HEADER (magic, độ dài payload, số khung hình, số vật thể, t đầu, t cuối) | payload
+
+Mỗi chunk lưu theo cột: mỗi cột là một mảng numpy kích thước cố định, được xáo byte
+(byte-shuffle) rồi nén zlib. Đọc bằng mmap và chỉ giải nén chunk cần dùng.
+"""
+
+import json
+import mmap
+import queue
+import struct
+import threading
+import zlib
+import numpy as np
+from config.config import (DETECTION_CLASSES, TELEMETRY_CHUNK_FRAMES, TELEMETRY_COMPRESS_LEVEL)
+
+
+TELEMETRY_MAGIC = b'ITSTLM01'
+TELEMETRY_VERSION = 1
+_CHUNK_MAGIC = b'TCNK'
+_HEADER_LEN = struct.Struct('<I')
+_CHUNK_HEADER = struct.Struct('<4sIIIdd')
+
+RISK_LEVELS = ['unknown', 'safe', 'caution', 'warning', 'danger']
+TELEMETRY_STAGES = ['detect', 'lane_filter', 'distance', 'ttc', 'motion', 'decision', 'alert', 'render']
+
+# Cờ quyết định của khung hình
+FLAG_SHOULD_ALERT = 1
+FLAG_HAS_RISK = 2
+FLAG_VEHICLE_STOPPED = 4
+FLAG_ALERT_DISABLED = 8
+FLAG_DETECTIONS_REUSED = 16
+
+# Cột theo khung hình: (tên, kiểu numpy, số phần tử mỗi dòng)
+FRAME_COLUMNS = [
+    ('timestamp', '<f8', 1),
+    ('frame_seq', '<u4', 1),
+    ('width', '<u2', 1),
+    ('height', '<u2', 1),
+    ('n_dets', '<u2', 1),
+    ('flags', 'u1', 1),
+    ('degradation_level', 'u1', 1),
+    ('ego_velocity', '<f4', 1),
+    ('closest_distance', '<f4', 1),
+    ('closest_ttc', '<f4', 1),
+    ('stage_ms', '<u2', len(TELEMETRY_STAGES)),  # Lượng tử hóa theo _SCALES
+]
+
+# Cột theo vật thể (tất cả vật thể YOLO phát hiện, kể cả ngoài làn đường)
+DET_COLUMNS = [
+    ('bbox', '<i2', 4),
+    ('class_index', 'u1', 1),  # Chỉ số trong danh sách 'classes' của header
+    ('class_id', 'u1', 1),
+    ('confidence', 'u1', 1),  # Lượng tử hóa theo _SCALES
+    ('in_lane', 'u1', 1),  # Còn lại sau lọc làn đường
+    ('distance', '<f2', 1),
+    ('relative_velocity', '<f2', 1),
+    ('ttc', '<f2', 1),
+    ('risk_level', 'u1', 1),  # Chỉ số trong RISK_LEVELS
+    ('needs_alert', 'u1', 1),
+]
+
+# Cột số thực được lưu dạng số nguyên: giá trị × hệ số (giá trị lớn nhất của kiểu = không có)
+_SCALES = {
+    'stage_ms': 10.0,  # Đơn vị 0.1ms
+    'confidence': 255.0,
+}
+
+_STOP = object()  # Báo hiệu dừng luồng ghi
+
+
+def _nan_if_none(value):
+    return float('nan') if value is None else value
+
+
+def _encode_columns(columns, rows, compress_level):
+    """Ghép các dòng thành mảng theo cột, xáo byte và nén"""
+    parts = []
+    count = len(rows)
+    for i, (name, dtype, width) in enumerate(columns):
+        values = [row[i] for row in rows]
+        shape = (count, width) if width > 1 else (count,)
+        scale = _SCALES.get(name)
+        if scale is not None:
+            # Lượng tử hóa: dễ nén hơn nhiều so với các bit thấp nhiễu của số thực
+            missing = np.iinfo(dtype).max
+            scaled = np.asarray(values, dtype=np.float64) * scale
+            array = np.where(np.isnan(scaled), missing,
+                             np.clip(np.rint(np.nan_to_num(scaled)), 0, missing - 1)).astype(dtype).reshape(shape)
+        else:
+            array = np.asarray(values, dtype=dtype).reshape(shape)
+        itemsize = array.dtype.itemsize
+        # Xáo byte: gom byte thứ k của mọi phần tử lại với nhau để zlib nén tốt hơn
+        parts.append(array.view(np.uint8).reshape(-1, itemsize).T.tobytes())
+    return zlib.compress(b''.join(parts), compress_level)
+
+
+def _decode_columns(columns, payload, count):
+    """Giải mã payload của _encode_columns thành dict tên cột → mảng numpy"""
+    result = {}
+    offset = 0
+    for name, dtype, width in columns:
+        dt = np.dtype(dtype)
+        n_items = count * width
+        size = n_items * dt.itemsize
+        shuffled = np.frombuffer(payload, dtype=np.uint8, count=size, offset=offset)
+        array = shuffled.reshape(dt.itemsize, n_items).T.copy().view(dt).reshape(-1)
+        scale = _SCALES.get(name)
+        if scale is not None:
+            array = np.where(array == np.iinfo(dt).max, np.nan, array / scale)
+        result[name] = array.reshape(count, width) if width > 1 else array
+        offset += size
+    return result
+
+
+class TelemetryRecorder:
+    """
+    Ghi kết quả từng khung hình vào file telemetry nhị phân
+    
+    record() chỉ thêm một dòng vào chunk đang gom trong bộ nhớ; khi chunk đủ
+    TELEMETRY_CHUNK_FRAMES khung hình, việc mã hóa, nén và ghi đĩa do luồng nền làm.
+    """
+    
+    def __init__(self, chunk_frames=TELEMETRY_CHUNK_FRAMES, compress_level=TELEMETRY_COMPRESS_LEVEL):
+        """
+        Args:
+            chunk_frames: Số khung hình mỗi chunk
+            compress_level: Mức nén zlib (1-9)
+        """
+        self.chunk_frames = chunk_frames
+        self.compress_level = compress_level
+        self.classes = list(DETECTION_CLASSES)
+        self._class_index = {name: i for i, name in enumerate(self.classes)}
+        self._stage_index = {name: i for i, name in enumerate(TELEMETRY_STAGES)}
+        
+        self.path = None
+        self.frames_recorded = 0
+        self.bytes_written = 0
+        self._file = None
+        self._queue = None
+        self._thread = None
+        self._frame_rows = []
+        self._det_rows = []
+        self._stage_ms = [float('nan')] * len(TELEMETRY_STAGES)
+    
+    @property
+    def is_open(self):
+        return self._file is not None
+    
+    def open(self, path, metadata=None):
+        """
+        Mở file telemetry mới và ghi header
+        
+        Args:
+            path: Đường dẫn file
+            metadata: dict bổ sung vào header (nguồn video, cấu hình, ...)
+        """
+        if self.is_open:
+            self.close()
+        header = {
+            'version': TELEMETRY_VERSION,
+            'classes': self.classes,
+            'stages': TELEMETRY_STAGES,
+            'risk_levels': RISK_LEVELS,
+            'frame_columns': [list(c) for c in FRAME_COLUMNS],
+            'det_columns': [list(c) for c in DET_COLUMNS],
+            'metadata': metadata or {}
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(TELEMETRY_MAGIC + _HEADER_LEN.pack(len(header_bytes)) + header_bytes)
+        self.bytes_written = self._file.tell()
+        self.frames_recorded = 0
+        self._frame_rows = []
+        self._det_rows = []
+        
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='TelemetryWriter', daemon=True)
+        self._thread.start()
+    
+    def stage_hook(self, stage_name, seconds, ctx):
+        """Hook dùng với PipelineModule.add_timing_hook để lưu thời gian từng công đoạn"""
+        index = self._stage_index.get(stage_name)
+        if index is not None:
+            self._stage_ms[index] = seconds * 1000.0
+    
+    def record(self, ctx, raw_detections=None):
+        """
+        Thêm kết quả của một khung hình
+        
+        Args:
+            ctx: FrameContext đã qua các công đoạn quyết định
+            raw_detections: Các vật thể YOLO trước khi lọc làn đường, mặc định ctx.raw_detections
+        """
+        if not self.is_open:
+            return
+        if raw_detections is None:
+            raw_detections = ctx.raw_detections if ctx.raw_detections is not None else ctx.detections
+        
+        processed = {det['bbox']: det for det in ctx.detections}
+        for det in raw_detections:
+            kept = processed.get(det['bbox'])
+            if kept is not None:
+                risk = kept.get('risk', {})
+                self._det_rows.append((
+                    det['bbox'], self._class_index.get(det['class'], 255), det.get('class_id', 255),
+                    det['confidence'], 1, _nan_if_none(kept.get('distance')),
+                    _nan_if_none(kept.get('relative_velocity')), _nan_if_none(risk.get('ttc')),
+                    RISK_LEVELS.index(risk['level']) if risk.get('level') in RISK_LEVELS else 0,
+                    1 if risk.get('needs_alert') else 0
+                ))
+            else:
+                self._det_rows.append((
+                    det['bbox'], self._class_index.get(det['class'], 255), det.get('class_id', 255),
+                    det['confidence'], 0, float('nan'), float('nan'), float('nan'), 0, 0
+                ))
+        
+        flags = ((FLAG_SHOULD_ALERT if ctx.should_alert else 0) |
+                 (FLAG_HAS_RISK if ctx.has_risk else 0) |
+                 (FLAG_VEHICLE_STOPPED if ctx.is_vehicle_stopped else 0) |
+                 (FLAG_ALERT_DISABLED if ctx.alert_disabled else 0) |
+                 (FLAG_DETECTIONS_REUSED if ctx.detections_reused else 0))
+        self._frame_rows.append((
+            ctx.timestamp, ctx.frame_seq, ctx.width, ctx.height, len(raw_detections), flags,
+            ctx.degradation_level, _nan_if_none(ctx.ego_velocity),
+            _nan_if_none(ctx.closest_distance), _nan_if_none(ctx.closest_ttc), self._stage_ms
+        ))
+        self._stage_ms = [float('nan')] * len(TELEMETRY_STAGES)
+        self.frames_recorded += 1
+        
+        if len(self._frame_rows) >= self.chunk_frames:
+            self._submit_chunk()
+    
+    def _submit_chunk(self):
+        """Chuyển chunk đang gom cho luồng ghi"""
+        if self._frame_rows:
+            self._queue.put((self._frame_rows, self._det_rows))
+            self._frame_rows = []
+            self._det_rows = []
+    
+    def close(self, timeout=5.0):
+        """Ghi chunk còn dở, chờ luồng ghi xong và đóng file"""
+        if not self.is_open:
+            return
+        self._submit_chunk()
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        self._file.close()
+        self._file = None
+    
+    def _run(self):
+        """Luồng ghi: mã hóa, nén và ghi từng chunk"""
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            frame_rows, det_rows = item
+            try:
+                frame_payload = _encode_columns(FRAME_COLUMNS, frame_rows, self.compress_level)
+                det_payload = _encode_columns(DET_COLUMNS, det_rows, self.compress_level)
+                payload = _HEADER_LEN.pack(len(frame_payload)) + frame_payload + det_payload
+                header = _CHUNK_HEADER.pack(_CHUNK_MAGIC, len(payload), len(frame_rows), len(det_rows),
+                                            frame_rows[0][0], frame_rows[-1][0])
+                self._file.write(header + payload)
+                self._file.flush()
+                self.bytes_written += len(header) + len(payload)
+            except Exception as e:
+                print(f"Lỗi ghi telemetry: {e}")
+
+
+class TelemetryReader:
+    """Đọc file telemetry bằng mmap; chỉ giải nén các chunk cần dùng"""
+    
+    def __init__(self, path):
+        """
+        Args:
+            path: Đường dẫn file telemetry
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        if self._mmap[:len(TELEMETRY_MAGIC)] != TELEMETRY_MAGIC:
+            self.close()
+            raise ValueError(f"Không phải file telemetry: {path}")
+        offset = len(TELEMETRY_MAGIC)
+        (header_len,) = _HEADER_LEN.unpack_from(self._mmap, offset)
+        offset += _HEADER_LEN.size
+        self.header = json.loads(self._mmap[offset:offset + header_len].decode('utf-8'))
+        offset += header_len
+        
+        self.classes = self.header['classes']
+        self.stages = self.header['stages']
+        self.risk_levels = self.header['risk_levels']
+        
+        # Chỉ mục chunk: (vị trí payload, độ dài, số khung hình, số vật thể, t đầu, t cuối)
+        self.chunks = []
+        size = len(self._mmap)
+        while offset + _CHUNK_HEADER.size <= size:
+            magic, length, n_frames, n_dets, t_first, t_last = _CHUNK_HEADER.unpack_from(self._mmap, offset)
+            payload_offset = offset + _CHUNK_HEADER.size
+            if magic != _CHUNK_MAGIC or payload_offset + length > size:
+                break  # Chunk cuối bị cắt dở (mất điện khi đang ghi)
+            self.chunks.append((payload_offset, length, n_frames, n_dets, t_first, t_last))
+            offset = payload_offset + length
+        self.frame_count = sum(chunk[2] for chunk in self.chunks)
+    
+    def __len__(self):
+        return self.frame_count
+    
+    def read_chunk(self, index):
+        """
+        Giải nén một chunk
+        
+        Returns:
+            tuple: (dict cột khung hình, dict cột vật thể)
+        """
+        payload_offset, length, n_frames, n_dets, _, _ = self.chunks[index]
+        (frame_len,) = _HEADER_LEN.unpack_from(self._mmap, payload_offset)
+        start = payload_offset + _HEADER_LEN.size
+        frames = _decode_columns(FRAME_COLUMNS, zlib.decompress(self._mmap[start:start + frame_len]), n_frames)
+        dets = _decode_columns(DET_COLUMNS, zlib.decompress(self._mmap[start + frame_len:payload_offset + length]),
+                               n_dets)
+        return frames, dets
+    
+    def read_arrays(self, start=None, end=None):
+        """
+        Đọc các cột của toàn bộ (hoặc một khoảng thời gian) file thành mảng numpy liền
+        
+        Args:
+            start: Thời điểm bắt đầu (giây), None nếu từ đầu
+            end: Thời điểm kết thúc (giây, không bao gồm), None nếu đến cuối
+        
+        Returns:
+            tuple: (dict cột khung hình, dict cột vật thể, mảng chỉ số vật thể đầu tiên của mỗi khung hình)
+        """
+        frame_parts = []
+        det_parts = []
+        for i, (_, _, _, _, t_first, t_last) in enumerate(self.chunks):
+            if (start is not None and t_last < start) or (end is not None and t_first >= end):
+                continue
+            frames, dets = self.read_chunk(i)
+            mask = np.ones(len(frames['timestamp']), dtype=bool)
+            if start is not None:
+                mask &= frames['timestamp'] >= start
+            if end is not None:
+                mask &= frames['timestamp'] < end
+            if not mask.all():
+                det_mask = np.repeat(mask, frames['n_dets'])
+                frames = {name: values[mask] for name, values in frames.items()}
+                dets = {name: values[det_mask] for name, values in dets.items()}
+            frame_parts.append(frames)
+            det_parts.append(dets)
+        
+        frames = self._concat(FRAME_COLUMNS, frame_parts)
+        dets = self._concat(DET_COLUMNS, det_parts)
+        det_start = np.concatenate(([0], np.cumsum(frames['n_dets'], dtype=np.int64)[:-1]))
+        return frames, dets, det_start
+    
+    @staticmethod
+    def _concat(columns, parts):
+        result = {}
+        for name, dtype, width in columns:
+            if parts:
+                result[name] = np.concatenate([part[name] for part in parts])
+            else:
+                result[name] = np.zeros((0, width) if width > 1 else (0,), dtype=dtype)
+        return result
+    
+    def iter_frames(self, start=None, end=None):
+        """
+        Duyệt từng khung hình dưới dạng dict
+        
+        Yields:
+            dict: Thông tin khung hình, 'detections' là danh sách vật thể thô (như DetectionModule.detect)
+                  kèm 'in_lane', 'distance', 'relative_velocity', 'ttc', 'risk_level', 'needs_alert'
+        """
+        for i, (_, _, _, _, t_first, t_last) in enumerate(self.chunks):
+            if (start is not None and t_last < start) or (end is not None and t_first >= end):
+                continue
+            frames, dets = self.read_chunk(i)
+            det_index = 0
+            for f in range(len(frames['timestamp'])):
+                n_dets = int(frames['n_dets'][f])
+                timestamp = float(frames['timestamp'][f])
+                if (start is not None and timestamp < start) or (end is not None and timestamp >= end):
+                    det_index += n_dets
+                    continue
+                yield self._frame_dict(frames, dets, f, det_index, n_dets)
+                det_index += n_dets
+    
+    def _frame_dict(self, frames, dets, f, det_index, n_dets):
+        detections = []
+        for d in range(det_index, det_index + n_dets):
+            x1, y1, x2, y2 = (int(v) for v in dets['bbox'][d])
+            class_index = int(dets['class_index'][d])
+            detections.append({
+                'class': self.classes[class_index] if class_index < len(self.classes) else 'unknown',
+                'class_id': int(dets['class_id'][d]),
+                'confidence': float(dets['confidence'][d]),
+                'bbox': (x1, y1, x2, y2),
+                'pixel_height': y2 - y1,
+                'pixel_width': x2 - x1,
+                'in_lane': bool(dets['in_lane'][d]),
+                'distance': self._none_if_nan(dets['distance'][d]),
+                'relative_velocity': self._none_if_nan(dets['relative_velocity'][d]),
+                'ttc': self._none_if_nan(dets['ttc'][d]),
+                'risk_level': self.risk_levels[int(dets['risk_level'][d])],
+                'needs_alert': bool(dets['needs_alert'][d])
+            })
+        
+        flags = int(frames['flags'][f])
+        return {
+            'timestamp': float(frames['timestamp'][f]),
+            'frame_seq': int(frames['frame_seq'][f]),
+            'width': int(frames['width'][f]),
+            'height': int(frames['height'][f]),
+            'should_alert': bool(flags & FLAG_SHOULD_ALERT),
+            'has_risk': bool(flags & FLAG_HAS_RISK),
+            'is_vehicle_stopped': bool(flags & FLAG_VEHICLE_STOPPED),
+            'alert_disabled': bool(flags & FLAG_ALERT_DISABLED),
+            'detections_reused': bool(flags & FLAG_DETECTIONS_REUSED),
+            'degradation_level': int(frames['degradation_level'][f]),
+            'ego_velocity': self._none_if_nan(frames['ego_velocity'][f]),
+            'closest_distance': self._none_if_nan(frames['closest_distance'][f]),
+            'closest_ttc': self._none_if_nan(frames['closest_ttc'][f]),
+            'stage_ms': {name: self._none_if_nan(value)
+                         for name, value in zip(self.stages, frames['stage_ms'][f])},
+            'detections': detections
+        }
+    
+    @staticmethod
+    def _none_if_nan(value):
+        value = float(value)
+        return None if value != value else value
+    
+    def close(self):
+        """Đóng mmap và file"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,323 @@
+"""
+Module dự đoán quỹ đạo vật thể phía trước với gia tốc tương đối không đổi (TTC nâng cao)
+
+Mỗi quỹ đạo giữ các mẫu (thời điểm, khoảng cách) gần nhất trong mảng numpy cố định.
+Mỗi khung hình, khoảng cách trong cửa sổ ETTC_WINDOW_S được khớp bình phương tối thiểu
+với r(τ) = r0 + ṙ·τ + ½·r̈·τ² cho tất cả quỹ đạo cùng lúc (nghiệm dạng đóng của hệ 3×3),
+rồi giải r + ṙ·t + ½·r̈·t² = 0 để được thời điểm va chạm khi vật thể phía trước phanh gấp
+(TTC = d / v bỏ qua gia tốc nên cảnh báo muộn với xe phía trước đang giảm tốc).
+"""
+
+import numpy as np
+from config.config import (
+    ETTC_WINDOW_S, ETTC_MIN_SAMPLES, ETTC_MIN_SPAN_S, ETTC_MAX_ACCEL, ETTC_HORIZON_S,
+    ETTC_MATCH_IOU, ETTC_MAX_TRACKS
+)
+
+
+_HISTORY_SAMPLES = 64  # Số mẫu tối đa mỗi quỹ đạo (đủ cho cửa sổ 1 giây ở 60 FPS)
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    IoU giữa hai tập bounding box
+    
+    Args:
+        boxes_a: Mảng (N, 4) các box (x1, y1, x2, y2)
+        boxes_b: Mảng (M, 4)
+    
+    Returns:
+        np.ndarray: Mảng (N, M)
+    """
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def fit_constant_acceleration(times, ranges, now, window_s=ETTC_WINDOW_S):
+    """
+    Khớp r(τ) = r0 + ṙ·τ + ½·r̈·τ² (τ = t - now) cho nhiều quỹ đạo cùng lúc
+    
+    Args:
+        times: Mảng (T, K) thời điểm các mẫu, NaN ở ô trống
+        ranges: Mảng (T, K) khoảng cách (mét)
+        now: Thời điểm hiện tại (giây)
+        window_s: Chỉ dùng các mẫu trong khoảng [now - window_s, now]
+    
+    Returns:
+        tuple: (r0, ṙ, r̈, số mẫu, khoảng thời gian trải ra), mỗi phần tử là mảng (T,);
+               r0/ṙ/r̈ là NaN khi hệ suy biến
+    """
+    tau = times - now
+    mask = np.isfinite(tau) & (tau >= -window_s) & (tau <= 1e-9)
+    w = mask.astype(np.float64)
+    tau = np.where(mask, tau, 0.0)
+    r = np.where(mask, ranges, 0.0)
+    
+    tau2 = tau * tau
+    s0 = w.sum(axis=1)
+    s1 = (w * tau).sum(axis=1)
+    s2 = (w * tau2).sum(axis=1)
+    s3 = (w * tau2 * tau).sum(axis=1)
+    s4 = (w * tau2 * tau2).sum(axis=1)
+    b0 = r.sum(axis=1)
+    b1 = (r * tau).sum(axis=1)
+    b2 = (r * tau2).sum(axis=1)
+    
+    # Nghịch đảo ma trận đối xứng [[s0, s1, s2], [s1, s2, s3], [s2, s3, s4]] theo phần bù đại số
+    c00 = s2 * s4 - s3 * s3
+    c01 = s2 * s3 - s1 * s4
+    c02 = s1 * s3 - s2 * s2
+    c11 = s0 * s4 - s2 * s2
+    c12 = s1 * s2 - s0 * s3
+    c22 = s0 * s2 - s1 * s1
+    det = s0 * c00 + s1 * c01 + s2 * c02
+    valid = np.abs(det) > 1e-12
+    inv_det = np.where(valid, 1.0 / np.where(valid, det, 1.0), np.nan)
+    
+    r0 = (c00 * b0 + c01 * b1 + c02 * b2) * inv_det
+    rate = (c01 * b0 + c11 * b1 + c12 * b2) * inv_det
+    accel = 2.0 * (c02 * b0 + c12 * b1 + c22 * b2) * inv_det
+    span = -np.where(mask, tau, 0.0).min(axis=1)
+    return r0, rate, accel, s0, span
+
+
+def constant_acceleration_ttc(distance, range_rate, range_accel, ego_velocity=None, horizon_s=ETTC_HORIZON_S):
+    """
+    Thời điểm khoảng cách về 0 với gia tốc tương đối không đổi (nghiệm dương nhỏ nhất)
+    
+    Args:
+        distance: Mảng khoảng cách hiện tại (mét)
+        range_rate: Mảng ṙ (m/s), âm khi đang tiến gần
+        range_accel: Mảng r̈ (m/s²), âm khi khoảng cách giảm ngày càng nhanh
+        ego_velocity: Vận tốc xe (m/s) nếu có: vật thể phía trước đang phanh được coi là dừng hẳn
+                      thay vì lùi lại, vật thể có vận tốc tuyệt đối ≤ 0 được coi là đứng yên
+        horizon_s: Nghiệm lớn hơn ngưỡng này coi như không va chạm
+    
+    Returns:
+        np.ndarray: TTC (giây), inf nếu không va chạm trong horizon_s
+    """
+    r = np.asarray(distance, dtype=np.float64)
+    v = np.asarray(range_rate, dtype=np.float64)
+    a = np.asarray(range_accel, dtype=np.float64)
+    
+    # r + v·t + ½·a·t² = 0 ⇒ t = 2r / (-v + √(v² - 2ar)), dạng ổn định số của (-v - √D) / a
+    disc = v * v - 2.0 * a * r
+    root = np.sqrt(np.maximum(disc, 0.0))
+    den = -v + root
+    hit = (disc >= 0) & (den > 1e-9)
+    ttc = np.where(hit, 2.0 * r / np.where(hit, den, 1.0), np.inf)
+    
+    if ego_velocity is not None and ego_velocity > 0:
+        # Vận tốc vật thể phía trước (xe mình giữ vận tốc): v_L = v_xe + ṙ, gia tốc = r̈
+        lead_velocity = ego_velocity + v
+        stationary = lead_velocity <= 0
+        braking = ~stationary & (a < 0)
+        t_stop = np.where(braking, lead_velocity / np.where(braking, -a, 1.0), 0.0)
+        # Va chạm sau khi vật thể đã dừng: phần khoảng cách còn lại được rút ngắn với vận tốc xe
+        after_stop = braking & (ttc > t_stop)
+        r_stop = r + v * t_stop + 0.5 * a * t_stop * t_stop
+        ttc = np.where(after_stop, t_stop + r_stop / ego_velocity, ttc)
+        ttc = np.where(stationary, r / ego_velocity, ttc)
+    
+    ttc = np.where(r <= 0, 0.0, ttc)
+    return np.where(ttc > horizon_s, np.inf, ttc)
+
+
+class BoxTracker:
+    """Nối vật thể giữa các khung hình theo IoU và gán track id ổn định (không đổi khi box lớn dần, dịch chuyển)"""
+    
+    def __init__(self, match_iou=ETTC_MATCH_IOU, max_age_s=ETTC_WINDOW_S, max_tracks=ETTC_MAX_TRACKS):
+        """
+        Args:
+            match_iou: IoU tối thiểu để nối vật thể với quỹ đạo cũ
+            max_age_s: Quỹ đạo không xuất hiện quá số giây này bị bỏ
+            max_tracks: Số quỹ đạo tối đa
+        """
+        self.match_iou = match_iou
+        self.max_age_s = max_age_s
+        self.max_tracks = max_tracks
+        
+        self.track_ids = np.zeros(max_tracks, dtype=np.int64)  # Track id của từng ô
+        self._boxes = np.zeros((max_tracks, 4))
+        self._classes = [None] * max_tracks
+        self._last_seen = np.full(max_tracks, -np.inf)
+        self._active = np.zeros(max_tracks, dtype=bool)
+        self._next_id = 1
+    
+    def reset(self):
+        """Xóa mọi quỹ đạo (track id tiếp tục tăng, không dùng lại id cũ)"""
+        self._last_seen.fill(-np.inf)
+        self._active.fill(False)
+        self._classes = [None] * self.max_tracks
+    
+    def update(self, detections, timestamp):
+        """
+        Nối các vật thể của khung hình hiện tại với các quỹ đạo
+        
+        Args:
+            detections: Danh sách vật thể có 'bbox', 'class'
+            timestamp: Thời điểm khung hình (giây)
+        
+        Returns:
+            list: Ô quỹ đạo của từng vật thể theo thứ tự detections, None nếu vượt max_tracks
+                  (track id là track_ids[ô])
+        """
+        n = len(detections)
+        if n > self.max_tracks:
+            # Quá nhiều vật thể: chỉ theo dõi max_tracks vật thể đầu
+            return self.update(detections[:self.max_tracks], timestamp) + [None] * (n - self.max_tracks)
+        
+        # Bỏ quỹ đạo lâu không xuất hiện
+        self._active &= timestamp - self._last_seen <= self.max_age_s
+        if n == 0:
+            return []
+        
+        boxes = np.array([det['bbox'] for det in detections], dtype=np.float64).reshape(n, 4)
+        slots = self._associate(detections, boxes)
+        for i, slot in enumerate(slots):
+            self._boxes[slot] = boxes[i]
+            self._classes[slot] = detections[i].get('class')
+            self._last_seen[slot] = timestamp
+            self._active[slot] = True
+        return slots
+    
+    def active_track_ids(self):
+        """Track id của các quỹ đạo đang theo dõi"""
+        return {int(track_id) for track_id in self.track_ids[self._active]}
+    
+    def _associate(self, detections, boxes):
+        """
+        Nối vật thể với quỹ đạo cùng loại có IoU lớn nhất (tham lam), vật thể còn lại mở quỹ đạo mới
+        
+        Quỹ đạo được nối theo thứ tự mới xuất hiện gần nhất trước: một vật thể lỡ nối (mở quỹ đạo
+        mới) không bị nối xen kẽ giữa quỹ đạo cũ và quỹ đạo mới ở các khung hình sau.
+        """
+        n = len(detections)
+        slots = [None] * n
+        active = np.flatnonzero(self._active)
+        if len(active):
+            iou = iou_matrix(boxes, self._boxes[active])
+            classes = np.array([det.get('class') for det in detections], dtype=object)
+            track_classes = np.array([self._classes[slot] for slot in active], dtype=object)
+            iou[classes[:, None] != track_classes[None, :]] = 0.0
+            last_seen = self._last_seen[active]
+            for seen in np.unique(last_seen)[::-1]:
+                candidates = np.where((last_seen == seen)[None, :], iou, -1.0)
+                while True:
+                    i, j = np.unravel_index(np.argmax(candidates), candidates.shape)
+                    if candidates[i, j] < self.match_iou:
+                        break
+                    slots[i] = int(active[j])
+                    candidates[i, :] = -1.0
+                    candidates[:, j] = -1.0
+                    iou[i, :] = -1.0
+                    iou[:, j] = -1.0
+        
+        for i in range(n):
+            if slots[i] is None:
+                slots[i] = self._new_track(slots)
+        return slots
+    
+    def _new_track(self, taken):
+        """Lấy một ô trống (hoặc ô của quỹ đạo lâu nhất không xuất hiện) với track id mới"""
+        free = np.flatnonzero(~self._active)
+        free = [slot for slot in free if slot not in taken]
+        if free:
+            slot = int(free[0])
+        else:
+            order = np.argsort(self._last_seen)
+            slot = int(next(s for s in order if s not in taken))
+        self.track_ids[slot] = self._next_id
+        self._next_id += 1
+        self._active[slot] = True  # Giữ ô cho đến khi được cập nhật ở update()
+        return slot
+
+
+class TrajectoryPredictor:
+    """Theo dõi khoảng cách từng vật thể qua các khung hình và tính TTC gia tốc không đổi"""
+    
+    def __init__(self, window_s=ETTC_WINDOW_S, min_samples=ETTC_MIN_SAMPLES, min_span_s=ETTC_MIN_SPAN_S,
+                 max_accel=ETTC_MAX_ACCEL, horizon_s=ETTC_HORIZON_S, match_iou=ETTC_MATCH_IOU,
+                 max_tracks=ETTC_MAX_TRACKS):
+        """
+        Args:
+            window_s: Cửa sổ thời gian khớp (giây)
+            min_samples: Số mẫu tối thiểu trong cửa sổ
+            min_span_s: Khoảng thời gian tối thiểu các mẫu trải ra (giây)
+            max_accel: Giới hạn độ lớn gia tốc tương đối (m/s²)
+            horizon_s: TTC lớn hơn ngưỡng này coi như không va chạm
+            match_iou: IoU tối thiểu để nối vật thể với quỹ đạo cũ
+            max_tracks: Số quỹ đạo tối đa
+        """
+        self.window_s = window_s
+        self.min_samples = min_samples
+        self.min_span_s = min_span_s
+        self.max_accel = max_accel
+        self.horizon_s = horizon_s
+        self.tracker = BoxTracker(match_iou, window_s, max_tracks)
+        
+        self._times = np.full((max_tracks, _HISTORY_SAMPLES), np.nan)
+        self._ranges = np.zeros((max_tracks, _HISTORY_SAMPLES))
+        self._write_index = np.zeros(max_tracks, dtype=np.int64)
+        self._slot_ids = np.zeros(max_tracks, dtype=np.int64)  # Track id ứng với lịch sử đang giữ ở từng ô
+    
+    def reset(self):
+        """Xóa mọi quỹ đạo"""
+        self.tracker.reset()
+        self._times.fill(np.nan)
+        self._write_index.fill(0)
+        self._slot_ids.fill(0)
+    
+    def update(self, detections, timestamp, ego_velocity=None):
+        """
+        Nối vật thể với quỹ đạo, thêm khoảng cách của khung hình hiện tại và dự đoán TTC
+        
+        Args:
+            detections: Danh sách vật thể có 'bbox', 'class', 'distance' (không None)
+            timestamp: Thời điểm khung hình (giây)
+            ego_velocity: Vận tốc xe (m/s) hoặc None
+        
+        Returns:
+            tuple: Track id (list, None nếu không theo dõi được) và các mảng (N,) theo thứ tự detections:
+                   ṙ (m/s), r̈ (m/s²) và TTC (giây); NaN khi quỹ đạo chưa đủ dữ liệu, TTC = inf khi không va chạm
+        """
+        n = len(detections)
+        slots = self.tracker.update(detections, timestamp)
+        track_ids = [int(self.tracker.track_ids[slot]) if slot is not None else None for slot in slots]
+        rate, accel, ttc = (np.full(n, np.nan) for _ in range(3))
+        tracked = np.array([i for i, slot in enumerate(slots) if slot is not None], dtype=np.int64)
+        if len(tracked) == 0:
+            return track_ids, rate, accel, ttc
+        
+        for i in tracked:
+            slot = slots[i]
+            if self._slot_ids[slot] != track_ids[i]:
+                # Ô được dùng cho quỹ đạo mới: bỏ lịch sử của quỹ đạo cũ
+                self._slot_ids[slot] = track_ids[i]
+                self._times[slot].fill(np.nan)
+                self._write_index[slot] = 0
+            index = self._write_index[slot] % _HISTORY_SAMPLES
+            self._times[slot, index] = timestamp
+            self._ranges[slot, index] = detections[i]['distance']
+            self._write_index[slot] += 1
+        
+        tracked_slots = np.array([slots[i] for i in tracked], dtype=np.int64)
+        _, fit_rate, fit_accel, count, span = fit_constant_acceleration(
+            self._times[tracked_slots], self._ranges[tracked_slots], timestamp, self.window_s
+        )
+        valid = (count >= self.min_samples) & (span >= self.min_span_s) & np.isfinite(fit_rate)
+        fit_accel = np.clip(fit_accel, -self.max_accel, self.max_accel)
+        distance = np.array([detections[i]['distance'] for i in tracked], dtype=np.float64)
+        fit_ttc = constant_acceleration_ttc(distance, np.where(valid, fit_rate, 0.0),
+                                            np.where(valid, fit_accel, 0.0), ego_velocity, self.horizon_s)
+        rate[tracked] = np.where(valid, fit_rate, np.nan)
+        accel[tracked] = np.where(valid, fit_accel, np.nan)
+        ttc[tracked] = np.where(valid, fit_ttc, np.nan)
+        return track_ids, rate, accel, ttc
@@ -2,25 +2,32 @@
 Module tính toán Time-to-Collision (TTC) và khoảng cách dừng an toàn
 """
 
+import math
 import numpy as np
 from collections import deque
+from modules.trajectory_module import TrajectoryPredictor
+from config.config import ENABLE_ENHANCED_TTC
 
 
 class TTCModule:
     """Module tính toán TTC và khoảng cách dừng an toàn"""
     
-    def __init__(self, reaction_time=1.2, deceleration=6.0):
+    def __init__(self, reaction_time=1.2, deceleration=6.0, enhanced=ENABLE_ENHANCED_TTC):
         """
         Khởi tạo TTC module
         
         Args:
             reaction_time: Thời gian phản ứng của tài xế (giây), mặc định 1.2s
             deceleration: Gia tốc hãm (m/s²), mặc định 6.0 m/s² (~0.6g)
+            enhanced: Dùng TTC gia tốc không đổi (TrajectoryPredictor) khi quỹ đạo đủ dữ liệu
+                      (track id luôn lấy từ TrajectoryPredictor)
         """
         self.reaction_time = reaction_time
         self.deceleration = deceleration
         self.distance_history = {}  # Lưu lịch sử khoảng cách để tính vận tốc
         self.history_size = 5
+        self.enhanced = enhanced
+        self.predictor = TrajectoryPredictor()  # Nối vật thể giữa các khung hình (track id ổn định) và TTC gia tốc
     
     def calculate_stopping_distance(self, velocity_ms):
         """
@@ -94,7 +101,7 @@ class TTCModule:
         ttc = distance / relative_velocity
         return ttc
     
-    def assess_risk_with_ttc(self, distance, relative_velocity, current_velocity_ms=None):
+    def assess_risk_with_ttc(self, distance, relative_velocity, current_velocity_ms=None, predicted_ttc=None):
         """
         Đánh giá mức độ nguy hiểm kết hợp khoảng cách và TTC
         
@@ -102,6 +109,8 @@ class TTCModule:
             distance: Khoảng cách hiện tại (mét)
             relative_velocity: Vận tốc tương đối (m/s), dương nếu đang tiến gần
             current_velocity_ms: Vận tốc hiện tại của xe (m/s), nếu có
+            predicted_ttc: TTC gia tốc không đổi (giây, inf nếu không va chạm) thay cho
+                           khoảng cách / vận tốc, None để tính theo vận tốc tương đối
             
         Returns:
             dict: Thông tin đánh giá rủi ro với keys:
@@ -111,24 +120,11 @@ class TTCModule:
                  - 'ttc': Time-to-Collision (giây)
                  - 'stopping_distance': Khoảng cách dừng cần thiết (mét)
         """
-        """
-        Đánh giá mức độ nguy hiểm kết hợp khoảng cách và TTC
-        
-        Args:
-            distance: Khoảng cách hiện tại (mét)
-            relative_velocity: Vận tốc tương đối (m/s)
-            current_velocity_ms: Vận tốc hiện tại của xe (m/s), nếu có
-            
-        Returns:
-            dict: Thông tin đánh giá rủi ro với keys:
-                 - 'level': 'safe', 'caution', 'warning', 'danger'
-                 - 'color': Màu sắc cảnh báo (BGR)
-                 - 'needs_alert': Có cần cảnh báo không
-                 - 'ttc': Time-to-Collision (giây)
-                 - 'stopping_distance': Khoảng cách dừng cần thiết (mét)
-        """
-        # Tính TTC
-        ttc = self.calculate_ttc(distance, relative_velocity)
+        # Tính TTC (ưu tiên TTC dự đoán theo gia tốc nếu có)
+        if predicted_ttc is None:
+            ttc = self.calculate_ttc(distance, relative_velocity)
+        else:
+            ttc = None if math.isinf(predicted_ttc) else predicted_ttc
         
         # Tính khoảng cách dừng nếu có vận tốc
         stopping_distance = None
@@ -139,6 +135,10 @@ class TTCModule:
         # Nếu vận tốc tương đối thấp và khoảng cách xa, không nên báo nguy hiểm
         is_slow_approach = relative_velocity < 1.0  # Vận tốc tương đối < 1 m/s
         
+        # Vật thể đang tiến gần nằm trong khoảng cách dừng của xe: không kịp dừng nếu vật thể phanh gấp
+        within_stopping = (stopping_distance is not None and distance <= stopping_distance and
+                           not is_slow_approach)
+        
         if ttc is not None:
             # Ưu tiên TTC nếu có
             # Nếu TTC thấp VÀ vận tốc đáng kể → nguy hiểm
@@ -161,7 +161,8 @@ class TTCModule:
                     'ttc': ttc,
                     'stopping_distance': stopping_distance
                 }
-            elif ttc <= 4.0 and not is_slow_approach:  # 2-4 giây và không phải tiếp cận chậm
+            elif (ttc <= 4.0 and not is_slow_approach) or within_stopping:
+                # 2-4 giây và không phải tiếp cận chậm, hoặc vẫn trong khoảng cách dừng
                 return {
                     'level': 'warning',
                     'color': (0, 255, 255),  # Vàng
@@ -209,7 +210,8 @@ class TTCModule:
                 'ttc': ttc,
                 'stopping_distance': stopping_distance
             }
-        elif distance <= 15.0 and not is_slow_approach:  # Trung bình và không chạy chậm
+        elif (distance <= 15.0 and not is_slow_approach) or within_stopping:
+            # Trung bình và không chạy chậm, hoặc xa hơn 15m nhưng vẫn trong khoảng cách dừng
             return {
                 'level': 'warning',
                 'color': (0, 255, 255),  # Vàng
@@ -250,45 +252,53 @@ class TTCModule:
             list: Danh sách vật thể đã được đánh giá với TTC
         """
         processed = []
+        tracked = [d for d in detections if d.get('distance') is not None]
+        
+        # Track id và TTC gia tốc không đổi của mọi vật thể, tính vectơ hóa một lần cho cả khung hình
+        track_ids, _, range_accel, predicted = self.predictor.update(tracked, current_time, current_velocity_ms)
         
-        for detection in detections:
-            distance = detection.get('distance')
-            if distance is None:
-                continue
+        for index, detection in enumerate(tracked):
+            distance = detection['distance']
+            predicted_ttc = None
+            if self.enhanced and not np.isnan(predicted[index]):
+                predicted_ttc = float(predicted[index])
             
-            # Tạo ID cho vật thể
-            bbox = detection.get('bbox', (0, 0, 0, 0))
-            center_x = (bbox[0] + bbox[2]) / 2
-            center_y = (bbox[1] + bbox[3]) / 2
-            object_id = f"{detection.get('class', 'unknown')}_{int(center_x//50)}_{int(center_y//50)}"
+            # ID của vật thể: track id ổn định (giữ nguyên khi box lớn dần, dịch chuyển),
+            # vượt số quỹ đạo tối đa thì không theo dõi được
+            object_id = track_ids[index]
             
             # Ước lượng vận tốc tương đối
-            relative_velocity = self.estimate_relative_velocity(object_id, distance, current_time)
+            relative_velocity = 0.0
+            if object_id is not None:
+                relative_velocity = self.estimate_relative_velocity(object_id, distance, current_time)
             
             # Đánh giá rủi ro với TTC
             risk_assessment = self.assess_risk_with_ttc(
                 distance, 
                 relative_velocity, 
-                current_velocity_ms
+                current_velocity_ms,
+                predicted_ttc
             )
             
             processed_detection = {
                 **detection,
+                'track_id': object_id,
                 'relative_velocity': relative_velocity,
                 'risk': risk_assessment
             }
+            if predicted_ttc is not None:
+                processed_detection['range_accel'] = float(range_accel[index])
             
             processed.append(processed_detection)
         
         # Xóa lịch sử của các vật thể không còn xuất hiện
-        active_ids = {f"{d.get('class', 'unknown')}_{int((d.get('bbox', (0,0,0,0))[0] + d.get('bbox', (0,0,0,0))[2])//50)}_{int((d.get('bbox', (0,0,0,0))[1] + d.get('bbox', (0,0,0,0))[3])//50)}" 
-                     for d in detections}
-        self.distance_history = {k: v for k, v in self.distance_history.items() 
-                               if any(k.startswith(aid.split('_')[0]) for aid in active_ids)}
+        active_ids = self.predictor.tracker.active_track_ids()
+        self.distance_history = {k: v for k, v in self.distance_history.items() if k in active_ids}
         
         return processed
     
     def clear_history(self):
         """Xóa lịch sử khoảng cách"""
         self.distance_history.clear()
+        self.predictor.reset()
 
@@ -0,0 +1,76 @@
+"""
+Quét lưới tham số cảnh báo trên các chuyến đi đã ghi telemetry
+
+Ví dụ:
+    python sweep.py logs/telemetry/*.tlm --param ttc_danger=1.5:3.0:0.25 --param consecutive_risk=2,3,4,5
+    python sweep.py drive1.tlm drive2.tlm --grid grid.json --labels labels.json --output sweep.csv
+"""
+
+import argparse
+import json
+import sys
+import os
+
+# Thêm đường dẫn vào sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.sweep_module import ParameterSweep, SWEEP_PARAMS, load_labels, parse_param_values
+from config.config import SWEEP_EVENT_TOLERANCE_S
+
+
+def parse_args(argv=None):
+    """Đọc tham số dòng lệnh"""
+    parser = argparse.ArgumentParser(
+        description="ITS - Quét tham số cảnh báo trên telemetry đã ghi"
+    )
+    parser.add_argument('telemetry', nargs='+',
+                        help="Các file telemetry (mỗi file một chuyến đi)")
+    parser.add_argument('--param', action='append', default=[], metavar='TÊN=GIÁ_TRỊ',
+                        help="Giá trị quét của một tham số: 'a,b,c' hoặc 'bắt_đầu:kết_thúc:bước'. "
+                             f"Hỗ trợ: {', '.join(SWEEP_PARAMS)}")
+    parser.add_argument('--grid', default=None,
+                        help="File JSON {tên tham số: [giá trị, ...]}")
+    parser.add_argument('--labels', default=None,
+                        help="File JSON sự kiện nguy hiểm đã gán nhãn theo chuyến đi")
+    parser.add_argument('--tolerance', type=float, default=SWEEP_EVENT_TOLERANCE_S,
+                        help="Dung sai quanh sự kiện khi tính báo sai (giây)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Số tiến trình (mặc định: số lõi CPU)")
+    parser.add_argument('--output', default=None,
+                        help="File kết quả (.csv hoặc .json)")
+    parser.add_argument('--top', type=int, default=10,
+                        help="Số tổ hợp tốt nhất in ra màn hình")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Điểm vào dòng lệnh"""
+    args = parse_args(argv)
+    grid = {}
+    if args.grid:
+        with open(args.grid, 'r', encoding='utf-8') as f:
+            grid.update(json.load(f))
+    try:
+        for item in args.param:
+            name, _, values = item.partition('=')
+            grid[name.strip()] = parse_param_values(name.strip(), values)
+        labels = load_labels(args.labels) if args.labels else None
+        sweep = ParameterSweep(args.telemetry, grid, labels=labels, workers=args.workers,
+                               tolerance=args.tolerance)
+    except (OSError, ValueError) as e:
+        print(f"Lỗi tham số quét: {e}", file=sys.stderr)
+        return 1
+    
+    results = sweep.run()
+    if args.output:
+        if args.output.lower().endswith('.csv'):
+            sweep.export_csv(args.output)
+        else:
+            sweep.export_json(args.output)
+    
+    print(json.dumps({'stats': sweep.stats, 'top': results[:args.top]}, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
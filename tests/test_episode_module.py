@@ -0,0 +1,40 @@
+"""
+Kiểm tra gộp sự kiện cảnh báo theo track id ổn định
+"""
+
+from modules.episode_module import EpisodeAggregator
+from modules.ttc_module import TTCModule
+
+
+def approaching_box(t, fps=30.0):
+    """Xe phía trước tiến gần đều: box lớn dần và trôi sang phải, tâm đi qua nhiều ô 50 px"""
+    distance = 14.0 - 4.0 * t  # 14 m → 4 m, tiến gần 4 m/s
+    height = 900 * 1.5 / distance
+    cx = 600 + 60 * t
+    bottom = 400 + 0.3 * height
+    return {
+        'class': 'car',
+        'confidence': 0.9,
+        'bbox': (int(cx - height), int(bottom - height), int(cx + height), int(bottom)),
+        'distance': distance
+    }
+
+
+def test_approaching_box_yields_one_episode():
+    ttc = TTCModule()
+    closed = []
+    episodes = EpisodeAggregator(on_close=closed.append)
+    fps = 30.0
+    centers = set()
+    for k in range(int(2.5 * fps)):
+        t = k / fps
+        detections = ttc.process_detections_with_ttc([approaching_box(t)], t)
+        det = detections[0]
+        x1, y1, x2, y2 = det['bbox']
+        centers.add((int((x1 + x2) / 2 // 50), int((y1 + y2) / 2 // 50)))
+        episodes.update(detections, t)
+    episodes.close_all()
+    
+    assert len(centers) > 1  # Tâm box đi qua nhiều ô: track id theo ô sẽ tách sự kiện
+    assert len(closed) == 1
+    assert closed[0]['frames'] > 0
@@ -0,0 +1,49 @@
+"""
+Kiểm tra luật vectơ hóa của sweep khớp với TTCModule và DecisionStage
+"""
+
+import numpy as np
+from modules.stages_module import DecisionStage
+from modules.sweep_module import RULE_PARAMS, real_risk_mask
+from modules.ttc_module import TTCModule
+
+
+def random_objects(n, seed=0):
+    """Bộ (khoảng cách, vận tốc tương đối, TTC, vận tốc xe) ngẫu nhiên, float32 như telemetry"""
+    rng = np.random.default_rng(seed)
+    distance = rng.uniform(0.5, 40.0, n).astype(np.float32)
+    relative_velocity = rng.uniform(-3.0, 12.0, n).astype(np.float32)
+    ttc = rng.uniform(0.0, 12.0, n).astype(np.float32)
+    ttc[rng.random(n) < 0.2] = np.inf  # Không va chạm
+    ego_velocity = rng.uniform(0.0, 30.0, n).astype(np.float32)
+    ego_velocity[rng.random(n) < 0.3] = np.nan  # Không có cảm biến vận tốc
+    return distance, relative_velocity, ttc, ego_velocity
+
+
+def test_real_risk_mask_matches_pipeline():
+    distance, relative_velocity, ttc, ego_velocity = random_objects(20000)
+    ttc_module = TTCModule()
+    decision = DecisionStage(distance=None)
+    
+    # Đường chạy thật: assess_risk_with_ttc (needs_alert) rồi DecisionStage.is_real_risk
+    expected = np.zeros(len(distance), dtype=bool)
+    recorded_ttc = np.full(len(distance), np.nan, dtype=np.float32)
+    for i in range(len(distance)):
+        ego = None if np.isnan(ego_velocity[i]) else float(ego_velocity[i])
+        risk = ttc_module.assess_risk_with_ttc(float(distance[i]), float(relative_velocity[i]),
+                                               ego, predicted_ttc=float(ttc[i]))
+        if risk['ttc'] is not None:
+            recorded_ttc[i] = risk['ttc']
+        det = {'risk': risk, 'relative_velocity': float(relative_velocity[i]), 'distance': float(distance[i])}
+        expected[i] = decision.is_real_risk(det)
+    
+    # Sweep dùng TTC đã ghi trong telemetry (NaN nếu không có)
+    params = {name: np.array([[value]], dtype=np.float32) for name, value in RULE_PARAMS.items()}
+    mask = real_risk_mask(distance, relative_velocity, recorded_ttc, params, ego_velocity)[0]
+    
+    assert expected.any() and not expected.all()
+    mismatched = np.flatnonzero(mask != expected)
+    assert len(mismatched) == 0, [
+        (float(distance[i]), float(relative_velocity[i]), float(ttc[i]), float(ego_velocity[i]))
+        for i in mismatched[:5]
+    ]